@@ -0,0 +1,377 @@
+"""Backups of the Neo4j graph: gzipped NDJSON snapshots plus the change log of app/db/changelog.py.
+
+A snapshot records the change log position it started at; restoring loads it into an empty
+database and replays the writes logged after that. Snapshots are not point-in-time (reads
+are read-committed), so some replayed writes are already in them: those are idempotent or
+rejected by the uniqueness constraints and skipped.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from neo4j import AsyncDriver
+from neo4j.exceptions import ConstraintError
+from app.db.changelog import ChangeLog, create_change_log
+from app.db.migrations import apply_migrations
+from app.utils.neo4j import create_driver, execute_read, execute_write
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "listen-snapshot"
+SNAPSHOT_VERSION = 1
+# Nodes or relationships per UNWIND batch of a restore, and batches running at the same time
+RESTORE_BATCH_SIZE = 10000
+RESTORE_CONCURRENCY = 4
+# Lines buffered before they are written to (or after they are read from) a snapshot file in a thread
+SNAPSHOT_CHUNK_SIZE = 1000
+# Changes read from the log per page while replaying
+REPLAY_PAGE_SIZE = 500
+
+# Temporary label and property that connect the relationships of a snapshot to the restored nodes
+RESTORE_LABEL = "_Restore"
+RESTORE_ID = "_restore_id"
+RESTORE_INDEX = "restore_id"
+
+
+def quote(name: str) -> str:
+    """A label or relationship type as a Cypher identifier."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def snapshot_path(directory: str, position: int) -> str:
+    return os.path.join(directory, f"snapshot-{position:012d}-{int(time.time())}.ndjson.gz")
+
+
+def list_snapshots(directory: str) -> List[Tuple[int, str]]:
+    """The (change log position, path) of the snapshots in directory, oldest first."""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "snapshot-*.ndjson.gz")):
+        try:
+            snapshots.append((int(os.path.basename(path).split("-")[1]), path))
+        except (IndexError, ValueError):
+            continue
+    return sorted(snapshots)
+
+
+def _write_lines(snapshot_file, lines: List[dict]):
+    snapshot_file.write("".join(json.dumps(line) + "\n" for line in lines))
+
+
+def _read_lines(snapshot_file, count: int) -> List[dict]:
+    lines = []
+    for line in snapshot_file:
+        lines.append(json.loads(line))
+        if len(lines) == count:
+            break
+    return lines
+
+
+async def write_snapshot(driver: AsyncDriver, directory: str, position: int) -> Dict[str, int]:
+    """Stream every node and relationship of the graph into a new snapshot taken at change log position.
+
+    The file is written under a temporary name and renamed when complete, so an interrupted
+    snapshot never replaces a good one. The (:SchemaVersion) node is left out; a restore
+    applies the migrations instead.
+    """
+    path = snapshot_path(directory, position)
+    temporary_path = path + ".tmp"
+    counts = {"nodes": 0, "relationships": 0}
+    snapshot_file = await asyncio.to_thread(gzip.open, temporary_path, "wt", encoding="utf-8")
+    try:
+        lines = [{"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "position": position, "created_at": time.time()}]
+        async with driver.session() as session:
+            result = await session.run("""
+                MATCH (n) WHERE NOT n:SchemaVersion
+                RETURN elementId(n) AS id, labels(n) AS labels, properties(n) AS properties
+            """)
+            async for record in result:
+                lines.append({"node": [record["id"], record["labels"], record["properties"]]})
+                counts["nodes"] += 1
+                if len(lines) >= SNAPSHOT_CHUNK_SIZE:
+                    await asyncio.to_thread(_write_lines, snapshot_file, lines)
+                    lines = []
+            result = await session.run("""
+                MATCH (a)-[r]->(b) WHERE NOT a:SchemaVersion AND NOT b:SchemaVersion
+                RETURN type(r) AS type, elementId(a) AS start, elementId(b) AS end, properties(r) AS properties
+            """)
+            async for record in result:
+                lines.append({"relationship": [record["type"], record["start"], record["end"], record["properties"]]})
+                counts["relationships"] += 1
+                if len(lines) >= SNAPSHOT_CHUNK_SIZE:
+                    await asyncio.to_thread(_write_lines, snapshot_file, lines)
+                    lines = []
+        await asyncio.to_thread(_write_lines, snapshot_file, lines)
+    finally:
+        await asyncio.to_thread(snapshot_file.close)
+    os.replace(temporary_path, path)
+    logger.info("Wrote snapshot %s with %d nodes and %d relationships", path, counts["nodes"], counts["relationships"])
+    return counts
+
+
+def prune_snapshots(directory: str, keep: int, change_log: Optional[ChangeLog] = None) -> int:
+    """Delete all but the newest keep snapshots and the logged changes the oldest kept one contains."""
+    snapshots = list_snapshots(directory)
+    removed = snapshots[:-keep] if keep > 0 else []
+    for _, path in removed:
+        os.remove(path)
+    if change_log is not None and removed:
+        change_log.truncate(snapshots[-keep][0])
+    return len(removed)
+
+
+class BatchRunner:
+    """Runs UNWIND batches in their own write transactions, at most concurrency at a time."""
+
+    def __init__(self, driver: AsyncDriver, concurrency: int):
+        self.driver = driver
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: List[asyncio.Task] = []
+
+    async def submit(self, cypher: str, rows: List[dict]):
+        # Waits for a free slot, so the file is not read faster than the batches are written
+        await self._slots.acquire()
+        self._tasks.append(asyncio.create_task(self._run(cypher, rows)))
+
+    async def _run(self, cypher: str, rows: List[dict]):
+        async def work(tx):
+            await (await tx.run(cypher, rows=rows)).consume()
+
+        try:
+            await execute_write(self.driver, work)
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """Wait for the submitted batches; raises the first error of any of them."""
+        tasks, self._tasks = self._tasks, []
+        await asyncio.gather(*tasks)
+
+
+def create_nodes_cypher(labels: Tuple[str, ...]) -> str:
+    return f"""
+        UNWIND $rows AS row
+        CREATE (n:{":".join(quote(label) for label in (RESTORE_LABEL, *labels))} {{{RESTORE_ID}: row.id}})
+        SET n += row.properties
+    """
+
+
+def create_relationships_cypher(relationship_type: str) -> str:
+    return f"""
+        UNWIND $rows AS row
+        MATCH (a:{RESTORE_LABEL} {{{RESTORE_ID}: row.start}})
+        MATCH (b:{RESTORE_LABEL} {{{RESTORE_ID}: row.end}})
+        CREATE (a)-[r:{quote(relationship_type)}]->(b)
+        SET r = row.properties
+    """
+
+
+async def is_graph_empty(driver: AsyncDriver) -> bool:
+    async def work(tx):
+        result = await tx.run("MATCH (n) WHERE NOT n:SchemaVersion RETURN count(n) = 0 AS empty")
+        return (await result.single())["empty"]
+
+    return await execute_read(driver, work)
+
+
+async def load_snapshot(driver: AsyncDriver, path: str, batch_size: int = RESTORE_BATCH_SIZE, concurrency: int = RESTORE_CONCURRENCY) -> Dict[str, int]:
+    """Create the nodes and relationships of a snapshot in an empty database. Returns the counts and the snapshot position."""
+    counts = {"nodes": 0, "relationships": 0}
+    snapshot_file = await asyncio.to_thread(gzip.open, path, "rt", encoding="utf-8")
+    try:
+        header = (await asyncio.to_thread(_read_lines, snapshot_file, 1) or [{}])[0]
+        if header.get("format") != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a snapshot of version {SNAPSHOT_VERSION}")
+
+        async with driver.session() as session:
+            await (await session.run(f"CREATE INDEX {RESTORE_INDEX} IF NOT EXISTS FOR (n:{RESTORE_LABEL}) ON (n.{RESTORE_ID})")).consume()
+            await (await session.run("CALL db.awaitIndex($index_name)", index_name=RESTORE_INDEX)).consume()
+
+        runner = BatchRunner(driver, concurrency)
+        nodes, relationships = defaultdict(list), defaultdict(list)
+        nodes_done = False
+        while lines := await asyncio.to_thread(_read_lines, snapshot_file, SNAPSHOT_CHUNK_SIZE):
+            for line in lines:
+                if "node" in line:
+                    node_id, labels, properties = line["node"]
+                    labels = tuple(sorted(labels))
+                    nodes[labels].append({"id": node_id, "properties": properties})
+                    if len(nodes[labels]) >= batch_size:
+                        await runner.submit(create_nodes_cypher(labels), nodes.pop(labels))
+                    counts["nodes"] += 1
+                    continue
+                if not nodes_done:
+                    # Snapshots list all nodes before the relationships, which need them to exist
+                    for labels, rows in nodes.items():
+                        await runner.submit(create_nodes_cypher(labels), rows)
+                    await runner.drain()
+                    nodes.clear()
+                    nodes_done = True
+                relationship_type, start, end, properties = line["relationship"]
+                relationships[relationship_type].append({"start": start, "end": end, "properties": properties})
+                if len(relationships[relationship_type]) >= batch_size:
+                    await runner.submit(create_relationships_cypher(relationship_type), relationships.pop(relationship_type))
+                counts["relationships"] += 1
+        for labels, rows in nodes.items():
+            await runner.submit(create_nodes_cypher(labels), rows)
+        await runner.drain()
+        for relationship_type, rows in relationships.items():
+            await runner.submit(create_relationships_cypher(relationship_type), rows)
+        await runner.drain()
+    finally:
+        await asyncio.to_thread(snapshot_file.close)
+
+    async with driver.session() as session:
+        await (await session.run(f"""
+            MATCH (n:{RESTORE_LABEL})
+            CALL {{
+                WITH n
+                REMOVE n:{RESTORE_LABEL}, n.{RESTORE_ID}
+            }} IN TRANSACTIONS OF {int(batch_size)} ROWS
+        """)).consume()
+        await (await session.run(f"DROP INDEX {RESTORE_INDEX} IF EXISTS")).consume()
+    return {**counts, "position": header["position"]}
+
+
+async def replay_changes(driver: AsyncDriver, change_log: ChangeLog, after: int) -> Dict[str, int]:
+    """Apply the logged writes after position ``after`` in order, each as it originally ran."""
+    counts = {"replayed": 0, "skipped": 0}
+    while changes := await asyncio.to_thread(change_log.read, after, REPLAY_PAGE_SIZE):
+        for seq, autocommit, statements in changes:
+            try:
+                if autocommit:
+                    async with driver.session() as session:
+                        for cypher, parameters in statements:
+                            await (await session.run(cypher, parameters)).consume()
+                else:
+                    async def work(tx):
+                        for cypher, parameters in statements:
+                            await (await tx.run(cypher, parameters)).consume()
+
+                    await execute_write(driver, work)
+                counts["replayed"] += 1
+            except ConstraintError as e:
+                # Already contained in the snapshot
+                logger.info("Skipped logged change %d: %s", seq, e)
+                counts["skipped"] += 1
+            after = seq
+    return counts
+
+
+async def restore(driver: AsyncDriver, directory: str, change_log: Optional[ChangeLog] = None, path: Optional[str] = None, batch_size: int = RESTORE_BATCH_SIZE, concurrency: int = RESTORE_CONCURRENCY) -> Optional[Dict[str, int]]:
+    """Load a snapshot (default: the newest in directory) into the empty database and replay the changes logged after it.
+
+    Returns the counters of the restore, or None if there is no snapshot to restore.
+    Raises ValueError if the database is not empty.
+    """
+    if path is None:
+        snapshots = list_snapshots(directory)
+        if not snapshots:
+            return None
+        path = snapshots[-1][1]
+    if not await is_graph_empty(driver):
+        raise ValueError("The database is not empty, a snapshot can only be restored into an empty database")
+    await apply_migrations(driver)
+    started = time.monotonic()
+    counts = await load_snapshot(driver, path, batch_size, concurrency)
+    if change_log is not None:
+        counts.update(await replay_changes(driver, change_log, counts["position"]))
+    logger.info("Restored %s in %.1fs: %s", path, time.monotonic() - started, counts)
+    return counts
+
+
+class Backup:
+    """Takes a snapshot every interval seconds if the change log moved since the last one."""
+
+    def __init__(self, driver: AsyncDriver, change_log: ChangeLog, directory: str, interval: float, keep: int):
+        self.driver = driver
+        self.change_log = change_log
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # Restores into the empty database before requests are served, since it only restores into an empty one
+        if await is_graph_empty(self.driver):
+            await restore(self.driver, self.directory, self.change_log)
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._snapshot_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def snapshot(self, force: bool = False) -> Optional[Dict[str, int]]:
+        """Write a snapshot and prune old ones. Without force, skipped if nothing was logged since the newest snapshot."""
+        position = await asyncio.to_thread(self.change_log.position)
+        snapshots = list_snapshots(self.directory)
+        if not force and snapshots and snapshots[-1][0] == position:
+            return None
+        counts = await write_snapshot(self.driver, self.directory, position)
+        await asyncio.to_thread(prune_snapshots, self.directory, self.keep, self.change_log)
+        return counts
+
+    async def _snapshot_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error("Writing a snapshot to %s failed: %s", self.directory, e)
+
+
+def create_backup(store) -> Optional[Backup]:
+    """The backup task of a Neo4j store with a change log (BACKUP_DIR), else None."""
+    change_log = getattr(store, "change_log", None)
+    if change_log is None:
+        return None
+    return Backup(
+        store.driver,
+        change_log,
+        directory=os.environ["BACKUP_DIR"],
+        interval=float(os.getenv("BACKUP_INTERVAL", "300")),
+        keep=int(os.getenv("BACKUP_KEEP", "3")),
+    )
+
+
+async def _run(args):
+    change_log = create_change_log()
+    driver = create_driver()
+    try:
+        if args.command == "snapshot":
+            backup = Backup(driver, change_log, os.environ["BACKUP_DIR"], interval=0, keep=args.keep)
+            print(await backup.snapshot(force=True))
+        else:
+            counts = await restore(driver, os.environ["BACKUP_DIR"], change_log, args.path, args.batch_size, args.concurrency)
+            print(counts if counts is not None else "No snapshot to restore")
+    finally:
+        await driver.close()
+        change_log.close()
+
+
+def main():
+    """Entry point of ``listen-backup``: take a snapshot or restore one, with the settings of the application."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot = commands.add_parser("snapshot", help="Write a snapshot to BACKUP_DIR and prune old ones")
+    snapshot.add_argument("--keep", type=int, default=int(os.getenv("BACKUP_KEEP", "3")))
+    restore_parser = commands.add_parser("restore", help="Restore a snapshot and the changes logged after it into an empty database")
+    restore_parser.add_argument("--path", help="Snapshot to restore (default: the newest in BACKUP_DIR)")
+    restore_parser.add_argument("--batch-size", type=int, default=RESTORE_BATCH_SIZE)
+    restore_parser.add_argument("--concurrency", type=int, default=RESTORE_CONCURRENCY)
+    args = parser.parse_args()
+    if not os.getenv("BACKUP_DIR"):
+        parser.error("BACKUP_DIR is not set")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Append-only log of the writes the API made to Neo4j, replayed after a backup snapshot.
+
+Entries are appended after their transaction committed, so a crash in between loses that
+write from the log, and writes that bypass the API are never logged.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        committed_at REAL NOT NULL,
+        autocommit INTEGER NOT NULL,
+        statements TEXT NOT NULL
+    );
+"""
+
+# (query, parameters) of one Cypher statement
+LoggedStatement = Tuple[str, dict]
+
+
+class ChangeLog:
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def append(self, statements: List[LoggedStatement], autocommit: bool = False) -> int:
+        """Log the statements of one committed write. With autocommit they ran as separate auto-commit transactions."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO changes (committed_at, autocommit, statements) VALUES (?, ?, ?)",
+                (time.time(), int(autocommit), json.dumps(statements)),
+            )
+            return cursor.lastrowid
+
+    def position(self) -> int:
+        """The seq of the latest entry, 0 if nothing has been logged yet."""
+        with self._lock:
+            row = self._connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def read(self, after: int, limit: int) -> List[Tuple[int, bool, List[LoggedStatement]]]:
+        """The (seq, autocommit, statements) of the entries after seq ``after``, oldest first."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT seq, autocommit, statements FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (after, limit),
+            ).fetchall()
+        return [(seq, bool(autocommit), [tuple(statement) for statement in json.loads(statements)]) for seq, autocommit, statements in rows]
+
+    def truncate(self, up_to: int) -> int:
+        """Drop the entries up to and including seq ``up_to``, which the oldest kept snapshot already contains."""
+        with self._transaction() as connection:
+            return connection.execute("DELETE FROM changes WHERE seq <= ?", (up_to,)).rowcount
+
+
+class RecordingTransaction:
+    """Wraps a Neo4j transaction (or session) and collects the statements run through it.
+
+    Everything else, including ``async with``, is passed through to the wrapped object.
+    """
+
+    def __init__(self, transaction, statements: List[LoggedStatement]):
+        self._transaction = transaction
+        self.statements = statements
+
+    async def run(self, query: str, parameters: Optional[dict] = None, **kwargs):
+        self.statements.append((query, {**(parameters or {}), **kwargs}))
+        return await self._transaction.run(query, parameters, **kwargs)
+
+    async def __aenter__(self):
+        await self._transaction.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._transaction.__aexit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+
+class RecordingDriver:
+    """Hands out recording sessions, for repository functions that take the driver and run auto-commit transactions."""
+
+    def __init__(self, driver, statements: List[LoggedStatement]):
+        self._driver = driver
+        self.statements = statements
+
+    def session(self, **kwargs) -> RecordingTransaction:
+        return RecordingTransaction(self._driver.session(**kwargs), self.statements)
+
+
+def get_change_log_path() -> Optional[str]:
+    backup_dir = os.getenv("BACKUP_DIR")
+    return os.path.join(backup_dir, "changes.sqlite3") if backup_dir else None
+
+
+def create_change_log() -> Optional[ChangeLog]:
+    """Open the change log in BACKUP_DIR, or None without one."""
+    path = get_change_log_path()
+    if path is None:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return ChangeLog(path)
@@ -0,0 +1,107 @@
+"""Versioned schema migrations.
+
+Migrations are applied in order at startup. The version of the last applied migration is
+stored on a single (:SchemaVersion) node, so every start only runs what is missing.
+All statements use IF NOT EXISTS (or are otherwise idempotent), which keeps a migration safe
+to re-run if it was interrupted or if several workers start at the same time.
+
+Never edit a migration that has been released; append a new one instead.
+"""
+import logging
+from typing import List, NamedTuple
+from neo4j import AsyncDriver
+
+logger = logging.getLogger(__name__)
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: List[str]
+
+
+MIGRATIONS = [
+    Migration(1, "Unique ids for statements and named entities", [
+        "CREATE CONSTRAINT statement_id_unique IF NOT EXISTS FOR (s:Statement) REQUIRE s.statement_id IS UNIQUE",
+        "CREATE CONSTRAINT namedentity_id_unique IF NOT EXISTS FOR (p:NamedEntity) REQUIRE p.namedentity_id IS UNIQUE",
+    ]),
+    Migration(2, "Index source_statement_id on the derived relationship types", [
+        "CREATE INDEX some_relation_source_statement_id IF NOT EXISTS FOR ()-[r:SOME_RELATION]-() ON (r.source_statement_id)",
+        "CREATE INDEX married_to_source_statement_id IF NOT EXISTS FOR ()-[r:MARRIED_TO]-() ON (r.source_statement_id)",
+    ]),
+    Migration(3, "Index NamedEntity.name and Topic.topic_id", [
+        "CREATE INDEX namedentity_name IF NOT EXISTS FOR (n:NamedEntity) ON (n.name)",
+        "CREATE INDEX topic_id IF NOT EXISTS FOR (t:Topic) ON (t.topic_id)",
+    ]),
+    Migration(4, "Composite index for paging NamedEntities with the same name by namedentity_id", [
+        "CREATE INDEX namedentity_name_id IF NOT EXISTS FOR (n:NamedEntity) ON (n.name, n.namedentity_id)",
+    ]),
+    Migration(5, "Full-text indexes for /search", [
+        "CREATE FULLTEXT INDEX statement_text_fulltext IF NOT EXISTS FOR (s:Statement) ON EACH [s.text]",
+        "CREATE FULLTEXT INDEX namedentity_name_fulltext IF NOT EXISTS FOR (n:NamedEntity) ON EACH [n.name]",
+    ]),
+    # Without vector.dimensions, so that switching to an embedder of another size (EMBEDDER) needs no new migration
+    Migration(6, "Vector index over statement embeddings for /statement/similar", [
+        "CREATE VECTOR INDEX statement_embedding IF NOT EXISTS FOR (s:Statement) ON (s.embedding) "
+        "OPTIONS {indexConfig: {`vector.similarity_function`: 'cosine'}}",
+    ]),
+    # A constraint cannot be created next to a plain index on the same property, so the index of migration 3 goes
+    Migration(7, "Unique ids for topics", [
+        # Topics created twice before the constraint are merged into one, keeping their statements
+        """
+        MATCH (t:Topic) WHERE t.topic_id IS NOT NULL
+        WITH t.topic_id AS topic_id, collect(t) AS topics WHERE size(topics) > 1
+        WITH head(topics) AS kept, tail(topics) AS duplicates
+        UNWIND duplicates AS duplicate
+        OPTIONAL MATCH (s:Statement)-[:HAS_TOPIC]->(duplicate)
+        FOREACH (statement IN CASE WHEN s IS NULL THEN [] ELSE [s] END | MERGE (statement)-[:HAS_TOPIC]->(kept))
+        WITH DISTINCT duplicate
+        DETACH DELETE duplicate
+        """,
+        "DROP INDEX topic_id IF EXISTS",
+        "CREATE CONSTRAINT topic_id_unique IF NOT EXISTS FOR (t:Topic) REQUIRE t.topic_id IS UNIQUE",
+    ]),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+async def get_schema_version(driver: AsyncDriver) -> int:
+    async with driver.session() as session:
+        result = await session.run("""
+            OPTIONAL MATCH (v:SchemaVersion {name: 'listen'})
+            RETURN coalesce(v.version, 0) AS version
+        """)
+        return (await result.single())["version"]
+
+
+async def set_schema_version(driver: AsyncDriver, migration: Migration):
+    async with driver.session() as session:
+        await session.run("""
+            MERGE (v:SchemaVersion {name: 'listen'})
+            SET v.version = $version, v.description = $description, v.applied_at = datetime()
+        """, version=migration.version, description=migration.description)
+
+
+async def apply_migrations(driver: AsyncDriver, migrations: List[Migration] = MIGRATIONS) -> List[int]:
+    """Apply all migrations newer than the version recorded in the graph. Returns the applied versions."""
+    current_version = await get_schema_version(driver)
+    applied = []
+    for migration in sorted(migrations, key=lambda migration: migration.version):
+        if migration.version <= current_version:
+            continue
+        logger.info("Applying schema migration %d: %s", migration.version, migration.description)
+        async with driver.session() as session:
+            # Schema changes cannot share a transaction with data writes, so each statement runs on its own
+            for statement in migration.statements:
+                await (await session.run(statement)).consume()
+        await set_schema_version(driver, migration)
+        applied.append(migration.version)
+    return applied
+
+
+async def run_migrations(driver: AsyncDriver) -> List[int]:
+    """Apply the missing migrations. Raises if Neo4j cannot be reached; the application retries with backoff (app/utils/startup.py)."""
+    applied = await apply_migrations(driver)
+    if applied:
+        logger.info("Schema is at version %d", applied[-1])
+    return applied
@@ -1,6 +1,17 @@
-from fastapi import APIRouter, HTTPException
-from typing import Any, Dict
-from app.utils.neo4j import get_driver
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Optional
+from app.genai.embedding import Embedder, embed_one, get_embedder
+from app.genai.pipeline import DerivationPipeline, get_derivation_pipeline
+from app.models import GraphStatistics, ImportResult
+from app.storage.base import GraphStore
+from app.storage.store import get_store
+from app.utils.autocomplete import AutocompleteIndex, get_autocomplete
+from app.utils.briefing import BriefingIndex, get_briefings
+from app.utils.cache import EntityCache, get_cache
+from app.utils.exporter import FORMATS, export_filename, export_stream
+from app.utils.importer import IMPORT_BATCH_SIZE, import_ndjson, update_indexes
+from app.utils.statistics import GraphStatisticsCache, get_graph_statistics
 
 label_hirarchy = {"namedentity": "namedentity",
                   "topic": "topic",
@@ -10,95 +21,143 @@ label_hirarchy = {"namedentity": "namedentity",
 
 router = APIRouter()
 
-# Neo4j driver initialization
-driver = get_driver()
+async def invalidate_node(cache: EntityCache, label: str, node_id: str):
+    """Drop a node changed through the generic endpoints from the entity cache."""
+    kind = label_hirarchy.get(label.lower())
+    if kind is not None:
+        await cache.invalidate(kind, node_id)
 
-@router.get("/describe_graph")
-async def describe_graph():
+
+async def update_briefings(briefings: BriefingIndex, label: str, node_id: str, updates: Optional[Dict[str, Any]] = None):
+    """Apply an update (or, without updates, the deletion) of a node through the generic endpoints to the briefings."""
+    kind = label_hirarchy.get(label.lower())
+    if updates is not None:
+        if kind == "statement" and isinstance(updates.get("text"), str):
+            await briefings.set_text(node_id, updates["text"])
+    elif kind == "statement":
+        await briefings.remove_statements([node_id])
+    elif kind == "namedentity":
+        await briefings.remove_namedentity(node_id)
+    elif kind == "topic":
+        await briefings.remove_topic(node_id)
+
+
+async def with_embedding(embedder: Embedder, label: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the embedding of the text of a statement written through the generic endpoints."""
+    if label_hirarchy.get(label.lower()) != "statement" or not isinstance(properties.get("text"), str):
+        return properties
+    return {**properties, "embedding": await embed_one(embedder, properties["text"])}
+
+
+@router.get("/describe_graph", response_model=GraphStatistics, description="Count the nodes and relationships of the graph, in total, per label and per relationship type. The counts are cached for a few seconds (GRAPH_STATISTICS_TTL).")
+async def describe_graph(graph_statistics: GraphStatisticsCache = Depends(get_graph_statistics)):
     try:
-        with driver.session() as session:
-            node_count = session.run("MATCH (n) RETURN count(n)").single()[0]
-            statement_count = session.run("MATCH (s:Statement) RETURN count(s)").single()[0]
-            relationship_count = session.run("MATCH ()-[r]->() RETURN count(r)").single()[0]
-        return {
-            "nodes": node_count,
-            "statements": statement_count,
-            "relationships": relationship_count
-        }
+        return await graph_statistics.get()
     except Exception as e:
-        return HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/create_node/")
-def create_node(label: str, properties: Dict[str, Any]):
+async def create_node(label: str, properties: Dict[str, Any], store: GraphStore = Depends(get_store), autocomplete: AutocompleteIndex = Depends(get_autocomplete), embedder: Embedder = Depends(get_embedder)):
     try:
-        with driver.session() as session:
-            session.run(f"""
-                CREATE (n:{label} {{ {", ".join(f"{k}: ${k}" for k in properties.keys())} }})
-            """, **properties)
+        await store.create_node(label, await with_embedding(embedder, label, properties))
+        if label_hirarchy.get(label.lower()) == "namedentity":
+            autocomplete.add(properties.get("namedentity_id"), properties.get("name"))
         return {"message": f"{label} created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/read_node/")
-def read_node(label: str, node_id: str):
+async def read_node(label: str, node_id: str, store: GraphStore = Depends(get_store)):
     try:
-        with driver.session() as session:
-            result = session.run(f"""
-                MATCH (n:{label} {{ {label_hirarchy[label.lower()]}_id: $node_id }})
-                RETURN n
-            """, node_id=node_id)
-
-            node = result.single()
-            if node is None:
-                raise HTTPException(status_code=404, detail=f"{label} with id {node_id} not found")
-
-            return node["n"]
+        node = await store.read_node(label, f"{label_hirarchy[label.lower()]}_id", node_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+    if node is None:
+        raise HTTPException(status_code=404, detail=f"{label} with id {node_id} not found")
+    return node
+
 
 @router.post("/update_node/")
-def update_node(label: str, node_id: str, updates: Dict[str, Any]):
+async def update_node(label: str, node_id: str, updates: Dict[str, Any], store: GraphStore = Depends(get_store), cache: EntityCache = Depends(get_cache), autocomplete: AutocompleteIndex = Depends(get_autocomplete), embedder: Embedder = Depends(get_embedder), briefings: BriefingIndex = Depends(get_briefings)):
     try:
-        set_clause = ", ".join([f"n.{key} = ${key}" for key in updates.keys()])
-        query = f"""
-            MATCH (n:{label} {{ {label.lower()}_id: $node_id }})
-            SET {set_clause}
-            RETURN n
-        """
-
-        with driver.session() as session:
-            result = session.run(query, node_id=node_id, **updates)
-
-            updated_node = result.single()
-            if updated_node is None:
-                raise HTTPException(status_code=404, detail=f"{label} with id {node_id} not found")
-
-            return {"message": f"{label} updated successfully", "node": updated_node["n"]}
+        updated_node = await store.update_node(label, node_id, await with_embedding(embedder, label, updates))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    await invalidate_node(cache, label, node_id)
+    if updated_node is None:
+        raise HTTPException(status_code=404, detail=f"{label} with id {node_id} not found")
+    await update_briefings(briefings, label, node_id, updates)
+    if label_hirarchy.get(label.lower()) == "namedentity":
+        autocomplete.add(node_id, updated_node.get("name"))
+    return {"message": f"{label} updated successfully", "node": updated_node}
 
 
 @router.post("/delete_node/")
-def delete_node(label: str, node_id: str):
+async def delete_node(label: str, node_id: str, store: GraphStore = Depends(get_store), cache: EntityCache = Depends(get_cache), autocomplete: AutocompleteIndex = Depends(get_autocomplete), briefings: BriefingIndex = Depends(get_briefings)):
     try:
-        with driver.session() as session:
-            result = session.run(f"""
-                MATCH (n:{label} {{ {label.lower()}_id: $node_id }})
-                DETACH DELETE n
-            """, node_id=node_id)
-
-            summary = result.consume()
-            if summary.counters.nodes_deleted == 0:
-                raise HTTPException(status_code=404, detail=f"{label} with id {node_id} not found")
-
-            return {"message": f"{label} deleted successfully"}
+        deleted = await store.delete_node(label, node_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+    await invalidate_node(cache, label, node_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"{label} with id {node_id} not found")
+    await update_briefings(briefings, label, node_id)
+    if label_hirarchy.get(label.lower()) == "namedentity":
+        autocomplete.remove(node_id)
+    return {"message": f"{label} deleted successfully"}
+
+
+@router.post("/import", response_model=ImportResult, description="Import NDJSON records of entities, topics, statements and mentions streamed in the request body, merged by id in large batches (format in app/utils/importer.py). An interrupted import continues with resume_from set to the checkpoint it reported.")
+async def import_records(
+    request: Request,
+    batch_size: int = Query(default=IMPORT_BATCH_SIZE, gt=0),
+    resume_from: int = Query(default=0, ge=0),
+    store: GraphStore = Depends(get_store),
+    cache: EntityCache = Depends(get_cache),
+    autocomplete: AutocompleteIndex = Depends(get_autocomplete),
+    embedder: Embedder = Depends(get_embedder),
+    derivation: DerivationPipeline = Depends(get_derivation_pipeline),
+    briefings: BriefingIndex = Depends(get_briefings)
+):
+    async def on_batch(batch, statement_results, linked, progress):
+        await update_indexes(batch, statement_results, linked, briefings, derivation.enqueue, autocomplete)
 
-@router.on_event("shutdown")
-def shutdown():
-    driver.close()
+    try:
+        return await import_ndjson(store, request.stream(), embedder, batch_size, resume_from, on_batch)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Imported records may replace cached ones
+        for kind in ("namedentity", "statement", "topic"):
+            await cache.invalidate_kind(kind)
+
+
+@router.get("/export", response_class=StreamingResponse, description="Stream the whole graph, or with namedentity_id the subgraph of one entity, as NDJSON records that /general/import reads back (format in app/utils/exporter.py) or as an Arrow IPC stream. With compression the body is sent gzip or zstd encoded.")
+async def export_graph(
+    namedentity_id: Optional[str] = None,
+    format: str = Query(default="ndjson", pattern="^(ndjson|arrow)$"),
+    compression: Optional[str] = Query(default=None, pattern="^(gzip|zstd)$"),
+    store: GraphStore = Depends(get_store),
+    cache: EntityCache = Depends(get_cache)
+):
+    if namedentity_id is not None:
+        try:
+            named_entity = await cache.get_or_load(
+                "namedentity", namedentity_id,
+                lambda: store.get_namedentity_by_id(namedentity_id)
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if named_entity is None:
+            raise HTTPException(status_code=404, detail="NamedEntity not found")
+    try:
+        # Fails here, before the response starts, if pyarrow or zstandard is missing
+        chunks = export_stream(store, namedentity_id, format, compression)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    headers = {"Content-Disposition": f'attachment; filename="{export_filename(namedentity_id, format, compression)}"'}
+    if compression is not None:
+        headers["Content-Encoding"] = compression
+    return StreamingResponse(chunks, media_type=FORMATS[format], headers=headers)
@@ -1,180 +1,211 @@
-from fastapi import APIRouter, HTTPException, Query, Body
+import os
+from datetime import datetime, timezone
+from fastapi import APIRouter, HTTPException, Query, Body, Depends
 from typing import List, Optional
 from uuid import uuid4
-from app.models import NamedEntity, Statement
-from app.utils.neo4j import get_driver, get_namedentity_by_id
-from app.endpoints.statement import delete_statement_by_id
+from app.models import Briefing, BriefingMention, BriefingTopic, Connection, NamedEntity, NamedEntitySuggestion, Neighbourhood, Statement
+from app.storage.base import GraphStore
+from app.storage.store import get_store
+from app.utils.autocomplete import AutocompleteIndex, get_autocomplete
+from app.utils.briefing import BriefingIndex, get_briefings, top_counts
+from app.utils.cache import EntityCache, get_cache
+from app.utils.streaming import ndjson_response
 
 router = APIRouter()
 
-# Neo4j driver initialization
-driver = get_driver()
-    
+# Maximum number of rows (statements or relationships) per transaction of the cascade delete
+NAMEDENTITY_DELETE_BATCH_SIZE = int(os.getenv("NAMEDENTITY_DELETE_BATCH_SIZE", "1000"))
+# Maximum number of derived relationships returned by /neighbourhood
+NEIGHBOURHOOD_RELATIONSHIP_LIMIT = int(os.getenv("NEIGHBOURHOOD_RELATIONSHIP_LIMIT", "500"))
+
 @router.post("/create", description="Add a new NamedEntity to the database.")
-def create(named_entity: NamedEntity):
-    namedentity_id = named_entity.namedentity_id or str(uuid4())
+async def create(named_entity: NamedEntity, store: GraphStore = Depends(get_store), autocomplete: AutocompleteIndex = Depends(get_autocomplete)):
+    named_entity.namedentity_id = named_entity.namedentity_id or str(uuid4())
     try:
-        # Convert the additional_labels list into a string of labels
-        additional_labels = ""
-        if named_entity.additional_labels:
-            additional_labels = ":" + ":".join(named_entity.additional_labels)
-
-        with driver.session() as session:
-            session.run(f"""
-            CREATE (p:NamedEntity{additional_labels} {{name: $name, namedentity_id: $namedentity_id}})
-            """, name=named_entity.name, namedentity_id=namedentity_id)
-        return {"message": "NamedEntity added successfully", "name": named_entity.name, "namedentity_id": namedentity_id}
+        await store.create_namedentity(named_entity)
+        autocomplete.add(named_entity.namedentity_id, named_entity.name)
+        return {"message": "NamedEntity added successfully", "name": named_entity.name, "namedentity_id": named_entity.namedentity_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/read/", response_model=NamedEntity, description="Get a NamedEntity based on its ID.")
-def read_namedentity(namedentity_id: str):
-        named_entity =  get_namedentity_by_id(driver, namedentity_id)
+async def read_namedentity(namedentity_id: str, store: GraphStore = Depends(get_store), cache: EntityCache = Depends(get_cache)):
+        named_entity = await cache.get_or_load(
+            "namedentity", namedentity_id,
+            lambda: store.get_namedentity_by_id(namedentity_id)
+        )
         if named_entity is None:
             raise HTTPException(status_code=404, detail="NamedEntity not found")
         return named_entity
 
 
-@router.post("/get_by_name/", description="Get all NamedEntities with a specific name.")
-def get_by_name(name: str):
+@router.get("/autocomplete/", response_model=List[NamedEntitySuggestion], description="Suggest NamedEntities while an @-mention is typed: names with a word starting with `q` first, then (with `fuzzy`) names one typo away.")
+async def autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(default=10, gt=0, le=50),
+    fuzzy: bool = True,
+    autocomplete: AutocompleteIndex = Depends(get_autocomplete)
+):
+    return autocomplete.complete(q, limit, fuzzy)
+
+
+@router.post("/get_by_name/", description="Get the NamedEntities with a specific name ordered by namedentity_id. Pass the last namedentity_id of a page as `after` to get the next one, or `stream=true` for NDJSON.")
+async def get_by_name(
+    name: str,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, gt=0),
+    stream: bool = False,
+    store: GraphStore = Depends(get_store)
+):
+    if stream:
+        # The status is sent before the first record, so an empty stream replaces the 404
+        return ndjson_response(store.iter_namedentities_by_name(name, after, limit))
     try:
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (n:NamedEntity { name: $name })
-                RETURN n, labels(n) AS labels
-            """, name=name)
-
-            namedentities = []
-            for record in result:
-                node = record["n"]
-                labels = record["labels"]
-
-                # Create a NamedEntity instance
-                named_entity = NamedEntity(
-                    name=node["name"],
-                    namedentity_id=node["namedentity_id"],
-                    additional_labels=[label for label in labels if label != "NamedEntity"]
-                )
-
-                namedentities.append(named_entity)
-
-            if not namedentities:
-                raise HTTPException(status_code=404, detail=f"No NamedEntity found with name {name}")
-
-            return {"namedentities": namedentities}
+        namedentities = await store.get_namedentities_by_name(name, after, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+    if not namedentities and after is None:
+        raise HTTPException(status_code=404, detail=f"No NamedEntity found with name {name}")
+    return {"namedentities": namedentities}
+
+
+@router.post("/get_statements/", response_model=List[Statement], description="Get the statements about the given named entity ordered by statement_id. Pass the last statement_id of a page as `after` to get the next one, or `stream=true` for NDJSON.")
+async def get_statements(
+    namedentity_id: str,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, gt=0),
+    stream: bool = False,
+    store: GraphStore = Depends(get_store),
+    cache: EntityCache = Depends(get_cache)
+):
+    if stream:
+        try:
+            named_entity = await cache.get_or_load(
+                "namedentity", namedentity_id,
+                lambda: store.get_namedentity_by_id(namedentity_id)
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if named_entity is None:
+            raise HTTPException(status_code=404, detail="NamedEntity not found")
+        return ndjson_response(store.iter_statements_about(namedentity_id, after, limit))
+    try:
+        statements = await store.get_statements_about(namedentity_id, after, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if statements is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    return statements
+
 
-@router.post("/get_statements/", response_model=List[Statement], description="Get all statements connected to the given named entity.")
-def get_statements(namedentity_id: str):
-    named_entity = read_namedentity(namedentity_id)
+@router.get("/get_connections/", response_model=List[Connection], description="Get the entities the given named entity is directly related to.")
+async def get_connections(namedentity_id: str, store: GraphStore = Depends(get_store)):
     try:
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (s:Statement)-[:IS_ABOUT]->(n:NamedEntity {namedentity_id: $namedentity_id})
-                RETURN s.text AS text, s.statement_id AS statement_id
-            """, namedentity_id=named_entity.namedentity_id)
-
-            mentioned_result = session.run("""
-                MATCH (s:Statement {statement_id: $statement_id})-[:MENTIONS]->(m:NamedEntity)
-                RETURN m.namedentity_id AS mentioned_id
-            """, statement_id=statement_id)
-
-            statements = []
-            for record in result+mentioned_result:
-                statement_id = record["statement_id"]
-                text = record["text"]
-
-                if text is None or statement_id is None:
-                    raise HTTPException(status_code=500, detail="Statement data is incomplete")
-
-                statement = Statement(
-                    text=text,
-                    statement_id=statement_id,
-                    about_namedentity_id=named_entity.namedentity_id
-                )
-                
-                statements.append(statement)
-
-        return statements
+        connections = await store.get_connections(namedentity_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if connections is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    return connections
+
+
+@router.get("/neighbourhood/", response_model=Neighbourhood, description="Everything a person screen shows in one request: the entity, its statements with their mentions and topics, and the entities up to `hops` relationships away. Each hop adds at most `fan_out` entities; `truncated` tells whether a limit left something out.")
+async def neighbourhood(
+    namedentity_id: str,
+    hops: int = Query(default=1, ge=1, le=3),
+    fan_out: int = Query(default=25, gt=0, le=100),
+    statement_limit: int = Query(default=50, gt=0, le=500),
+    store: GraphStore = Depends(get_store)
+):
+    try:
+        result = await store.get_neighbourhood(namedentity_id, hops, fan_out, statement_limit, NEIGHBOURHOOD_RELATIONSHIP_LIMIT)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    return result
+
+
+@router.get("/briefing/", response_model=Briefing, description="What to know about a person before a conversation: the number of statements about them, the latest ones, the entities they mention most and their topics, with the `limit` most frequent of each. Briefings are maintained as statements change, so this reads one stored document.")
+async def briefing(
+    namedentity_id: str,
+    limit: int = Query(default=10, gt=0, le=100),
+    store: GraphStore = Depends(get_store),
+    cache: EntityCache = Depends(get_cache),
+    autocomplete: AutocompleteIndex = Depends(get_autocomplete),
+    briefings: BriefingIndex = Depends(get_briefings)
+):
+    try:
+        named_entity = await cache.get_or_load(
+            "namedentity", namedentity_id,
+            lambda: store.get_namedentity_by_id(namedentity_id)
+        )
+        document = await briefings.get(namedentity_id) if named_entity is not None else None
+        topic_counts = top_counts(document["topics"], limit) if document is not None else []
+        # The names of the topics in one query; those of the entities come from the autocomplete index
+        topics = {topic.topic_id: topic for topic in await store.get_topics_by_ids([topic_id for topic_id, _ in topic_counts])} if topic_counts else {}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if named_entity is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    if document is None:
+        return Briefing(namedentity=named_entity)
+    return Briefing(
+        namedentity=named_entity,
+        statement_count=document["statement_count"],
+        latest_statements=[Statement(text=text, statement_id=statement_id, about_namedentity_id=namedentity_id) for statement_id, text in document["latest"]],
+        top_mentioned=[
+            BriefingMention(namedentity_id=mentioned_id, name=autocomplete.name(mentioned_id), statement_count=count)
+            for mentioned_id, count in top_counts(document["mentioned"], limit)
+        ],
+        # Topics that were deleted, or set on a statement without existing, are left out
+        topics=[
+            BriefingTopic(topic_id=topic_id, name=topics[topic_id].name, statement_count=count)
+            for topic_id, count in topic_counts if topic_id in topics
+        ],
+        updated_at=datetime.fromtimestamp(document["updated_at"], timezone.utc),
+    )
 
 
 @router.post("/update_labels/")
-def update_labels(
+async def update_labels(
     namedentity_id: str = Query(...),
-    additional_labels: Optional[List[str]] = Query(default=[])
+    additional_labels: Optional[List[str]] = Query(default=[]),
+    store: GraphStore = Depends(get_store),
+    cache: EntityCache = Depends(get_cache)
 ):
-    named_entity = read_namedentity(namedentity_id)
     try:
-        with driver.session() as session:
-            # Step 1: Match the node and extract all its labels
-            labels_result = session.run("""
-                MATCH (n {namedentity_id: $namedentity_id})
-                RETURN labels(n) AS labels
-            """, namedentity_id=named_entity.namedentity_id)
-
-            labels = labels_result.single()["labels"]
-
-            # Step 2: Remove all labels from the node
-            for label in labels:
-                session.run(f"""
-                    MATCH (n {{namedentity_id: $namedentity_id}})
-                    REMOVE n:`{label}`
-                """, namedentity_id=named_entity.namedentity_id)
-
-            # Step 3: Add back the NamedEntity label
-            session.run("""
-                MATCH (n {namedentity_id: $namedentity_id})
-                SET n:NamedEntity
-            """, namedentity_id=named_entity.namedentity_id)
-
-            if additional_labels:
-                # Step 4: Add the new labels (additional types)
-                labels = ":".join(additional_labels)
-                session.run(f"""
-                    MATCH (n:NamedEntity {{ namedentity_id: $namedentity_id }})
-                    SET n:{labels}
-                """, namedentity_id=named_entity.namedentity_id)
-
-        return {"message": "NamedEntity types updated successfully"}
+        named_entity = await store.set_labels(namedentity_id, additional_labels)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
-
-@router.post("/delete/")
-def delete(namedentity_id: str):
+    await cache.invalidate("namedentity", namedentity_id)
+    if named_entity is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    return {"message": "NamedEntity types updated successfully"}
 
-    # Just return the namedentity_id to ensure it's received correctly
-    print(f"deleting {namedentity_id}")
-
-    named_entity = read_namedentity(namedentity_id)
 
+@router.post("/delete/")
+async def delete(
+    namedentity_id: str,
+    batch_size: int = Query(default=NAMEDENTITY_DELETE_BATCH_SIZE, gt=0),
+    store: GraphStore = Depends(get_store),
+    cache: EntityCache = Depends(get_cache),
+    autocomplete: AutocompleteIndex = Depends(get_autocomplete),
+    briefings: BriefingIndex = Depends(get_briefings)
+):
     try:
-        with driver.session() as session:
-            # Delete all statements connected via `IS_ABOUT` relationship
-            result = session.run("""
-                MATCH (n:NamedEntity {namedentity_id: $namedentity_id})<-[:IS_ABOUT]-(s:Statement)
-                RETURN s.statement_id AS statement_id
-            """, namedentity_id=named_entity.namedentity_id)
-
-            for record in result:
-                statement_id = record["statement_id"]
-                delete_statement_by_id(statement_id)  # Call the refactored delete function directly
-
-            # Delete the NamedEntity itself
-            result = session.run("""
-                MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
-                DETACH DELETE n
-            """, namedentity_id=named_entity.namedentity_id)
-
-            summary = result.consume()
-            if summary.counters.nodes_deleted == 0:
-                raise HTTPException(status_code=404, detail=f"NamedEntity with id {named_entity.namedentity_id} not found")
-
-            return {"message": f"NamedEntity with id {named_entity.namedentity_id} deleted successfully"}
+        # Deletes the entity, all statements about it and their derived relationships in bounded batches
+        deleted = await store.delete_namedentity_cascade(namedentity_id, batch_size)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Also after a failure, since earlier batches of the cascade may have been committed.
+        # The IDs of the deleted statements are not collected, so all cached statements are dropped.
+        await cache.invalidate("namedentity", namedentity_id)
+        await cache.invalidate_kind("statement")
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    autocomplete.remove(namedentity_id)
+    await briefings.remove_namedentity(namedentity_id)
+    return {"message": f"NamedEntity with id {namedentity_id} deleted successfully", **deleted}
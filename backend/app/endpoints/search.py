@@ -0,0 +1,28 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Optional
+from app.models import SearchResults
+from app.storage.base import GraphStore
+from app.storage.store import get_store
+
+router = APIRouter()
+
+@router.get("/", response_model=SearchResults, description="Full-text search over statement texts and named entity names, best matches first. Filtering by about_namedentity_id or topic_id restricts the search to statements.")
+async def search(
+    q: str = Query(..., min_length=1),
+    kind: Optional[str] = Query(default=None, pattern="^(statement|namedentity)$"),
+    about_namedentity_id: Optional[str] = None,
+    topic_id: Optional[str] = None,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=20, gt=0, le=100),
+    store: GraphStore = Depends(get_store)
+):
+    if about_namedentity_id or topic_id:
+        kinds = ["statement"]
+    else:
+        kinds = [kind] if kind else ["statement", "namedentity"]
+    try:
+        # One extra hit tells whether there is a next page
+        hits = await store.search(q, kinds, about_namedentity_id, topic_id, offset, limit + 1)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return SearchResults(hits=hits[:limit], next_offset=offset + limit if len(hits) > limit else None)
@@ -1,113 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query, Body
+import os
+from fastapi import APIRouter, HTTPException, Query, Body, Depends
 from typing import Optional, List
 from uuid import uuid4
-from app.models import Statement, NamedEntity, Relationship
-from app.genai.genai import derive_relationships_from_statement
-from app.utils.neo4j import named_entity_exists, get_driver, get_statement_by_id
-from pydantic import BaseModel
+from app.genai.embedding import Embedder, embed_one, get_embedder
+from app.genai.pipeline import DerivationPipeline, get_derivation_pipeline
+from app.models import DerivationJob, SimilarStatement, Statement, NamedEntity, StatementBatchItem, StatementBatchResult
+from app.storage.base import GraphStore
+from app.storage.store import get_store
+from app.utils.briefing import BriefingIndex, get_briefings
+from app.utils.cache import EntityCache, get_cache
 
 router = APIRouter()
 
-# Neo4j driver initialization
-driver = get_driver()
-
-# Helper methods
-def remove_and_return(lst, element):
-    return [item for item in lst if item != element]
-
-def create_mentions_relationships(session, statement: Statement, mentioned_namedentity_ids: List[str]):
-    """Create MENTIONS relationships from the statement to the mentioned named entities."""
-    for mentioned_id in mentioned_namedentity_ids:
-        if named_entity_exists(driver, mentioned_id):
-            session.run("""
-                MATCH (s:Statement {statement_id: $statement_id}), 
-                      (m:NamedEntity {namedentity_id: $mentionedentity_id})
-                CREATE (s)-[:MENTIONS]->(m)
-            """, statement_id=statement.statement_id, mentionedentity_id=mentioned_id)
-
-
-def remove_mentions_relationships(session, statement_id: str):
-    """Remove MENTIONS relationships for a given statement."""
-    session.run("""
-        MATCH (s:Statement {statement_id: $statement_id})-[r:MENTIONS]->()
-        DELETE r
-    """, statement_id=statement_id)
-
-
-def create_additional_relations(session, source_statement: Statement):
-    mentioned_namedentities: List[NamedEntity] = get_mentioned_entities_for_statement(source_statement)
-    relationships: List[Relationship] = derive_relationships_from_statement(source_statement, mentioned_namedentities)
-    for relationship in relationships:
-        source_entity_id = relationship.from_node
-        target_entity_id = relationship.to_node
-        session.run(f"""
-                MATCH (e1:NamedEntity {{namedentity_id: $source_entity_id}}),
-                      (e2:NamedEntity {{namedentity_id: $target_entity_id}})
-                CREATE (e1)-[:{relationship.relationship_type} {{source_statement_id: $source_statement_id}}]->(e2)
-                CREATE (e2)-[:{relationship.relationship_type} {{source_statement_id: $source_statement_id}}]->(e1)
-            """, source_entity_id=source_entity_id, target_entity_id=target_entity_id, source_statement_id=source_statement.statement_id)
-
-    #"""Create connections of type relation_type between all named entities in the list."""
-    #for i, source_entity_id in enumerate(entity_ids):
-    #    for target_entity_id in entity_ids[i+1:]:
-    #        session.run(f"""
-    #            MATCH (e1:NamedEntity {{namedentity_id: $source_entity_id}}),
-    #                  (e2:NamedEntity {{namedentity_id: $target_entity_id}})
-    #            CREATE (e1)-[:{relation_type} {{source_statement_id: $source_statement_id}}]->(e2)
-    #            CREATE (e2)-[:{relation_type} {{source_statement_id: $source_statement_id}}]->(e1)
-    #        """, source_entity_id=source_entity_id, target_entity_id=target_entity_id, source_statement_id=source_statement.statement_id)
-
-
-def delete_statement_relationships(session, statement_id: str):
-    """Deletes relationships derived from a specific statement."""
-    session.run("""
-        MATCH ()-[r]->() 
-        WHERE r.source_statement_id = $statement_id
-        DELETE r
-    """, statement_id=statement_id)
-
-
-def handle_mentions(session, statement: Statement, mentioned_namedentity_ids: List[str]):
-    if mentioned_namedentity_ids:
-        # Create new MENTIONS relationships
-        create_mentions_relationships(session, statement, mentioned_namedentity_ids)
-
-        # Create additional SOME_RELATION relationships
-        create_additional_relations(session, statement)
-
-
-
-
-def delete_statement_by_id(statement_id: str):
-    try:
-        with driver.session() as session:
-            delete_statement_relationships(session, statement_id)
-            session.run("""
-                MATCH (s:Statement {statement_id: $statement_id})
-                DETACH DELETE s
-            """, statement_id=statement_id)
-        return {"message": "Statement deleted successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-
-def get_mentioned_entities_for_statement(statement: Statement):
-        with driver.session() as session:
-            result = session.run("""
-                MATCH (s:Statement {statement_id: $statement_id})-[:MENTIONS]->(m:NamedEntity)
-                RETURN m.name AS name, m.namedentity_id AS namedentity_id, labels(m) AS labels
-            """, statement_id=statement.statement_id)
-            
-            # Convert the result to a list of NamedEntity objects
-            namedentities = [
-                NamedEntity(name=record["name"], namedentity_id=record["namedentity_id"], additional_labels=remove_and_return(record["labels"],"NamedEntity"))
-                for record in result
-            ]
-        return namedentities
+# Number of statements sent per UNWIND query by /create_batch
+STATEMENT_BATCH_CHUNK_SIZE = int(os.getenv("STATEMENT_BATCH_CHUNK_SIZE", "500"))
 
 # Endpoints
 @router.post("/create/")
-def create(statement: Statement):
+async def create(statement: Statement, store: GraphStore = Depends(get_store), embedder: Embedder = Depends(get_embedder), briefings: BriefingIndex = Depends(get_briefings)):
     # Validate that the text is not empty
     if not statement.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
@@ -115,123 +25,208 @@ def create(statement: Statement):
     statement.statement_id = statement.statement_id or str(uuid4())
 
     try:
-        # Check if the main NamedEntity exists
-        if not named_entity_exists(driver, statement.about_namedentity_id):
-            raise HTTPException(status_code=404, detail="NamedEntity that the statement is about does not exist")
-
-        with driver.session() as session:
-            # Create the Statement
-            session.run("""
-                CREATE (s:Statement {text: $text, statement_id: $statement_id})
-            """, text=statement.text, statement_id=statement.statement_id)
-
-            # Create the relationship to the main NamedEntity
-            session.run("""
-                MATCH (s:Statement {statement_id: $statement_id}), 
-                      (p:NamedEntity {namedentity_id: $namedentity_id})
-                CREATE (s)-[:IS_ABOUT]->(p)
-            """, statement_id=statement.statement_id, namedentity_id=statement.about_namedentity_id)
-
-        return {"message": "Statement added successfully", "statement_id": statement.statement_id}
+        created = await store.create_statement(statement, await embed_one(embedder, statement.text))
+        if created:
+            await briefings.add_statements([{
+                "text": statement.text,
+                "statement_id": statement.statement_id,
+                "about_namedentity_id": statement.about_namedentity_id,
+                "mentioned_namedentity_ids": [],
+                "topic_id": None,
+            }])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not created:
+        raise HTTPException(status_code=404, detail="NamedEntity that the statement is about does not exist")
+    return {"message": "Statement added successfully", "statement_id": statement.statement_id}
+
+
+@router.post("/create_batch/", response_model=List[StatementBatchResult], description="Create many statements with their mentions and topics in one write transaction.")
+async def create_batch(
+    items: List[StatementBatchItem],
+    chunk_size: int = Query(default=STATEMENT_BATCH_CHUNK_SIZE, gt=0),
+    store: GraphStore = Depends(get_store),
+    derivation: DerivationPipeline = Depends(get_derivation_pipeline),
+    embedder: Embedder = Depends(get_embedder),
+    briefings: BriefingIndex = Depends(get_briefings)
+):
+    results = []
+    rows = []
+    seen_ids = set()
+    for item in items:
+        statement = item.statement
+        statement.statement_id = statement.statement_id or str(uuid4())
+        if not statement.text.strip():
+            results.append(StatementBatchResult(statement_id=statement.statement_id, created=False, detail="Text cannot be empty"))
+        elif statement.statement_id in seen_ids:
+            results.append(StatementBatchResult(statement_id=statement.statement_id, created=False, detail="Duplicate statement_id in batch"))
+        else:
+            # Placeholder, replaced by the result of the transaction below
+            results.append(None)
+            rows.append({
+                "text": statement.text,
+                "statement_id": statement.statement_id,
+                "about_namedentity_id": statement.about_namedentity_id,
+                "mentioned_namedentity_ids": list(dict.fromkeys(item.mentioned_namedentity_ids or [])),
+                "topic_id": item.topic_id if item.topic_id and item.topic_id.strip() else None,
+            })
+        seen_ids.add(statement.statement_id)
+
+    try:
+        # All texts of the batch are embedded in one call
+        embeddings = await embedder.embed([row["text"] for row in rows]) if rows else []
+        for row, embedding in zip(rows, embeddings):
+            row["embedding"] = embedding.tolist()
+        created = await store.create_statements_batch(rows, chunk_size)
+        # The briefings count the mentions and topics that resolved
+        await briefings.add_statements([
+            {**row, "mentioned_namedentity_ids": created[row["statement_id"]].mentioned_namedentity_ids, "topic_id": created[row["statement_id"]].topic_id}
+            for row in rows if created[row["statement_id"]].created
+        ])
+        # Relationships are derived from the mentions in the background
+        job_ids = await derivation.enqueue([statement_id for statement_id, result in created.items() if result.created and result.mentioned_namedentity_ids])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    for statement_id, job_id in job_ids.items():
+        created[statement_id].derivation_job_id = job_id
+
+    pending = iter(rows)
+    return [result if result is not None else created[next(pending)["statement_id"]] for result in results]
 
 
 @router.get("/read/", response_model=Statement, description="Get a statement based on its ID.")
-def read_statement(statement_id: str):
-    statement = get_statement_by_id(driver, statement_id)
+async def read_statement(statement_id: str, store: GraphStore = Depends(get_store), cache: EntityCache = Depends(get_cache)):
+    statement = await cache.get_or_load(
+        "statement", statement_id,
+        lambda: store.get_statement_by_id(statement_id)
+    )
     if statement is None:
         raise HTTPException(status_code=404, detail="Statement not found")
-    raise HTTPException(status_code=404, detail="Statement not found")
+    return statement
 
 
 @router.post("/get_mentions/")
-def get_mentions(statement_id: str)  -> List[NamedEntity]:
-    statement = get_statement_by_id(driver, statement_id)
-    if statement is None:
-        raise HTTPException(status_code=404, detail="Statement not found")
+async def get_mentions(statement_id: str, store: GraphStore = Depends(get_store)) -> List[NamedEntity]:
     try:
-        get_mentioned_entities_for_statement(statement)
+        mentioned = await store.get_mentioned_entities(statement_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+    if mentioned is None:
+        raise HTTPException(status_code=404, detail="Statement not found")
+    return mentioned
+
 
 @router.post("/set_topic/")
-def set_topic(statement_id: str, topic_id: Optional[str] = None):
-    statement = get_statement_by_id(driver, statement_id)
-    if statement is None:
-        raise HTTPException(status_code=404, detail="Statement not found")
+async def set_topic(statement_id: str, topic_id: Optional[str] = None, store: GraphStore = Depends(get_store), briefings: BriefingIndex = Depends(get_briefings)):
+    # Only set a new topic if topic_id is provided and not empty
+    has_topic = bool(topic_id and topic_id.strip())
     try:
-        with driver.session() as session:
-            # Step 1: Remove existing HAS_TOPIC relationships from the statement
-            session.run("""
-                MATCH (s:Statement {statement_id: $statement_id})-[r:HAS_TOPIC]->(t:Topic)
-                DELETE r
-            """, statement_id=statement.statement_id)
-
-            # Step 2: If topic_id is provided and not empty, create a new HAS_TOPIC relationship to the specified topic
-            if topic_id and topic_id.strip():  # Check if topic_id is not empty
-                session.run("""
-                    MATCH (s:Statement {statement_id: $statement_id}),
-                          (t:Topic {topic_id: $topic_id})
-                    CREATE (s)-[:HAS_TOPIC]->(t)
-                """, statement_id=statement.statement_id, topic_id=topic_id)
-
-        return {"message": "Topic set successfully for the statement" if topic_id and topic_id.strip() else "Topic removed from the statement"}
+        found = await store.set_topic(statement_id, topic_id if has_topic else None)
+        if found:
+            await briefings.set_topic(statement_id, topic_id if has_topic else None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="Statement not found")
+    return {"message": "Topic set successfully for the statement" if has_topic else "Topic removed from the statement"}
 
 
-
-@router.post("/add_mentions/")
-def add_mentions(mentioned_namedentity_ids: List[str] = Query(...), statement_id: str = Query(...)):
-    statement = get_statement_by_id(statement_id)
-    if statement is None:
-        raise HTTPException(status_code=404, detail="Statement not found")
+async def change_mentions(store: GraphStore, derivation: DerivationPipeline, briefings: BriefingIndex, statement_id: str, mentioned_namedentity_ids: List[str], replace: bool) -> dict:
+    """Update the mentions and queue the derivation of the relationships from them. Returns the mentions and the job_id."""
     try:
-        with driver.session() as session:
-            handle_mentions(session, statement, mentioned_namedentity_ids)
-
-        return {"message": "Mentions added successfully"}
+        mentions = await store.update_mentions(statement_id, mentioned_namedentity_ids, replace)
+        job_id = None
+        if mentions is not None:
+            await briefings.set_mentions(statement_id, mentions["mentioned_namedentity_ids"], replace)
+        if mentions is not None and (replace or mentions["mentioned_namedentity_ids"]):
+            job_id = (await derivation.enqueue([statement_id]))[statement_id]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/update_mentions/")
-def update_mentions(mentioned_namedentity_ids: List[str] = Query(...), statement_id: str = Query(...)):
-    statement = get_statement_by_id(driver, statement_id)
-    if statement is None:
+    if mentions is None:
         raise HTTPException(status_code=404, detail="Statement not found")
+    return {**mentions, "derivation_job_id": job_id}
+
+
+@router.post("/add_mentions/", description="Add mentions to a statement. The relationships derived from them are written in the background; poll `/statement/derivation_job/` with the returned `derivation_job_id`.")
+async def add_mentions(
+    mentioned_namedentity_ids: List[str] = Query(...),
+    statement_id: str = Query(...),
+    store: GraphStore = Depends(get_store),
+    derivation: DerivationPipeline = Depends(get_derivation_pipeline),
+    briefings: BriefingIndex = Depends(get_briefings)
+):
+    mentions = await change_mentions(store, derivation, briefings, statement_id, mentioned_namedentity_ids, False)
+    return {"message": "Mentions added successfully", **mentions}
+
+
+@router.post("/update_mentions/", description="Replace the mentions of a statement. The relationships derived from them are replaced in the background; poll `/statement/derivation_job/` with the returned `derivation_job_id`.")
+async def update_mentions(
+    mentioned_namedentity_ids: List[str] = Query(...),
+    statement_id: str = Query(...),
+    store: GraphStore = Depends(get_store),
+    derivation: DerivationPipeline = Depends(get_derivation_pipeline),
+    briefings: BriefingIndex = Depends(get_briefings)
+):
+    mentions = await change_mentions(store, derivation, briefings, statement_id, mentioned_namedentity_ids, True)
+    return {"message": "Mentions updated successfully", **mentions}
+
+
+@router.get("/derivation_job/", response_model=DerivationJob, description="Get the status of a background derivation job.")
+async def derivation_job(job_id: str, derivation: DerivationPipeline = Depends(get_derivation_pipeline)):
     try:
-        with driver.session() as session:
-            # Remove existing MENTIONS relationships
-            remove_mentions_relationships(session, statement.statement_id)
-            
-            # Remove all previous relationships between entities that had been connected by the mentions
-            delete_statement_relationships(session, statement.statement_id)
-
-            # Handle the new mentions and derived relationships
-            handle_mentions(session, statement, mentioned_namedentity_ids)
-
-        return {"message": "Mentions updated successfully"}
+        job = await derivation.get_job(job_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Derivation job not found")
+    return job
+
+
+@router.get("/similar/", response_model=List[SimilarStatement], description="The statements most similar in meaning to a text (q) or to another statement (statement_id), best first. With about_namedentity_id only statements about that entity are considered.")
+async def similar(
+    q: Optional[str] = Query(default=None, min_length=1),
+    statement_id: Optional[str] = None,
+    about_namedentity_id: Optional[str] = None,
+    k: int = Query(default=10, gt=0, le=100),
+    store: GraphStore = Depends(get_store),
+    embedder: Embedder = Depends(get_embedder)
+):
+    if (q is None) == (statement_id is None):
+        raise HTTPException(status_code=400, detail="Pass either q or statement_id")
+    try:
+        text = q
+        if statement_id is not None:
+            statement = await store.get_statement_by_id(statement_id)
+            text = statement.text if statement is not None else None
+        similar_statements = None
+        if text is not None:
+            similar_statements = await store.similar_statements(await embed_one(embedder, text), k, about_namedentity_id, statement_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if text is None:
+        raise HTTPException(status_code=404, detail="Statement not found")
+    if similar_statements is None:
+        raise HTTPException(status_code=404, detail="NamedEntity not found")
+    return similar_statements
 
 
 @router.post("/update_text/")
-def update_text(statement_id: str, new_text: str):
+async def update_text(statement_id: str, new_text: str, store: GraphStore = Depends(get_store), cache: EntityCache = Depends(get_cache), embedder: Embedder = Depends(get_embedder), briefings: BriefingIndex = Depends(get_briefings)):
     try:
-        with driver.session() as session:
-            session.run("""
-                MATCH (s:Statement {statement_id: $statement_id})
-                SET s.text = $new_text
-            """, statement_id=statement_id, new_text=new_text)
-        return {"message": "Statement text updated successfully"}
+        if await store.update_text(statement_id, new_text, await embed_one(embedder, new_text)):
+            await briefings.set_text(statement_id, new_text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    await cache.invalidate("statement", statement_id)
+    return {"message": "Statement text updated successfully"}
 
 
 @router.post("/delete/")
-def delete_statement(statement_id: str):
-    return delete_statement_by_id(statement_id)
-
+async def delete_statement(statement_id: str, store: GraphStore = Depends(get_store), cache: EntityCache = Depends(get_cache), briefings: BriefingIndex = Depends(get_briefings)):
+    try:
+        await store.delete_statement(statement_id)
+        await briefings.remove_statements([statement_id])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    await cache.invalidate("statement", statement_id)
+    return {"message": "Statement deleted successfully"}
@@ -0,0 +1,113 @@
+"""Cache of derivation results in a local SQLite file, keyed by a hash of everything the derivation sees.
+
+Entries omit source_statement_id, so statements with the same content share them. The least
+recently used entries are evicted beyond ``max_bytes``.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+from app.models import NamedEntity, Relationship, RelationshipAttributes, Statement
+from app.utils.metrics import DERIVATION_CACHE_EVICTIONS, DERIVATION_CACHE_HITS, DERIVATION_CACHE_MISSES
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS derivations (
+        key TEXT PRIMARY KEY,
+        relationships TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS derivations_last_used ON derivations (last_used);
+"""
+
+
+def derivation_key(version: str, statement: Statement, about_namedentity: NamedEntity, mentioned_namedentities: List[NamedEntity]) -> str:
+    content = json.dumps([
+        version,
+        hashlib.sha256(statement.text.encode()).hexdigest(),
+        [about_namedentity.namedentity_id, about_namedentity.name],
+        sorted([entity.namedentity_id, entity.name] for entity in mentioned_namedentities),
+    ])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class DerivationCache:
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._size = self._connection.execute("SELECT coalesce(sum(size), 0) FROM derivations").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+        """The cached (from_node, relationship_type, to_node) lists of the keys that are in the cache."""
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT key, relationships FROM derivations WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ).fetchall()
+            self._connection.executemany("UPDATE derivations SET last_used = ? WHERE key = ?", [(time.time(), key) for key, _ in rows])
+        found = {key: [tuple(relationship) for relationship in json.loads(relationships)] for key, relationships in rows}
+        DERIVATION_CACHE_HITS.inc(len(found))
+        DERIVATION_CACHE_MISSES.inc(len(keys) - len(found))
+        return found
+
+    def put_many(self, entries: Dict[str, List[Tuple[str, str, str]]]):
+        """Store derivation results, then evict the least recently used ones beyond max_bytes."""
+        now = time.time()
+        rows = [(key, json.dumps(relationships)) for key, relationships in entries.items()]
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for key, relationships in rows:
+                    previous = self._connection.execute("SELECT size FROM derivations WHERE key = ?", (key,)).fetchone()
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO derivations (key, relationships, size, last_used) VALUES (?, ?, ?, ?)",
+                        (key, relationships, len(key) + len(relationships), now),
+                    )
+                    self._size += len(key) + len(relationships) - (previous[0] if previous else 0)
+                if self._size > self.max_bytes:
+                    self._evict()
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                self._size = self._connection.execute("SELECT coalesce(sum(size), 0) FROM derivations").fetchone()[0]
+                raise
+            self._connection.execute("COMMIT")
+
+    def _evict(self):
+        # Evicts down to 90% of the bound, so a full cache does not evict on every write
+        target = self.max_bytes * 0.9
+        evicted = []
+        cursor = self._connection.execute("SELECT key, size FROM derivations ORDER BY last_used")
+        for key, size in cursor:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        cursor.close()
+        self._connection.executemany("DELETE FROM derivations WHERE key = ?", evicted)
+        DERIVATION_CACHE_EVICTIONS.inc(len(evicted))
+
+    def size(self) -> int:
+        """Bytes of cached keys and results."""
+        return self._size
+
+
+def cached_relationships(statement: Statement, cached: List[Tuple[str, str, str]]) -> List[Relationship]:
+    return [
+        Relationship(from_node=from_node, to_node=to_node, relationship_type=relationship_type, attributes=RelationshipAttributes(source_statement_id=statement.statement_id))
+        for from_node, relationship_type, to_node in cached
+    ]
+
+
+def cache_entry(relationships: List[Relationship]) -> List[Tuple[str, str, str]]:
+    return [(relationship.from_node, relationship.relationship_type, relationship.to_node) for relationship in relationships]
@@ -0,0 +1,110 @@
+"""Embeddings of statement texts for /statement/similar.
+
+The default HashingEmbedder needs no model: it hashes words and their character trigrams,
+so texts sharing words or word stems ("married", "marriage") end up close.
+"""
+import asyncio
+import importlib
+import logging
+import math
+import os
+import re
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import List
+import numpy as np
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+# Statements embedded per transaction by the backfill
+BACKFILL_BATCH_SIZE = 500
+
+
+class Embedder(ABC):
+    """Turns texts into vectors; similar texts should get a high cosine similarity."""
+
+    dimensions: int
+
+    async def open(self):
+        """Load the model before the first text."""
+
+    async def close(self):
+        """Release what open acquired."""
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """One L2-normalized float32 row of ``dimensions`` values per text, in order."""
+
+
+class HashingEmbedder(Embedder):
+    # Trigrams add stems to the whole words, but count less so that shared words dominate
+    TRIGRAM_WEIGHT = 0.5
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        for word in re.findall(r"\w+", text.lower()):
+            features["w:" + word] += 1
+            padded = f"<{word}>"
+            for start in range(len(padded) - 2):
+                features["t:" + padded[start:start + 3]] += self.TRIGRAM_WEIGHT
+        return features
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets, weights = [], []
+            for feature, count in self._features(text or "").items():
+                # crc32 rather than hash(), which is randomized per process; the top bit picks the sign
+                # so that colliding features cancel out instead of adding up
+                hashed = zlib.crc32(feature.encode())
+                buckets.append(hashed % self.dimensions)
+                weights.append((1 if hashed & 0x80000000 else -1) * (1 + math.log(count)))
+            # One vectorized scatter-add per text instead of a NumPy call per feature
+            vectors[row] = np.bincount(buckets, weights, minlength=self.dimensions)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def load_embedder(name: str, dimensions: int) -> Embedder:
+    """Create the embedder named by EMBEDDER: ``hashing`` or the ``module:ClassName`` of an Embedder."""
+    if name == "hashing":
+        return HashingEmbedder(dimensions)
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown EMBEDDER {name!r}, expected hashing or module:ClassName")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def create_embedder() -> Embedder:
+    return load_embedder(os.getenv("EMBEDDER", "hashing"), int(os.getenv("EMBEDDING_DIMENSIONS", "256")))
+
+
+def get_embedder(request: Request) -> Embedder:
+    return request.app.state.embedder
+
+
+async def embed_one(embedder: Embedder, text: str) -> List[float]:
+    return (await embedder.embed([text]))[0].tolist()
+
+
+async def backfill_embeddings(store, embedder: Embedder, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Embed the statements that have no embedding of the embedder's size. Returns how many."""
+    embedded, after = 0, None
+    while True:
+        texts = await store.get_statements_to_embed(embedder.dimensions, after, batch_size)
+        if not texts:
+            break
+        after = texts[-1][0]
+        vectors = await embedder.embed([text for _, text in texts])
+        await store.set_statement_embeddings({statement_id: vector.tolist() for (statement_id, _), vector in zip(texts, vectors)})
+        embedded += len(texts)
+        # Yield to requests between batches
+        await asyncio.sleep(0)
+    if embedded:
+        logger.info("Embedded %d statements", embedded)
+    return embedded
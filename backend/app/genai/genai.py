@@ -1,20 +1,25 @@
-
-
+import importlib
+from abc import ABC, abstractmethod
 from app.models import Statement, NamedEntity, Relationship, RelationshipAttributes
-from typing import List
+from typing import List, Tuple
 
-from app.utils.neo4j import get_driver, get_namedentity_by_id
+# What a derivation needs to know about one statement: the statement, its about-entity and its mentioned entities
+DerivationInput = Tuple[Statement, NamedEntity, List[NamedEntity]]
 
-# Neo4j driver initialization
-driver = get_driver()
+# Relationship types that are derived from statements and carry a source_statement_id.
+# Every type needs a source_statement_id index, so adding one here requires a schema migration (app/db/migrations.py).
+DERIVED_RELATIONSHIP_TYPES = ("SOME_RELATION", "MARRIED_TO")
+
+# Identifies the model and prompt behind derive_relationships_from_statement. Derivation results are cached by
+# content (app/genai/cache.py), so change this whenever the derivation could give a different result for the same input.
+DERIVATION_VERSION = "pairwise-some-relation-1"
 
 def is_uppercase_and_underscore(s: str):
     return not s.isupper() or not all(c.isalpha() or c == '_' for c in s)
 
-def derive_relationships_from_statement(statement: Statement, mentioned_namedentities: List[NamedEntity]) -> List[Relationship]:
+def derive_relationships_from_statement(statement: Statement, about_namedentity: NamedEntity, mentioned_namedentities: List[NamedEntity]) -> List[Relationship]:
 
     text = statement.about_namedentity_id
-    about_namedentity: NamedEntity = get_namedentity_by_id(driver, statement.about_namedentity_id)
 
     # Construct prompt
     # Derive List[Relationship]
@@ -37,4 +42,39 @@ def derive_relationships_from_statement(statement: Statement, mentioned_namedent
             )
             relationships.append(relationship)
 
-    return relationships
\ No newline at end of file
+    return relationships
+
+
+class DerivationBackend(ABC):
+    """A model deriving relationships, called by app/genai/scheduler.py with whole batches of statements."""
+
+    # Part of the key of cached results (app/genai/cache.py); change it whenever the results could change
+    version: str = DERIVATION_VERSION
+
+    async def open(self):
+        """Connect to the model before the first batch."""
+
+    async def close(self):
+        """Release what open acquired."""
+
+    @abstractmethod
+    async def derive_batch(self, inputs: List[DerivationInput]) -> List[List[Relationship]]:
+        """Derive the relationships of every input in one call; one list of relationships per input, in order."""
+
+
+class StubDerivationBackend(DerivationBackend):
+    """Deterministic local backend: relates every pair of entities of a statement, see derive_relationships_from_statement."""
+
+    async def derive_batch(self, inputs: List[DerivationInput]) -> List[List[Relationship]]:
+        return [derive_relationships_from_statement(*statement_inputs) for statement_inputs in inputs]
+
+
+def load_backend(name: str) -> DerivationBackend:
+    """Create the backend named by DERIVATION_BACKEND: ``stub`` or the ``module:ClassName`` of a DerivationBackend."""
+    if name == "stub":
+        return StubDerivationBackend()
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown DERIVATION_BACKEND {name!r}, expected stub or module:ClassName")
+    backend_class = getattr(importlib.import_module(module_name), class_name)
+    return backend_class()
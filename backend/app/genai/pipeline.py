@@ -0,0 +1,397 @@
+"""Background derivation of relationships from the mentions of statements.
+
+Jobs are kept in a SQLite file and processed by asyncio workers. A statement has at most one
+queued job, and a job is not started while another for its statement runs; a running job
+whose statement was queued again discards its result (``superseded``). Claimed jobs are
+leased to their process, so several processes can share the file.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+from fastapi import Request
+from app.genai.cache import DerivationCache, cache_entry, cached_relationships, derivation_key
+from app.genai.genai import DerivationInput, load_backend
+from app.genai.scheduler import BatchScheduler
+from app.models import DerivationJob, Relationship
+from app.utils.metrics import DERIVATION_JOBS, DERIVATION_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle worker waits before looking for claimable jobs without being woken up
+POLL_INTERVAL = 1.0
+# Seconds a claimed job stays with its process without a renewal; renewed every third of it
+DERIVATION_JOB_LEASE = float(os.getenv("DERIVATION_JOB_LEASE", "60"))
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS derivation_jobs (
+        job_id TEXT PRIMARY KEY,
+        statement_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        relationships_written INTEGER,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        owner TEXT,
+        lease_expires_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS derivation_jobs_status ON derivation_jobs (status, created_at);
+    CREATE INDEX IF NOT EXISTS derivation_jobs_statement ON derivation_jobs (statement_id, status);
+"""
+
+
+class DerivationQueue:
+    """The persistent job table. The methods block on SQLite, so the pipeline calls them in a thread."""
+
+    def __init__(self, path: str, lease: float = DERIVATION_JOB_LEASE):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # Identifies the jobs this queue claimed among those of other processes on the same file
+        self.owner = str(uuid4())
+        self.lease = lease
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(derivation_jobs)")}
+            # Files created before jobs were leased
+            for column, column_type in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE derivation_jobs ADD COLUMN {column} {column_type}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def enqueue(self, statement_ids: List[str]) -> Dict[str, str]:
+        """Queue a job per statement unless one is queued already. Returns the job_id per statement_id."""
+        now = time.time()
+        job_ids = {}
+        with self._transaction() as connection:
+            for statement_id in dict.fromkeys(statement_ids):
+                row = connection.execute(
+                    "SELECT job_id FROM derivation_jobs WHERE statement_id = ? AND status = 'queued'", (statement_id,)
+                ).fetchone()
+                if row is not None:
+                    job_ids[statement_id] = row["job_id"]
+                    continue
+                job_ids[statement_id] = str(uuid4())
+                connection.execute(
+                    "INSERT INTO derivation_jobs (job_id, statement_id, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                    (job_ids[statement_id], statement_id, now, now),
+                )
+        return job_ids
+
+    def claim(self, limit: int) -> List[Tuple[str, str]]:
+        """Mark up to limit of the oldest queued jobs as running, leased to this queue, and return their (job_id, statement_id).
+
+        Jobs of statements that have a running job are left in the queue until it finished.
+        """
+        with self._transaction() as connection:
+            rows = connection.execute("""
+                SELECT job_id, statement_id FROM derivation_jobs AS job
+                WHERE status = 'queued' AND NOT EXISTS (
+                    SELECT 1 FROM derivation_jobs AS running
+                    WHERE running.statement_id = job.statement_id AND running.status = 'running'
+                )
+                ORDER BY created_at
+                LIMIT ?
+            """, (limit,)).fetchall()
+            now = time.time()
+            connection.executemany(
+                "UPDATE derivation_jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_expires_at = ?, updated_at = ? WHERE job_id = ?",
+                [(self.owner, now + self.lease, now, row["job_id"]) for row in rows],
+            )
+        return [(row["job_id"], row["statement_id"]) for row in rows]
+
+    def queued_statements(self, statement_ids: List[str]) -> Set[str]:
+        """The statements among statement_ids that have a queued job."""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT statement_id FROM derivation_jobs WHERE status = 'queued' AND statement_id IN ({', '.join('?' * len(statement_ids))})",
+                statement_ids,
+            ).fetchall()
+        return {row["statement_id"] for row in rows}
+
+    def renew(self):
+        """Extend the leases of the running jobs of this queue."""
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE derivation_jobs SET lease_expires_at = ? WHERE owner = ? AND status = 'running'",
+                (now + self.lease, self.owner),
+            )
+
+    def finish(self, results: List[Tuple[str, str, Optional[int]]]):
+        """Store the final (job_id, status, relationships_written) of several jobs.
+
+        Jobs this queue lost the lease of are left to the process that took them over.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE derivation_jobs SET status = ?, relationships_written = ?, error = NULL, updated_at = ? "
+                "WHERE job_id = ? AND owner = ? AND status = 'running'",
+                [(status, relationships_written, now, job_id, self.owner) for job_id, status, relationships_written in results],
+            )
+
+    def retry_or_fail(self, job_id: str, error: str, max_attempts: int) -> Optional[str]:
+        """Queue a failed job again, unless it ran max_attempts times or a newer job for its statement is queued.
+
+        Returns the new status, or None if this queue lost the lease of the job.
+        """
+        with self._transaction() as connection:
+            job = connection.execute(
+                "SELECT statement_id, attempts FROM derivation_jobs WHERE job_id = ? AND owner = ? AND status = 'running'", (job_id, self.owner)
+            ).fetchone()
+            if job is None:
+                return None
+            newer = connection.execute(
+                "SELECT 1 FROM derivation_jobs WHERE statement_id = ? AND status = 'queued'", (job["statement_id"],)
+            ).fetchone()
+            status = "superseded" if newer else "failed" if job["attempts"] >= max_attempts else "queued"
+            connection.execute(
+                "UPDATE derivation_jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, time.time(), job_id),
+            )
+        return status
+
+    @staticmethod
+    def _requeue(connection, condition: str, parameters: tuple) -> int:
+        # Jobs whose statement was queued again meanwhile are superseded by that job instead
+        connection.execute(f"""
+            UPDATE derivation_jobs SET status = 'superseded', owner = NULL, lease_expires_at = NULL
+            WHERE status = 'running' AND {condition} AND EXISTS (
+                SELECT 1 FROM derivation_jobs AS queued
+                WHERE queued.statement_id = derivation_jobs.statement_id AND queued.status = 'queued'
+            )
+        """, parameters)
+        return connection.execute(
+            f"UPDATE derivation_jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL WHERE status = 'running' AND {condition}",
+            parameters,
+        ).rowcount
+
+    def recover(self) -> int:
+        """Queue the running jobs whose lease expired, i.e. whose process stopped, again. Returns how many."""
+        with self._transaction() as connection:
+            # Jobs without a lease were claimed before leases existed
+            return self._requeue(connection, "coalesce(lease_expires_at, 0) < ?", (time.time(),))
+
+    def release(self) -> int:
+        """Queue the running jobs of this queue again, when its workers stop. Returns how many."""
+        with self._transaction() as connection:
+            return self._requeue(connection, "owner = ?", (self.owner,))
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated before older_than (epoch seconds)."""
+        with self._transaction() as connection:
+            return connection.execute(
+                "DELETE FROM derivation_jobs WHERE status IN ('done', 'superseded', 'failed') AND updated_at < ?", (older_than,)
+            ).rowcount
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._connection.execute("SELECT * FROM derivation_jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM derivation_jobs WHERE status = 'queued'").fetchone()[0]
+
+
+async def derive_relationships(inputs: Dict[str, DerivationInput], scheduler: BatchScheduler, cache: Optional[DerivationCache] = None) -> Dict[str, List[Relationship]]:
+    """Derive the relationships of several statements from their (statement, about-entity, mentioned entities).
+
+    With a cache, statements with the same content as an earlier derivation are answered from it
+    and only the others are derived (and added to it).
+    """
+    if cache is None or not inputs:
+        derived = await scheduler.derive_many(list(inputs.values()))
+        return dict(zip(inputs, derived))
+    keys = {statement_id: derivation_key(scheduler.backend.version, *statement_inputs) for statement_id, statement_inputs in inputs.items()}
+    cached = await asyncio.to_thread(cache.get_many, list(keys.values()))
+    relationships = {
+        statement_id: cached_relationships(statement_inputs[0], cached[keys[statement_id]])
+        for statement_id, statement_inputs in inputs.items() if keys[statement_id] in cached
+    }
+    missing = [statement_id for statement_id in inputs if statement_id not in relationships]
+    if missing:
+        derived = await scheduler.derive_many([inputs[statement_id] for statement_id in missing])
+        relationships.update(zip(missing, derived))
+        await asyncio.to_thread(cache.put_many, {keys[statement_id]: cache_entry(relationships[statement_id]) for statement_id in missing})
+    return relationships
+
+
+class DerivationPipeline:
+    def __init__(self, store, queue: DerivationQueue, scheduler: BatchScheduler, workers: int, batch_size: int, max_attempts: int, retention: float, cache: Optional[DerivationCache] = None):
+        self.store = store
+        self.queue = queue
+        self.scheduler = scheduler
+        self.cache = cache
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._last_maintenance = 0.0
+
+    async def start(self):
+        await self._recover()
+        await self.scheduler.start()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._renew_leases()))
+
+    async def stop(self):
+        """Stop the workers and queue the jobs they were running again."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.scheduler.stop()
+        released = await asyncio.to_thread(self.queue.release)
+        if released:
+            logger.info("Queued %d interrupted derivation jobs again", released)
+        self.queue.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def enqueue(self, statement_ids: List[str]) -> Dict[str, str]:
+        """Queue the derivation of the relationships of the statements. Returns the job_id per statement_id."""
+        if not statement_ids:
+            return {}
+        job_ids = await asyncio.to_thread(self.queue.enqueue, statement_ids)
+        self._wakeup.set()
+        return job_ids
+
+    async def get_job(self, job_id: str) -> Optional[DerivationJob]:
+        row = await asyncio.to_thread(self.queue.get, job_id)
+        if row is None:
+            return None
+        return DerivationJob(
+            job_id=row["job_id"],
+            statement_id=row["statement_id"],
+            status=row["status"],
+            attempts=row["attempts"],
+            relationships_written=row["relationships_written"],
+            error=row["error"],
+            created_at=datetime.fromtimestamp(row["created_at"], timezone.utc),
+            updated_at=datetime.fromtimestamp(row["updated_at"], timezone.utc),
+        )
+
+    async def _work(self):
+        while True:
+            # Cleared before claiming, so an enqueue that happens while claiming still wakes this worker
+            self._wakeup.clear()
+            try:
+                jobs = await asyncio.to_thread(self.queue.claim, self.batch_size)
+                DERIVATION_QUEUE_DEPTH.set(await asyncio.to_thread(self.queue.depth))
+                if jobs:
+                    await self._process(jobs)
+                    # Jobs of these statements may have been waiting for this batch to finish
+                    self._wakeup.set()
+                    continue
+                await self._maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Derivation worker failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process(self, jobs: List[Tuple[str, str]]):
+        statement_ids = [statement_id for _, statement_id in jobs]
+        try:
+            inputs = await self.store.get_derivation_inputs(statement_ids)
+            relationships = await derive_relationships(inputs, self.scheduler, self.cache)
+            superseded = await asyncio.to_thread(self.queue.queued_statements, statement_ids)
+            current_ids = [statement_id for statement_id in statement_ids if statement_id not in superseded]
+            # Statements deleted in the meantime have no inputs; replacing their relationships by none is harmless
+            await self.store.replace_derived_relationships(
+                current_ids,
+                [relationship for statement_id in current_ids for relationship in relationships.get(statement_id, [])],
+            )
+        except Exception as e:
+            logger.exception("Deriving the relationships of %d statements failed", len(jobs))
+            for job_id, _ in jobs:
+                status = await asyncio.to_thread(self.queue.retry_or_fail, job_id, str(e), self.max_attempts)
+                if status is not None:
+                    DERIVATION_JOBS.labels(status="retried" if status == "queued" else status).inc()
+            return
+
+        results = [
+            (job_id, "superseded", None) if statement_id in superseded else (job_id, "done", len(relationships.get(statement_id, [])))
+            for job_id, statement_id in jobs
+        ]
+        await asyncio.to_thread(self.queue.finish, results)
+        for _, status, _ in results:
+            DERIVATION_JOBS.labels(status=status).inc()
+
+    async def _recover(self):
+        recovered = await asyncio.to_thread(self.queue.recover)
+        if recovered:
+            logger.info("Queued %d derivation jobs of stopped processes again", recovered)
+            self._wakeup.set()
+
+    async def _maintain(self):
+        """Take over the jobs of stopped processes and delete finished jobs after the retention period, at most once a minute."""
+        now = time.time()
+        if now - self._last_maintenance < 60:
+            return
+        self._last_maintenance = now
+        await self._recover()
+        purged = await asyncio.to_thread(self.queue.purge, now - self.retention)
+        if purged:
+            logger.info("Deleted %d finished derivation jobs", purged)
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.queue.lease / 3)
+            try:
+                await asyncio.to_thread(self.queue.renew)
+            except Exception:
+                logger.exception("Renewing the leases of derivation jobs failed")
+
+
+def create_derivation_pipeline(store) -> DerivationPipeline:
+    cache_path = os.getenv("DERIVATION_CACHE_PATH", "derivation_cache.sqlite3")
+    return DerivationPipeline(
+        store,
+        DerivationQueue(os.getenv("DERIVATION_QUEUE_PATH", "derivation_jobs.sqlite3"), DERIVATION_JOB_LEASE),
+        BatchScheduler(
+            load_backend(os.getenv("DERIVATION_BACKEND", "stub")),
+            max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "32")),
+            max_wait=float(os.getenv("INFERENCE_MAX_WAIT", "0.05")),
+            concurrency=int(os.getenv("INFERENCE_CONCURRENCY", "2")),
+        ),
+        workers=int(os.getenv("DERIVATION_WORKERS", "2")),
+        batch_size=int(os.getenv("DERIVATION_BATCH_SIZE", "50")),
+        max_attempts=int(os.getenv("DERIVATION_MAX_ATTEMPTS", "3")),
+        retention=float(os.getenv("DERIVATION_JOB_RETENTION", "86400")),
+        # An empty path disables the cache
+        cache=DerivationCache(cache_path, int(os.getenv("DERIVATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))) if cache_path else None,
+    )
+
+
+def get_derivation_pipeline(request: Request) -> DerivationPipeline:
+    return request.app.state.derivation
@@ -0,0 +1,103 @@
+"""Micro-batching of derivation requests.
+
+Callers ask for the relationships of single statements; the scheduler collects pending requests
+into batches and sends each batch to the DerivationBackend in one call. A batch is dispatched as
+soon as it holds ``max_batch_size`` requests or ``max_wait`` seconds after its first request
+arrived, whichever comes first, so a lone request is delayed by at most ``max_wait`` while a
+burst (an import, a large create_batch) costs one model call per ``max_batch_size`` statements.
+Up to ``concurrency`` batches are in flight at once; collecting continues meanwhile.
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+from app.genai.genai import DerivationBackend, DerivationInput
+from app.models import Relationship
+from app.utils.metrics import INFERENCE_BATCH_SIZE, INFERENCE_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    def __init__(self, backend: DerivationBackend, max_batch_size: int, max_wait: float, concurrency: int):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.concurrency = concurrency
+        self._pending: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._batches: set = set()
+
+    async def start(self):
+        await self.backend.open()
+        self._pending = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        """Stop dispatching. Requests that did not get their result yet are cancelled."""
+        tasks = [self._dispatcher, *self._batches] if self._dispatcher else []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        while self._pending is not None and not self._pending.empty():
+            _, future = self._pending.get_nowait()
+            future.cancel()
+        self._dispatcher = None
+        await self.backend.close()
+
+    async def derive(self, statement_inputs: DerivationInput) -> List[Relationship]:
+        """The relationships of one statement, derived as part of the next batch."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait((statement_inputs, future))
+        return await future
+
+    async def derive_many(self, inputs: List[DerivationInput]) -> List[List[Relationship]]:
+        """The relationships of several statements, in order. They may be split over or share batches with other callers."""
+        return list(await asyncio.gather(*(self.derive(statement_inputs) for statement_inputs in inputs)))
+
+    async def _dispatch(self):
+        while True:
+            batch = [await self._pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # Take what is already waiting without yielding, then wait for more until the deadline
+                if not self._pending.empty():
+                    batch.append(self._pending.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._pending.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[Tuple[DerivationInput, asyncio.Future]]):
+        try:
+            # Requests whose caller gave up are not sent to the model
+            batch = [(statement_inputs, future) for statement_inputs, future in batch if not future.done()]
+            if not batch:
+                return
+            INFERENCE_BATCH_SIZE.observe(len(batch))
+            try:
+                with INFERENCE_DURATION.time():
+                    results = await self.backend.derive_batch([statement_inputs for statement_inputs, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Derivation backend returned {len(results)} results for a batch of {len(batch)}")
+            except Exception as e:
+                logger.warning("Derivation batch of %d statements failed: %s", len(batch), e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), relationships in zip(batch, results):
+                if not future.done():
+                    future.set_result(relationships)
+        finally:
+            self._slots.release()
@@ -1,27 +1,122 @@
+import asyncio
 import os
-from fastapi import FastAPI
-from app.db.setup_db import is_database_empty, setup_database, fill_database_with_testdata
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse
+from prometheus_client import make_asgi_app
+from app.db.backup import create_backup
+from app.genai.embedding import backfill_embeddings, create_embedder
+from app.genai.pipeline import create_derivation_pipeline
+from app.models import Readiness
+from app.storage.store import create_store
+from app.utils.autocomplete import AutocompleteIndex, build_autocomplete_index
+from app.utils.briefing import create_briefing_index, rebuild_briefings
+from app.utils.cache import create_cache
+from app.utils.metrics import RequestMetrics
+from app.utils.startup import ReadinessGate, Startup, get_startup, retry_with_backoff
+from app.utils.statistics import create_graph_statistics
 from app.endpoints.general import router as general_router
 from app.endpoints.statement import router as statement_router
 from app.endpoints.namedentity import router as namedentity_router
 from app.endpoints.topic import router as topic_router
+from app.endpoints.search import router as search_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Only objects are created here; everything that needs the database runs in the startup steps below, in the
+    # background, so the server accepts connections at once and /ready tells when it can take requests.
+    # One graph store for the whole application (Neo4j or in-memory), handed to the routers via Depends(get_store)
+    app.state.store = create_store()
+    # Snapshots of the Neo4j graph plus the change log of the writes since (BACKUP_DIR)
+    app.state.backup = create_backup(app.state.store)
+    # Counts of /general/describe_graph and the listen_graph_* gauges, cached briefly and refreshed in the background
+    app.state.graph_statistics = create_graph_statistics(app.state.store)
+    # Read-through cache for lookups by ID, invalidated by the write endpoints
+    app.state.cache = create_cache()
+    # Type-ahead over entity names, kept up to date by the endpoints that create, rename or delete them
+    app.state.autocomplete = AutocompleteIndex()
+    # Briefings per NamedEntity, updated by the statement endpoints
+    app.state.briefings = create_briefing_index()
+    # Workers deriving relationships from the mentions of statements, fed by a persistent job queue
+    app.state.derivation = create_derivation_pipeline(app.state.store)
+    # Statement embeddings for /statement/similar
+    app.state.embedder = create_embedder()
+    background_tasks = []
 
-@app.on_event("startup")
-async def startup_event():
-    # Uncomment and modify as needed
-    # if is_database_empty():
-    #     setup_database()
-    #     fill_database_with_testdata()
-    pass
+    async def open_store():
+        # Opening the Neo4j store brings the schema (constraints and indexes) up to date, the in-memory store loads
+        # its snapshot. Retried until Neo4j can be reached
+        await retry_with_backoff(app.state.store.open, "Opening the graph store")
+
+    async def restore_backup():
+        # The newest snapshot is restored into an empty database before anything reads the graph
+        if app.state.backup is not None:
+            await app.state.backup.start()
+
+    async def fill_briefings():
+        # A new briefing file is filled from the store before requests are served, since a rebuild replaces
+        # whatever the endpoints wrote in the meantime
+        if await app.state.briefings.is_empty():
+            await rebuild_briefings(app.state.store, app.state.briefings)
+
+    async def start_workers():
+        await app.state.derivation.start()
+        app.state.graph_statistics.start()
+        # Statements that have no embedding yet are embedded in the background
+        background_tasks.append(asyncio.create_task(backfill_embeddings(app.state.store, app.state.embedder)))
+
+    app.state.startup = Startup(app.state.store, [
+        ("store", open_store),
+        ("backup", restore_backup),
+        ("autocomplete", lambda: build_autocomplete_index(app.state.store, app.state.autocomplete)),
+        ("briefings", fill_briefings),
+        ("embedder", app.state.embedder.open),
+        ("workers", start_workers),
+    ])
+    app.state.startup.start()
+    yield
+    await app.state.startup.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await app.state.embedder.close()
+    await app.state.derivation.stop()
+    app.state.briefings.close()
+    await app.state.cache.close()
+    await app.state.graph_statistics.stop()
+    if app.state.backup is not None:
+        await app.state.backup.stop()
+    await app.state.store.close()
+
+app = FastAPI(lifespan=lifespan)
+# Answers 503 until the startup steps are complete
+app.add_middleware(ReadinessGate)
+# Added last, so it is outermost and also times the requests the gate turns away
+app.add_middleware(RequestMetrics)
 
 # Include your routers with distinct prefixes
 app.include_router(general_router, prefix="/general", tags=["General"])
 app.include_router(namedentity_router, prefix="/namedentity", tags=["Named Entity"])
 app.include_router(statement_router, prefix="/statement", tags=["Statement"])
 app.include_router(topic_router, prefix="/topic", tags=["Topic"])
+app.include_router(search_router, prefix="/search", tags=["Search"])
+
+# Prometheus scrape endpoint for the metrics defined in app/utils/metrics.py
+app.mount("/metrics", make_asgi_app())
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Listen app API!"}
+
+
+@app.get("/health", description="Liveness: the process is up and serving requests. Does not touch the database.")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready", response_model=Readiness, responses={503: {"model": Readiness}}, description="Readiness: the startup (schema, backup restore, autocomplete index, briefings, workers) is complete and the database is reachable with a current schema. 503 with the failing checks otherwise.")
+async def ready(startup: Startup = Depends(get_startup)):
+    readiness = await startup.check()
+    if not readiness.ready:
+        return JSONResponse(readiness.model_dump(), status_code=503)
+    return readiness
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel
 from typing import Any, Dict
@@ -39,6 +40,110 @@ class Relationship(BaseModel):
     relationship_type: str
     attributes: Optional[RelationshipAttributes]
 
+class NamedEntitySuggestion(BaseModel):
+    namedentity_id: str
+    name: str
+    fuzzy: bool = False  # Matched with one typo rather than as a prefix
+
 class Connection(BaseModel):
     connected_entity: NamedEntity
     relationship: Relationship  # Updated to use the new Relationship class
+
+class NeighbourhoodStatement(BaseModel):
+    statement: Statement
+    mentioned_namedentities: List[NamedEntity] = Field(default_factory=list)
+    topic: Optional[Topic] = None
+
+class NeighbourhoodEntity(BaseModel):
+    namedentity: NamedEntity
+    hops: int  # Distance from the entity the neighbourhood is centred on
+
+class Neighbourhood(BaseModel):
+    namedentity: NamedEntity
+    statements: List[NeighbourhoodStatement]
+    connected_entities: List[NeighbourhoodEntity]
+    relationships: List[Relationship]  # Derived relationships between all of these entities, one direction per pair
+    truncated: bool = False  # Statements, entities or relationships were left out because of the limits
+
+class GraphStatistics(BaseModel):
+    nodes: int
+    statements: int
+    relationships: int
+    labels: Dict[str, int] = Field(default_factory=dict)  # Nodes per label; a node with several labels counts for each
+    relationship_types: Dict[str, int] = Field(default_factory=dict)
+
+class Readiness(BaseModel):
+    ready: bool
+    checks: Dict[str, str]  # "ok", or what is missing, per check
+
+class ImportResult(BaseModel):
+    lines: int  # Lines read, including skipped and invalid ones
+    namedentities: int = 0
+    topics: int = 0
+    statements: int = 0
+    mentions: int = 0
+    skipped_statements: int = 0  # Statements whose about-entity did not exist
+    invalid: int = 0  # Lines that are not a valid record
+    errors: List[str] = Field(default_factory=list)  # The first problems, with their line numbers
+    checkpoint: int = 0  # Last line whose batch was written; pass it as resume_from to continue an interrupted import
+    seconds: float = 0
+    rows_per_second: float = 0
+
+class BriefingMention(BaseModel):
+    namedentity_id: str
+    name: Optional[str] = None
+    statement_count: int  # Statements about the briefed entity that mention this one
+
+class BriefingTopic(BaseModel):
+    topic_id: str
+    name: Optional[str] = None
+    statement_count: int
+
+class Briefing(BaseModel):
+    namedentity: NamedEntity
+    statement_count: int = 0
+    latest_statements: List[Statement] = Field(default_factory=list)  # Newest first
+    top_mentioned: List[BriefingMention] = Field(default_factory=list)
+    topics: List[BriefingTopic] = Field(default_factory=list)
+    updated_at: Optional[datetime] = None  # None if no statement is about the entity
+
+class StatementBatchItem(BaseModel):
+    statement: Statement
+    mentioned_namedentity_ids: Optional[List[str]] = None
+    topic_id: Optional[str] = None
+
+class StatementBatchResult(BaseModel):
+    statement_id: Optional[str] = None
+    created: bool
+    detail: Optional[str] = None
+    mentioned_namedentity_ids: List[str] = Field(default_factory=list)
+    missing_namedentity_ids: List[str] = Field(default_factory=list)
+    topic_id: Optional[str] = None
+    derivation_job_id: Optional[str] = None  # Set if relationships are derived from the mentions in the background
+
+class DerivationJob(BaseModel):
+    job_id: str
+    statement_id: str
+    status: str  # "queued", "running", "done", "superseded" or "failed"
+    attempts: int
+    relationships_written: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class SearchHit(BaseModel):
+    kind: str  # "statement" or "namedentity"
+    id: str
+    score: float
+    snippet: str
+    highlights: List[List[int]] = Field(default_factory=list)  # [start, end) offsets of the matched terms in snippet
+    about_namedentity_id: Optional[str] = None
+    topic_id: Optional[str] = None
+
+class SimilarStatement(BaseModel):
+    statement: Statement
+    score: float  # Cosine similarity of the embeddings, between -1 and 1
+
+class SearchResults(BaseModel):
+    hits: List[SearchHit]
+    next_offset: Optional[int] = None
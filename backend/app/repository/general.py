@@ -0,0 +1,209 @@
+"""Generic, label-based node access used by the /general endpoints.
+
+Every function takes a managed transaction as its first argument and is meant to be
+passed to ``execute_read``/``execute_write`` from ``app.utils.neo4j``.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.models import GraphStatistics, StatementBatchResult
+
+# Properties maintained by the application that are not returned by the generic endpoints
+INTERNAL_PROPERTIES = ("embedding",)
+# Labels of nodes the application keeps for itself (the schema version of app/db/migrations.py)
+INTERNAL_LABELS = ("SchemaVersion",)
+
+# Columns of the export records, shared by the queries over the whole graph and over one entity's subgraph
+_EXPORT_NAMEDENTITY = "n.namedentity_id AS namedentity_id, n.name AS name, [label IN labels(n) WHERE label <> 'NamedEntity'] AS additional_labels"
+_EXPORT_TOPIC = "t.topic_id AS topic_id, t.name AS name"
+_EXPORT_STATEMENT = """s.statement_id AS statement_id, s.text AS text, p.namedentity_id AS about_namedentity_id,
+               [(s)-[:MENTIONS]->(m:NamedEntity) | m.namedentity_id] AS mentioned_namedentity_ids,
+               head([(s)-[:HAS_TOPIC]->(t:Topic) | t.topic_id]) AS topic_id"""
+_EXPORT_RELATIONSHIP = "a.namedentity_id AS from_node, b.namedentity_id AS to_node, type(r) AS relationship_type, r.source_statement_id AS source_statement_id"
+
+# (kind, query) in export order: every record comes after the records it refers to.
+# Derived relationships exist in both directions and are exported once per pair.
+GRAPH_EXPORT_QUERIES = [
+    ("namedentity", f"MATCH (n:NamedEntity) RETURN {_EXPORT_NAMEDENTITY}"),
+    ("topic", f"MATCH (t:Topic) RETURN {_EXPORT_TOPIC}"),
+    ("statement", f"MATCH (s:Statement)-[:IS_ABOUT]->(p:NamedEntity) RETURN {_EXPORT_STATEMENT}"),
+    ("relationship", f"MATCH (a:NamedEntity)-[r]->(b:NamedEntity) WHERE a.namedentity_id <= b.namedentity_id RETURN {_EXPORT_RELATIONSHIP}"),
+]
+# The entity, the statements about it, the entities and topics these refer to and the relationships of the entity
+SUBGRAPH_EXPORT_QUERIES = [
+    ("namedentity", f"""
+        MATCH (e:NamedEntity {{namedentity_id: $namedentity_id}})
+        CALL {{
+            WITH e RETURN e AS n
+            UNION
+            WITH e MATCH (e)<-[:IS_ABOUT]-(:Statement)-[:MENTIONS]->(n:NamedEntity) RETURN n
+            UNION
+            WITH e MATCH (e)-->(n:NamedEntity) RETURN n
+        }}
+        RETURN {_EXPORT_NAMEDENTITY}"""),
+    ("topic", f"""
+        MATCH (:NamedEntity {{namedentity_id: $namedentity_id}})<-[:IS_ABOUT]-(:Statement)-[:HAS_TOPIC]->(t:Topic)
+        WITH DISTINCT t
+        RETURN {_EXPORT_TOPIC}"""),
+    ("statement", f"MATCH (p:NamedEntity {{namedentity_id: $namedentity_id}})<-[:IS_ABOUT]-(s:Statement) RETURN {_EXPORT_STATEMENT}"),
+    ("relationship", f"MATCH (a:NamedEntity {{namedentity_id: $namedentity_id}})-[r]->(b:NamedEntity) RETURN {_EXPORT_RELATIONSHIP}"),
+]
+
+
+def node_properties(node) -> Dict[str, Any]:
+    return {key: value for key, value in dict(node).items() if key not in INTERNAL_PROPERTIES}
+
+
+async def describe_graph(tx) -> GraphStatistics:
+    """Count nodes and relationships, in total, per label and per type, in one query.
+
+    apoc.meta.stats reads the counts Neo4j maintains for every label and relationship type
+    (the count store) instead of matching the graph, so the cost does not grow with its size.
+    """
+    result = await tx.run("""
+        CALL apoc.meta.stats() YIELD nodeCount, relCount, labels, relTypesCount
+        RETURN nodeCount, relCount, labels, relTypesCount
+    """)
+    record = await result.single()
+    # Labels and types stay in the token store after their last node or relationship is gone
+    labels = {label: count for label, count in record["labels"].items() if count and label not in INTERNAL_LABELS}
+    return GraphStatistics(
+        nodes=record["nodeCount"] - sum(record["labels"].get(label, 0) for label in INTERNAL_LABELS),
+        statements=labels.get("Statement", 0),
+        relationships=record["relCount"],
+        labels=labels,
+        relationship_types={relationship_type: count for relationship_type, count in record["relTypesCount"].items() if count},
+    )
+
+
+async def create_node(tx, label: str, properties: Dict[str, Any]):
+    await tx.run(f"""
+        CREATE (n:{label} {{ {", ".join(f"{k}: ${k}" for k in properties.keys())} }})
+    """, **properties)
+
+
+async def read_node(tx, label: str, id_property: str, node_id: str) -> Optional[Dict[str, Any]]:
+    result = await tx.run(f"""
+        MATCH (n:{label} {{ {id_property}: $node_id }})
+        RETURN n
+    """, node_id=node_id)
+    record = await result.single()
+    if record is None:
+        return None
+    return node_properties(record["n"])
+
+
+async def update_node(tx, label: str, node_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    set_clause = ", ".join([f"n.{key} = ${key}" for key in updates.keys()])
+    result = await tx.run(f"""
+        MATCH (n:{label} {{ {label.lower()}_id: $node_id }})
+        SET {set_clause}
+        RETURN n
+    """, node_id=node_id, **updates)
+    record = await result.single()
+    if record is None:
+        return None
+    return node_properties(record["n"])
+
+
+async def delete_node(tx, label: str, node_id: str) -> bool:
+    result = await tx.run(f"""
+        MATCH (n:{label} {{ {label.lower()}_id: $node_id }})
+        DETACH DELETE n
+    """, node_id=node_id)
+    summary = await result.consume()
+    return summary.counters.nodes_deleted > 0
+
+
+async def iter_export_records(tx, namedentity_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Yield the graph, or the subgraph of one NamedEntity, as records in the import format (see app/utils/exporter.py).
+
+    Each result is consumed while the driver fetches it, so only one fetch of records is held at a time.
+    """
+    queries = GRAPH_EXPORT_QUERIES if namedentity_id is None else SUBGRAPH_EXPORT_QUERIES
+    for kind, query in queries:
+        result = await tx.run(query, namedentity_id=namedentity_id)
+        async for record in result:
+            yield {"kind": kind, **dict(record)}
+
+
+async def import_batch(tx, namedentities: List[dict], topics: List[dict], statements: List[dict], mentions: List[dict]) -> Tuple[Dict[str, StatementBatchResult], Dict[str, List[str]]]:
+    """Merge a batch of imported records, one UNWIND per kind, in dependency order.
+
+    Every query is a MERGE on the ids, so importing the same records again changes nothing:
+    names, texts and embeddings are overwritten, a statement is moved to its new about-entity
+    and topic, and mentions are added. Returns the StatementBatchResult per statement row
+    and the linked entity ids per statement of the mention rows.
+    """
+    if namedentities:
+        await tx.run("""
+            UNWIND $rows AS row
+            MERGE (n:NamedEntity {namedentity_id: row.namedentity_id})
+            SET n.name = row.name
+            WITH n, row
+            CALL apoc.create.addLabels(n, row.additional_labels) YIELD node
+            RETURN count(node)
+        """, rows=namedentities)
+    if topics:
+        await tx.run("""
+            UNWIND $rows AS row
+            MERGE (t:Topic {topic_id: row.topic_id})
+            SET t.name = row.name
+        """, rows=topics)
+
+    results = {}
+    if statements:
+        result = await tx.run("""
+            UNWIND $rows AS row
+            MATCH (p:NamedEntity {namedentity_id: row.about_namedentity_id})
+            MERGE (s:Statement {statement_id: row.statement_id})
+            SET s.text = row.text, s.embedding = row.embedding
+            WITH row, s, p
+            CALL {
+                WITH s, p
+                OPTIONAL MATCH (s)-[old:IS_ABOUT]->(other) WHERE other <> p
+                DELETE old
+            }
+            MERGE (s)-[:IS_ABOUT]->(p)
+            WITH row, s
+            CALL {
+                WITH row, s
+                UNWIND row.mentioned_namedentity_ids AS mentioned_id
+                MATCH (m:NamedEntity {namedentity_id: mentioned_id})
+                MERGE (s)-[:MENTIONS]->(m)
+                RETURN collect(DISTINCT m.namedentity_id) AS mentioned_ids
+            }
+            CALL {
+                WITH row, s
+                OPTIONAL MATCH (t:Topic {topic_id: row.topic_id})
+                OPTIONAL MATCH (s)-[old:HAS_TOPIC]->(other) WHERE t IS NOT NULL AND other <> t
+                DELETE old
+                FOREACH (_ IN CASE WHEN t IS NULL THEN [] ELSE [1] END | MERGE (s)-[:HAS_TOPIC]->(t))
+                RETURN head(collect(t.topic_id)) AS topic_id
+            }
+            RETURN row.statement_id AS statement_id, mentioned_ids, topic_id
+        """, rows=statements)
+        async for record in result:
+            results[record["statement_id"]] = StatementBatchResult(
+                statement_id=record["statement_id"],
+                created=True,
+                mentioned_namedentity_ids=record["mentioned_ids"],
+                topic_id=record["topic_id"],
+            )
+        for row in statements:
+            statement_result = results.get(row["statement_id"])
+            if statement_result is None:
+                results[row["statement_id"]] = StatementBatchResult(statement_id=row["statement_id"], created=False, detail="NamedEntity that the statement is about does not exist")
+            else:
+                statement_result.missing_namedentity_ids = [mentioned_id for mentioned_id in row["mentioned_namedentity_ids"] if mentioned_id not in statement_result.mentioned_namedentity_ids]
+
+    linked = {}
+    if mentions:
+        result = await tx.run("""
+            UNWIND $rows AS row
+            MATCH (s:Statement {statement_id: row.statement_id})
+            MATCH (m:NamedEntity {namedentity_id: row.namedentity_id})
+            MERGE (s)-[:MENTIONS]->(m)
+            RETURN s.statement_id AS statement_id, collect(DISTINCT m.namedentity_id) AS mentioned_ids
+        """, rows=mentions)
+        async for record in result:
+            linked[record["statement_id"]] = record["mentioned_ids"]
+    return results, linked
@@ -0,0 +1,317 @@
+"""Data access for NamedEntity nodes.
+
+Every function takes a managed transaction as its first argument and is meant to be
+passed to ``execute_read``/``execute_write`` from ``app.utils.neo4j``, so one endpoint
+maps to exactly one unit of work.
+"""
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from neo4j import AsyncDriver
+from app.genai.genai import DERIVED_RELATIONSHIP_TYPES
+from app.models import Connection, NamedEntity, Neighbourhood, NeighbourhoodEntity, NeighbourhoodStatement, Relationship, RelationshipAttributes, Statement, Topic
+from app.repository.pagination import after_param, limit_clause
+from app.repository.relationships import match_derived_relationships
+
+logger = logging.getLogger(__name__)
+
+def remove_and_return(lst, element):
+    return [item for item in lst if item != element]
+
+
+def namedentity_from_map(entity_map) -> NamedEntity:
+    """Build a NamedEntity from a `n {.name, .namedentity_id, labels: labels(n)}` map projection."""
+    return NamedEntity(
+        name=entity_map["name"],
+        namedentity_id=entity_map["namedentity_id"],
+        additional_labels=remove_and_return(entity_map["labels"], "NamedEntity")
+    )
+
+
+async def get_namedentity_by_id(tx, namedentity_id: str) -> Optional[NamedEntity]:
+    result = await tx.run("""
+        MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
+        RETURN n {.name, .namedentity_id, labels: labels(n)} AS entity
+    """, namedentity_id=namedentity_id)
+    record = await result.single()
+    if not record:
+        return None
+    return namedentity_from_map(record["entity"])
+
+
+async def create_namedentity(tx, named_entity: NamedEntity):
+    # Convert the additional_labels list into a string of labels
+    additional_labels = ""
+    if named_entity.additional_labels:
+        additional_labels = ":" + ":".join(named_entity.additional_labels)
+
+    await tx.run(f"""
+        CREATE (p:NamedEntity{additional_labels} {{name: $name, namedentity_id: $namedentity_id}})
+    """, name=named_entity.name, namedentity_id=named_entity.namedentity_id)
+
+
+async def iter_namedentities_by_name(tx, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[NamedEntity]:
+    """Yield the NamedEntities with a name, ordered by namedentity_id and starting after the given one."""
+    result = await tx.run(f"""
+        MATCH (n:NamedEntity {{name: $name}})
+        WHERE n.namedentity_id > $after
+        WITH n ORDER BY n.namedentity_id
+        {limit_clause(limit)}
+        RETURN n {{.name, .namedentity_id, labels: labels(n)}} AS entity
+    """, name=name, after=after_param(after), limit=limit)
+    async for record in result:
+        yield namedentity_from_map(record["entity"])
+
+
+async def get_namedentities_by_name(tx, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[NamedEntity]:
+    return [named_entity async for named_entity in iter_namedentities_by_name(tx, name, after, limit)]
+
+
+async def iter_namedentity_names(tx) -> AsyncIterator[Tuple[str, str]]:
+    """Yield (namedentity_id, name) of all NamedEntities."""
+    result = await tx.run("""
+        MATCH (n:NamedEntity)
+        RETURN n.namedentity_id AS namedentity_id, n.name AS name
+    """)
+    async for record in result:
+        yield record["namedentity_id"], record["name"]
+
+
+async def iter_statements_about(tx, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Statement]:
+    """Yield the statements about a NamedEntity, ordered by statement_id and starting after the given one."""
+    result = await tx.run(f"""
+        MATCH (:NamedEntity {{namedentity_id: $namedentity_id}})<-[:IS_ABOUT]-(s:Statement)
+        WHERE s.statement_id > $after
+        WITH s ORDER BY s.statement_id
+        {limit_clause(limit)}
+        RETURN s {{.text, .statement_id}} AS statement
+    """, namedentity_id=namedentity_id, after=after_param(after), limit=limit)
+    async for record in result:
+        statement = record["statement"]
+        yield Statement(text=statement["text"], statement_id=statement["statement_id"], about_namedentity_id=namedentity_id)
+
+
+async def get_statements_about(tx, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> Optional[List[Statement]]:
+    """Return a page of the statements about a NamedEntity, or None if the entity does not exist."""
+    result = await tx.run(f"""
+        MATCH (n:NamedEntity {{namedentity_id: $namedentity_id}})
+        CALL {{
+            WITH n
+            OPTIONAL MATCH (n)<-[:IS_ABOUT]-(s:Statement)
+            WHERE s.statement_id > $after
+            WITH s ORDER BY s.statement_id
+            {limit_clause(limit)}
+            RETURN collect(s {{.text, .statement_id}}) AS statements
+        }}
+        RETURN statements
+    """, namedentity_id=namedentity_id, after=after_param(after), limit=limit)
+    record = await result.single()
+    if not record:
+        return None
+    return [
+        Statement(text=statement["text"], statement_id=statement["statement_id"], about_namedentity_id=namedentity_id)
+        for statement in record["statements"]
+    ]
+
+
+async def get_connections(tx, namedentity_id: str) -> Optional[List[Connection]]:
+    """Return the entities a NamedEntity is directly related to, or None if it does not exist."""
+    result = await tx.run("""
+        MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
+        CALL {
+            WITH n
+            MATCH (n)-[r]->(m:NamedEntity)
+            RETURN collect({entity: m {.name, .namedentity_id, labels: labels(m)}, type: type(r), source_statement_id: r.source_statement_id}) AS connections
+        }
+        RETURN connections
+    """, namedentity_id=namedentity_id)
+    record = await result.single()
+    if not record:
+        return None
+    return [
+        Connection(
+            connected_entity=namedentity_from_map(connection["entity"]),
+            relationship=Relationship(
+                from_node=namedentity_id,
+                to_node=connection["entity"]["namedentity_id"],
+                relationship_type=connection["type"],
+                attributes=RelationshipAttributes(source_statement_id=connection["source_statement_id"]) if connection["source_statement_id"] else None,
+            ),
+        )
+        for connection in record["connections"]
+    ]
+
+
+def _hop_clause(hop: int) -> str:
+    """Expand the frontier by one hop by at most $fan_out new entities: the lowest unseen IDs of each frontier entity in turn.
+
+    One more candidate than allowed is fetched, which tells whether the limit cut any off.
+    """
+    return f"""
+        CALL {{
+            WITH seen, frontier
+            UNWIND frontier AS f
+            CALL {{
+                WITH f, seen
+                MATCH (f)-[:{"|".join(DERIVED_RELATIONSHIP_TYPES)}]->(m:NamedEntity)
+                WHERE NOT m IN seen
+                WITH DISTINCT m ORDER BY m.namedentity_id
+                LIMIT $fan_out + 1
+                RETURN collect(m) AS candidates
+            }}
+            WITH reduce(expanded = [], found IN collect(candidates) | expanded + [m IN found WHERE NOT m IN expanded]) AS expanded
+            RETURN expanded[..$fan_out] AS expanded, size(expanded) > $fan_out AS hop_truncated
+        }}
+        WITH n, statements, statements_truncated, seen + expanded AS seen, expanded AS frontier, truncated OR hop_truncated AS truncated,
+             entities + [m IN expanded | {{entity: m {{.name, .namedentity_id, labels: labels(m)}}, hops: {hop}}}] AS entities"""
+
+
+async def get_neighbourhood(tx, namedentity_id: str, hops: int, fan_out: int, statement_limit: int, relationship_limit: int) -> Optional[Neighbourhood]:
+    """Return an entity with its statements (their mentions and topics) and the entities up to hops away, in one query.
+
+    Every hop adds at most fan_out entities and the statements and relationships are capped
+    as well, so the size of the result is bounded however densely the entity is connected.
+    Returns None if the entity does not exist.
+    """
+    hop_clauses = "".join(_hop_clause(hop) for hop in range(1, hops + 1))
+    result = await tx.run(f"""
+        MATCH (n:NamedEntity {{namedentity_id: $namedentity_id}})
+        CALL {{
+            WITH n
+            OPTIONAL MATCH (n)<-[:IS_ABOUT]-(s:Statement)
+            WITH s ORDER BY s.statement_id
+            LIMIT $statement_limit + 1
+            CALL {{
+                WITH s
+                OPTIONAL MATCH (s)-[:MENTIONS]->(m:NamedEntity)
+                WITH m ORDER BY m.namedentity_id
+                RETURN collect(m {{.name, .namedentity_id, labels: labels(m)}}) AS mentioned
+            }}
+            OPTIONAL MATCH (s)-[:HAS_TOPIC]->(t:Topic)
+            WITH collect(s {{.text, .statement_id, mentioned: mentioned, topic: t {{.name, .topic_id}}}}) AS statements
+            RETURN statements[..$statement_limit] AS statements, size(statements) > $statement_limit AS statements_truncated
+        }}
+        WITH n, statements, statements_truncated, [n] AS seen, [n] AS frontier, false AS truncated, [] AS entities{hop_clauses}
+        CALL {{
+            WITH seen
+            UNWIND seen AS a
+            MATCH (a)-[r:{"|".join(DERIVED_RELATIONSHIP_TYPES)}]->(b:NamedEntity)
+            // Derived relationships are written in both directions; one of each pair is enough
+            WHERE a.namedentity_id < b.namedentity_id AND b IN seen
+            WITH a, r, b ORDER BY a.namedentity_id, b.namedentity_id, type(r), r.source_statement_id
+            LIMIT $relationship_limit + 1
+            RETURN collect({{from_node: a.namedentity_id, to_node: b.namedentity_id, type: type(r), source_statement_id: r.source_statement_id}}) AS relationships
+        }}
+        RETURN n {{.name, .namedentity_id, labels: labels(n)}} AS entity, statements, entities,
+               relationships[..$relationship_limit] AS relationships,
+               truncated OR statements_truncated OR size(relationships) > $relationship_limit AS truncated
+    """, namedentity_id=namedentity_id, fan_out=fan_out, statement_limit=statement_limit, relationship_limit=relationship_limit)
+    record = await result.single()
+    if not record:
+        return None
+    return Neighbourhood(
+        namedentity=namedentity_from_map(record["entity"]),
+        statements=[
+            NeighbourhoodStatement(
+                statement=Statement(text=statement["text"], statement_id=statement["statement_id"], about_namedentity_id=namedentity_id),
+                mentioned_namedentities=[namedentity_from_map(entity) for entity in statement["mentioned"]],
+                topic=Topic(name=statement["topic"]["name"], topic_id=statement["topic"]["topic_id"]) if statement["topic"] else None,
+            )
+            for statement in record["statements"]
+        ],
+        connected_entities=[NeighbourhoodEntity(namedentity=namedentity_from_map(entity["entity"]), hops=entity["hops"]) for entity in record["entities"]],
+        relationships=[
+            Relationship(
+                from_node=relationship["from_node"],
+                to_node=relationship["to_node"],
+                relationship_type=relationship["type"],
+                attributes=RelationshipAttributes(source_statement_id=relationship["source_statement_id"]),
+            )
+            for relationship in record["relationships"]
+        ],
+        truncated=record["truncated"],
+    )
+
+
+async def set_labels(tx, namedentity_id: str, additional_labels: List[str]) -> Optional[NamedEntity]:
+    """Replace all labels of a NamedEntity with NamedEntity plus the given labels in one statement."""
+    result = await tx.run("""
+        MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
+        CALL apoc.create.setLabels(n, ['NamedEntity'] + $additional_labels) YIELD node
+        RETURN node {.name, .namedentity_id, labels: labels(node)} AS entity
+    """, namedentity_id=namedentity_id, additional_labels=list(additional_labels or []))
+    record = await result.single()
+    if not record:
+        return None
+    return namedentity_from_map(record["entity"])
+
+
+async def delete_namedentity_cascade(driver: AsyncDriver, namedentity_id: str, batch_size: int) -> Optional[Dict[str, int]]:
+    """Delete a NamedEntity together with the statements about it and their derived relationships.
+
+    Unlike the other functions of this module this one takes the driver: the work is split
+    into transactions of at most batch_size rows with CALL {} IN TRANSACTIONS, which only
+    runs in auto-commit transactions. That keeps the transaction state (and the Neo4j heap)
+    bounded for heavily annotated entities. The cascade is therefore not atomic, but every
+    phase is idempotent, so an interrupted delete completes when it is repeated.
+
+    Returns progress counters per phase, or None if the entity does not exist.
+    """
+    batch_size = int(batch_size)
+    async with driver.session() as session:
+        result = await session.run("""
+            MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
+            RETURN n.namedentity_id AS namedentity_id
+        """, namedentity_id=namedentity_id)
+        if await result.single() is None:
+            return None
+
+        # Phase 1: Relationships derived from the statements about the entity, via the source_statement_id indexes
+        result = await session.run(f"""
+            MATCH (:NamedEntity {{namedentity_id: $namedentity_id}})<-[:IS_ABOUT]-(s:Statement)
+            WITH s.statement_id AS statement_id
+            CALL {{
+                WITH statement_id
+                {match_derived_relationships("r.source_statement_id = statement_id", "statement_id")}
+                DELETE r
+                RETURN count(r) AS deleted
+            }} IN TRANSACTIONS OF {batch_size} ROWS
+            RETURN coalesce(sum(deleted), 0) AS deleted
+        """, namedentity_id=namedentity_id)
+        derived_relationships_deleted = (await result.single())["deleted"]
+        logger.info("Deleting NamedEntity %s: removed %d derived relationships", namedentity_id, derived_relationships_deleted)
+
+        # Phase 2: The statements themselves, with their IS_ABOUT, MENTIONS and HAS_TOPIC relationships
+        result = await session.run(f"""
+            MATCH (:NamedEntity {{namedentity_id: $namedentity_id}})<-[:IS_ABOUT]-(s:Statement)
+            CALL {{
+                WITH s
+                DETACH DELETE s
+            }} IN TRANSACTIONS OF {batch_size} ROWS
+            RETURN count(*) AS deleted
+        """, namedentity_id=namedentity_id)
+        statements_deleted = (await result.single())["deleted"]
+        logger.info("Deleting NamedEntity %s: removed %d statements", namedentity_id, statements_deleted)
+
+        # Phase 3: Remaining relationships of the entity (mentions by and relationships derived from other statements)
+        result = await session.run(f"""
+            MATCH (:NamedEntity {{namedentity_id: $namedentity_id}})-[r]-()
+            CALL {{
+                WITH r
+                DELETE r
+            }} IN TRANSACTIONS OF {batch_size} ROWS
+            RETURN count(*) AS deleted
+        """, namedentity_id=namedentity_id)
+        relationships_deleted = (await result.single())["deleted"]
+        logger.info("Deleting NamedEntity %s: removed %d other relationships", namedentity_id, relationships_deleted)
+
+        # Phase 4: The entity, which has no relationships left
+        await (await session.run("""
+            MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
+            DETACH DELETE n
+        """, namedentity_id=namedentity_id)).consume()
+
+    return {
+        "statements_deleted": statements_deleted,
+        "derived_relationships_deleted": derived_relationships_deleted,
+        "relationships_deleted": relationships_deleted,
+    }
@@ -0,0 +1,16 @@
+"""Helpers for keyset (cursor) pagination.
+
+A page is requested with the ID of the last item of the previous page (``after``) and a
+page size (``limit``). Queries filter on ``<id property> > $after`` and order by the same
+property, so Neo4j can seek in the ID index instead of skipping over earlier pages.
+"""
+from typing import Optional
+
+def after_param(after: Optional[str]) -> str:
+    """Cursor parameter for the first page: every ID compares greater than the empty string."""
+    return after or ""
+
+
+def limit_clause(limit: Optional[int]) -> str:
+    """LIMIT clause for the page size, or nothing to return all remaining items."""
+    return "LIMIT $limit" if limit is not None else ""
@@ -0,0 +1,76 @@
+"""Cypher helpers for the relationships derived from statements (see app/genai).
+
+Derived relationships connect NamedEntities and carry the source_statement_id of the
+statement they were derived from.
+"""
+import logging
+from collections import Counter, defaultdict
+from typing import List
+from app.models import Relationship
+from app.genai.genai import DERIVED_RELATIONSHIP_TYPES
+from app.utils.metrics import DERIVED_RELATIONSHIPS_PER_STATEMENT, REJECTED_RELATIONSHIP_TYPES
+
+logger = logging.getLogger(__name__)
+
+def match_derived_relationships(condition: str, imported_variable: str = None) -> str:
+    """Build a CALL subquery returning every derived relationship `r` that satisfies condition.
+
+    Matching each derived type separately lets Neo4j use the per-type source_statement_id
+    index instead of scanning every relationship in the graph. Pass imported_variable
+    when the condition refers to a variable of the enclosing query.
+    """
+    imported = f"WITH {imported_variable} " if imported_variable else ""
+    branches = "\n            UNION ALL\n".join(
+        f"            {imported}MATCH ()-[r:{relationship_type}]->() WHERE {condition} RETURN r"
+        for relationship_type in DERIVED_RELATIONSHIP_TYPES
+    )
+    return f"CALL {{\n{branches}\n        }}"
+
+
+def filter_derived_relationships(relationships: List[Relationship]) -> List[Relationship]:
+    """Drop (and count) relationships whose type is not in DERIVED_RELATIONSHIP_TYPES."""
+    allowed = []
+    for relationship in relationships:
+        if relationship.relationship_type not in DERIVED_RELATIONSHIP_TYPES:
+            logger.warning("Dropping derived relationship with unknown type %r", relationship.relationship_type)
+            REJECTED_RELATIONSHIP_TYPES.labels(relationship_type=relationship.relationship_type).inc()
+            continue
+        allowed.append(relationship)
+    return allowed
+
+
+def observe_derived_relationships(relationships: List[Relationship]):
+    """Record the number of edges (both directions) written per source statement."""
+    edges_per_statement = Counter(relationship.attributes.source_statement_id for relationship in relationships)
+    for relationship_count in edges_per_statement.values():
+        DERIVED_RELATIONSHIPS_PER_STATEMENT.observe(2 * relationship_count)
+
+
+async def create_derived_relationships_batch(tx, relationships: List[Relationship]):
+    """Write derived relationships in both directions, one UNWIND query per relationship type.
+
+    The relationship type is interpolated into the query, so only types from
+    DERIVED_RELATIONSHIP_TYPES are written; anything else is dropped and counted.
+    Relationships whose source statement no longer exists are not written.
+    """
+    relationships = filter_derived_relationships(relationships)
+    rows_by_type = defaultdict(list)
+    for relationship in relationships:
+        rows_by_type[relationship.relationship_type].append({
+            "from_node": relationship.from_node,
+            "to_node": relationship.to_node,
+            "source_statement_id": relationship.attributes.source_statement_id,
+        })
+
+    for relationship_type, rows in rows_by_type.items():
+        await tx.run(f"""
+            UNWIND $rows AS row
+            // The statement may have been deleted since its relationships were derived
+            MATCH (:Statement {{statement_id: row.source_statement_id}})
+            MATCH (e1:NamedEntity {{namedentity_id: row.from_node}}),
+                  (e2:NamedEntity {{namedentity_id: row.to_node}})
+            CREATE (e1)-[:{relationship_type} {{source_statement_id: row.source_statement_id}}]->(e2)
+            CREATE (e2)-[:{relationship_type} {{source_statement_id: row.source_statement_id}}]->(e1)
+        """, rows=rows)
+
+    observe_derived_relationships(relationships)
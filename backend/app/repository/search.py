@@ -0,0 +1,48 @@
+"""Full-text search over Statement.text and NamedEntity.name (indexes created by migration 5).
+
+Every function takes a managed transaction as its first argument and is meant to be
+passed to ``execute_read``/``execute_write`` from ``app.utils.neo4j``.
+"""
+from typing import List, Optional
+from app.utils.search import SEARCH_FILTERED_CANDIDATES
+
+STATEMENT_BRANCH = """
+            CALL db.index.fulltext.queryNodes('statement_text_fulltext', $search_query, {limit: $statement_candidates}) YIELD node, score
+            MATCH (node)-[:IS_ABOUT]->(about:NamedEntity)
+            WHERE $about_namedentity_id IS NULL OR about.namedentity_id = $about_namedentity_id
+            OPTIONAL MATCH (node)-[:HAS_TOPIC]->(topic:Topic)
+            WITH node, score, about, topic
+            WHERE $topic_id IS NULL OR topic.topic_id = $topic_id
+            RETURN 'statement' AS kind, node.statement_id AS id, node.text AS text, score,
+                   about.namedentity_id AS about_namedentity_id, topic.topic_id AS topic_id"""
+
+NAMEDENTITY_BRANCH = """
+            CALL db.index.fulltext.queryNodes('namedentity_name_fulltext', $search_query, {limit: $namedentity_candidates}) YIELD node, score
+            RETURN 'namedentity' AS kind, node.namedentity_id AS id, node.name AS text, score,
+                   null AS about_namedentity_id, null AS topic_id"""
+
+
+async def search(tx, query: str, kinds: List[str], about_namedentity_id: Optional[str], topic_id: Optional[str], offset: int, limit: int) -> List[dict]:
+    """Return one page of hits of a Lucene query, best first, as dicts of kind, id, text, score, about_namedentity_id and topic_id.
+
+    The index returns its matches best first, so each branch only needs its offset + limit best
+    ones. Filtered statements may be further down; they are looked for among the
+    SEARCH_FILTERED_CANDIDATES best matches, and better-matching statements of other entities
+    or topics can push them out of the results.
+    """
+    branches = [branch for kind, branch in (("statement", STATEMENT_BRANCH), ("namedentity", NAMEDENTITY_BRANCH)) if kind in kinds]
+    if not branches:
+        return []
+    union = "\n            UNION ALL".join(branches)
+    page_end = offset + limit
+    filtered = about_namedentity_id is not None or topic_id is not None
+    statement_candidates = max(page_end, SEARCH_FILTERED_CANDIDATES) if filtered else page_end
+    result = await tx.run(f"""
+        CALL {{{union}
+        }}
+        RETURN kind, id, text, score, about_namedentity_id, topic_id
+        ORDER BY score DESC, id
+        SKIP $offset LIMIT $limit
+    """, search_query=query, about_namedentity_id=about_namedentity_id, topic_id=topic_id,
+       offset=offset, limit=limit, statement_candidates=statement_candidates, namedentity_candidates=page_end)
+    return [record.data() async for record in result]
@@ -0,0 +1,301 @@
+"""Data access for Statement nodes, their mentions, topics and derived relationships.
+
+Every function takes a managed transaction as its first argument and is meant to be
+passed to ``execute_read``/``execute_write`` from ``app.utils.neo4j``.
+"""
+from typing import Dict, List, Optional, Tuple
+from app.models import Statement, NamedEntity, Relationship, StatementBatchResult
+from app.repository.namedentity import namedentity_from_map
+from app.repository.relationships import match_derived_relationships, create_derived_relationships_batch
+
+async def get_statement_by_id(tx, statement_id: str) -> Optional[Statement]:
+    result = await tx.run("""
+        MATCH (s:Statement {statement_id: $statement_id})-[:IS_ABOUT]->(n:NamedEntity)
+        RETURN s.text AS text, s.statement_id AS statement_id, n.namedentity_id AS about_namedentity_id
+    """, statement_id=statement_id)
+    record = await result.single()
+    if not record:
+        return None
+    return Statement(
+        text=record["text"],
+        statement_id=record["statement_id"],
+        about_namedentity_id=record["about_namedentity_id"],
+    )
+
+
+async def create_statement(tx, statement: Statement, embedding: Optional[List[float]] = None) -> bool:
+    """Create a statement and its IS_ABOUT relationship. Returns False if the about-entity does not exist."""
+    result = await tx.run("""
+        MATCH (p:NamedEntity {namedentity_id: $namedentity_id})
+        CREATE (s:Statement {text: $text, statement_id: $statement_id, embedding: $embedding})-[:IS_ABOUT]->(p)
+        RETURN s.statement_id AS statement_id
+    """, text=statement.text, statement_id=statement.statement_id, namedentity_id=statement.about_namedentity_id, embedding=embedding)
+    return await result.single() is not None
+
+
+async def update_text(tx, statement_id: str, new_text: str, embedding: Optional[List[float]] = None) -> bool:
+    result = await tx.run("""
+        MATCH (s:Statement {statement_id: $statement_id})
+        SET s.text = $new_text, s.embedding = $embedding
+        RETURN s.statement_id AS statement_id
+    """, statement_id=statement_id, new_text=new_text, embedding=embedding)
+    return await result.single() is not None
+
+
+async def delete_statement_relationships(tx, statement_id: str):
+    """Deletes relationships derived from a specific statement."""
+    await tx.run(f"""
+        {match_derived_relationships("r.source_statement_id = $statement_id")}
+        DELETE r
+    """, statement_id=statement_id)
+
+
+async def delete_statement(tx, statement_id: str):
+    await delete_statement_relationships(tx, statement_id)
+    await tx.run("""
+        MATCH (s:Statement {statement_id: $statement_id})
+        DETACH DELETE s
+    """, statement_id=statement_id)
+
+
+async def get_mentioned_entities(tx, statement_id: str) -> Optional[List[NamedEntity]]:
+    """Return the entities mentioned by a statement, or None if the statement does not exist."""
+    result = await tx.run("""
+        MATCH (s:Statement {statement_id: $statement_id})
+        OPTIONAL MATCH (s)-[:MENTIONS]->(m:NamedEntity)
+        RETURN collect(m {.name, .namedentity_id, labels: labels(m)}) AS mentioned
+    """, statement_id=statement_id)
+    record = await result.single()
+    if not record:
+        return None
+    return [namedentity_from_map(entity) for entity in record["mentioned"]]
+
+
+async def set_topic(tx, statement_id: str, topic_id: Optional[str]) -> bool:
+    """Replace the HAS_TOPIC relationship of a statement. Returns False if the statement does not exist."""
+    result = await tx.run("""
+        MATCH (s:Statement {statement_id: $statement_id})
+        OPTIONAL MATCH (s)-[r:HAS_TOPIC]->(:Topic)
+        DELETE r
+        WITH DISTINCT s
+        OPTIONAL MATCH (t:Topic {topic_id: $topic_id})
+        FOREACH (_ IN CASE WHEN t IS NULL THEN [] ELSE [1] END | CREATE (s)-[:HAS_TOPIC]->(t))
+        RETURN s.statement_id AS statement_id
+    """, statement_id=statement_id, topic_id=topic_id)
+    return await result.single() is not None
+
+
+async def create_mentions_relationships(tx, statement_id: str, mentioned_namedentity_ids: List[str]) -> Tuple[List[str], List[str]]:
+    """Link the statement to all mentioned named entities in one set-based query.
+
+    Returns the mentioned ids that resolved to a NamedEntity and the ones that did not.
+    """
+    result = await tx.run("""
+        MATCH (s:Statement {statement_id: $statement_id})
+        UNWIND $mentioned_namedentity_ids AS mentioned_id
+        OPTIONAL MATCH (m:NamedEntity {namedentity_id: mentioned_id})
+        FOREACH (_ IN CASE WHEN m IS NULL THEN [] ELSE [1] END | MERGE (s)-[:MENTIONS]->(m))
+        RETURN collect(CASE WHEN m IS NOT NULL THEN mentioned_id END) AS resolved,
+               collect(CASE WHEN m IS NULL THEN mentioned_id END) AS missing
+    """, statement_id=statement_id, mentioned_namedentity_ids=list(dict.fromkeys(mentioned_namedentity_ids)))
+    record = await result.single()
+    return record["resolved"], record["missing"]
+
+
+async def get_derivation_inputs(tx, statement_ids: List[str]) -> Dict[str, Tuple[Statement, NamedEntity, List[NamedEntity]]]:
+    """Return the statement, its about-entity and its mentioned entities for each of the statements that exists."""
+    result = await tx.run("""
+        UNWIND $statement_ids AS statement_id
+        MATCH (s:Statement {statement_id: statement_id})-[:IS_ABOUT]->(p:NamedEntity)
+        OPTIONAL MATCH (s)-[:MENTIONS]->(m:NamedEntity)
+        WITH s, p, m ORDER BY m.namedentity_id
+        RETURN s {.text, .statement_id} AS statement, p {.name, .namedentity_id, labels: labels(p)} AS about,
+               collect(m {.name, .namedentity_id, labels: labels(m)}) AS mentioned
+    """, statement_ids=statement_ids)
+    inputs = {}
+    async for record in result:
+        about_namedentity = namedentity_from_map(record["about"])
+        statement = Statement(text=record["statement"]["text"], statement_id=record["statement"]["statement_id"], about_namedentity_id=about_namedentity.namedentity_id)
+        inputs[statement.statement_id] = (statement, about_namedentity, [namedentity_from_map(entity) for entity in record["mentioned"]])
+    return inputs
+
+
+async def replace_derived_relationships(tx, statement_ids: List[str], relationships: List[Relationship]):
+    """Delete the relationships derived from the statements and write the given ones instead."""
+    await tx.run(f"""
+        UNWIND $statement_ids AS statement_id
+        {match_derived_relationships("r.source_statement_id = statement_id", "statement_id")}
+        DELETE r
+    """, statement_ids=statement_ids)
+    await create_derived_relationships_batch(tx, relationships)
+
+
+async def update_mentions(tx, statement_id: str, mentioned_namedentity_ids: List[str], replace: bool) -> Optional[Dict[str, List[str]]]:
+    """Add (or, with replace, set) the mentions of a statement.
+
+    The relationships derived from the mentions are not touched; the caller queues their
+    derivation (app/genai/pipeline.py), which replaces them once it ran.
+
+    Returns the mentioned ids that were linked and the ones without a NamedEntity,
+    or None if the statement does not exist.
+    """
+    statement = await get_statement_by_id(tx, statement_id)
+    if statement is None:
+        return None
+
+    if replace:
+        # Remove existing MENTIONS relationships
+        await tx.run("""
+            MATCH (s:Statement {statement_id: $statement_id})-[r:MENTIONS]->()
+            DELETE r
+        """, statement_id=statement_id)
+
+    resolved, missing = [], []
+    if mentioned_namedentity_ids:
+        resolved, missing = await create_mentions_relationships(tx, statement_id, mentioned_namedentity_ids)
+    return {"mentioned_namedentity_ids": resolved, "missing_namedentity_ids": missing}
+
+
+async def create_statements_batch(tx, rows: List[dict], chunk_size: int) -> Dict[str, StatementBatchResult]:
+    """Validate and create a batch of statements with their IS_ABOUT, MENTIONS and HAS_TOPIC relationships.
+
+    Runs inside a single write transaction. Every chunk costs one validation and one
+    creation round trip, independent of the number of statements or mentions in it.
+    Relationships are derived from the mentions afterwards, by the caller queueing them.
+    Returns a dict mapping statement_id to its StatementBatchResult.
+    """
+    results = {}
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+
+        # Step 1: Check that the about-entities exist and the statement ids are still free
+        result = await tx.run("""
+            UNWIND $rows AS row
+            OPTIONAL MATCH (p:NamedEntity {namedentity_id: row.about_namedentity_id})
+            OPTIONAL MATCH (s:Statement {statement_id: row.statement_id})
+            RETURN row.statement_id AS statement_id, p IS NOT NULL AS about_exists, s IS NOT NULL AS statement_exists
+        """, rows=chunk)
+        valid_ids = set()
+        async for record in result:
+            statement_id = record["statement_id"]
+            if not record["about_exists"]:
+                results[statement_id] = StatementBatchResult(statement_id=statement_id, created=False, detail="NamedEntity that the statement is about does not exist")
+            elif record["statement_exists"]:
+                results[statement_id] = StatementBatchResult(statement_id=statement_id, created=False, detail="Statement with this id already exists")
+            else:
+                valid_ids.add(statement_id)
+
+        valid_rows = [row for row in chunk if row["statement_id"] in valid_ids]
+        if not valid_rows:
+            continue
+
+        # Step 2: Create the statements and link them to their about-entity, mentions and topic
+        result = await tx.run("""
+            UNWIND $rows AS row
+            MATCH (p:NamedEntity {namedentity_id: row.about_namedentity_id})
+            CREATE (s:Statement {text: row.text, statement_id: row.statement_id, embedding: row.embedding})
+            CREATE (s)-[:IS_ABOUT]->(p)
+            WITH row, s
+            CALL {
+                WITH row, s
+                UNWIND row.mentioned_namedentity_ids AS mentioned_id
+                MATCH (m:NamedEntity {namedentity_id: mentioned_id})
+                MERGE (s)-[:MENTIONS]->(m)
+                RETURN collect(DISTINCT m.namedentity_id) AS mentioned_ids
+            }
+            CALL {
+                WITH row, s
+                OPTIONAL MATCH (t:Topic {topic_id: row.topic_id})
+                FOREACH (_ IN CASE WHEN t IS NULL THEN [] ELSE [1] END | CREATE (s)-[:HAS_TOPIC]->(t))
+                RETURN t.topic_id AS topic_id
+            }
+            RETURN row.statement_id AS statement_id, mentioned_ids, topic_id
+        """, rows=valid_rows)
+        rows_by_id = {row["statement_id"]: row for row in valid_rows}
+        async for record in result:
+            row = rows_by_id[record["statement_id"]]
+            mentioned_ids = record["mentioned_ids"]
+            results[row["statement_id"]] = StatementBatchResult(
+                statement_id=row["statement_id"],
+                created=True,
+                mentioned_namedentity_ids=mentioned_ids,
+                missing_namedentity_ids=[mentioned_id for mentioned_id in row["mentioned_namedentity_ids"] if mentioned_id not in mentioned_ids],
+                topic_id=record["topic_id"],
+            )
+    return results
+
+
+async def get_statements_to_embed(tx, dimensions: int, after: Optional[str], limit: int) -> List[Tuple[str, str]]:
+    """The (statement_id, text) of statements without an embedding of the given size, in statement_id order after the cursor."""
+    result = await tx.run("""
+        MATCH (s:Statement)
+        WHERE s.statement_id > $after AND (s.embedding IS NULL OR size(s.embedding) <> $dimensions)
+        RETURN s.statement_id AS statement_id, s.text AS text
+        ORDER BY statement_id
+        LIMIT $limit
+    """, dimensions=dimensions, after=after or "", limit=limit)
+    return [(record["statement_id"], record["text"]) async for record in result]
+
+
+async def get_statement_rows(tx, after: Optional[str], limit: int) -> List[dict]:
+    """Statements in statement_id order after the cursor, with the IDs of their entity, mentions and topic."""
+    result = await tx.run("""
+        MATCH (s:Statement)
+        WHERE s.statement_id > $after
+        WITH s ORDER BY s.statement_id
+        LIMIT $limit
+        OPTIONAL MATCH (s)-[:IS_ABOUT]->(n:NamedEntity)
+        OPTIONAL MATCH (s)-[:HAS_TOPIC]->(t:Topic)
+        CALL {
+            WITH s
+            OPTIONAL MATCH (s)-[:MENTIONS]->(m:NamedEntity)
+            WITH m ORDER BY m.namedentity_id
+            RETURN collect(m.namedentity_id) AS mentioned_namedentity_ids
+        }
+        RETURN s.text AS text, s.statement_id AS statement_id, n.namedentity_id AS about_namedentity_id,
+               mentioned_namedentity_ids, t.topic_id AS topic_id
+        ORDER BY statement_id
+    """, after=after or "", limit=limit)
+    return [dict(record) async for record in result]
+
+
+async def set_statement_embeddings(tx, embeddings: Dict[str, List[float]]):
+    await tx.run("""
+        UNWIND $rows AS row
+        MATCH (s:Statement {statement_id: row.statement_id})
+        SET s.embedding = row.embedding
+    """, rows=[{"statement_id": statement_id, "embedding": embedding} for statement_id, embedding in embeddings.items()])
+
+
+async def similar_statements(tx, embedding: List[float], k: int, about_namedentity_id: Optional[str], exclude_statement_id: Optional[str]) -> Optional[List[dict]]:
+    """The k statements closest to embedding, best first, as dicts of text, statement_id, about_namedentity_id and score.
+
+    Scores are cosine similarities; Neo4j reports them mapped to [0, 1], so they are mapped back.
+    Scoped to an entity, its statements are scored exactly instead of through the vector index,
+    whose top k over all statements may contain none of them. Returns None if the entity does not exist.
+    """
+    if about_namedentity_id is not None:
+        result = await tx.run("""
+            MATCH (p:NamedEntity {namedentity_id: $about_namedentity_id})
+            OPTIONAL MATCH (s:Statement)-[:IS_ABOUT]->(p)
+            WHERE size(s.embedding) = size($embedding) AND s.statement_id <> coalesce($exclude_statement_id, '')
+            WITH p, s, vector.similarity.cosine(s.embedding, $embedding) AS score
+            ORDER BY score DESC, s.statement_id
+            LIMIT $k
+            RETURN p.namedentity_id AS about_namedentity_id, collect(s {.text, .statement_id, score: 2 * score - 1}) AS hits
+        """, embedding=embedding, k=k, about_namedentity_id=about_namedentity_id, exclude_statement_id=exclude_statement_id)
+        record = await result.single()
+        if record is None:
+            return None
+        return [{**hit, "about_namedentity_id": record["about_namedentity_id"]} for hit in record["hits"]]
+
+    # One extra candidate in case the excluded statement is among them
+    result = await tx.run("""
+        CALL db.index.vector.queryNodes('statement_embedding', $candidates, $embedding) YIELD node, score
+        MATCH (node)-[:IS_ABOUT]->(p:NamedEntity)
+        WHERE node.statement_id <> coalesce($exclude_statement_id, '')
+        RETURN node.text AS text, node.statement_id AS statement_id, p.namedentity_id AS about_namedentity_id, 2 * score - 1 AS score
+        ORDER BY score DESC, statement_id
+        LIMIT $k
+    """, embedding=embedding, candidates=k + 1 if exclude_statement_id else k, k=k, exclude_statement_id=exclude_statement_id)
+    return [record.data() async for record in result]
@@ -0,0 +1,76 @@
+"""Data access for Topic nodes.
+
+Every function takes a managed transaction as its first argument and is meant to be
+passed to ``execute_read``/``execute_write`` from ``app.utils.neo4j``.
+"""
+from typing import AsyncIterator, List, Optional
+from app.models import Topic
+from app.repository.pagination import after_param, limit_clause
+
+def topic_from_node(node) -> Topic:
+    return Topic(name=node["name"], topic_id=node["topic_id"])
+
+
+async def get_topic_by_id(tx, topic_id: str) -> Optional[Topic]:
+    result = await tx.run("""
+        MATCH (t:Topic {topic_id: $topic_id})
+        RETURN t
+    """, topic_id=topic_id)
+    record = await result.single()
+    if not record:
+        return None
+    return topic_from_node(record["t"])
+
+
+async def get_topics_by_ids(tx, topic_ids: List[str]) -> List[Topic]:
+    """Return the existing topics among topic_ids, in no particular order."""
+    result = await tx.run("""
+        MATCH (t:Topic)
+        WHERE t.topic_id IN $topic_ids
+        RETURN t
+    """, topic_ids=topic_ids)
+    return [topic_from_node(record["t"]) async for record in result]
+
+
+async def create_topic(tx, topic: Topic):
+    await tx.run("""
+        CREATE (p:Topic {name: $name, topic_id: $topic_id})
+    """, name=topic.name, topic_id=topic.topic_id)
+
+
+async def iter_topics(tx, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Topic]:
+    """Yield topics ordered by topic_id, starting after the given topic_id, as the result is consumed."""
+    result = await tx.run(f"""
+        MATCH (t:Topic)
+        WHERE t.topic_id > $after
+        WITH t ORDER BY t.topic_id
+        {limit_clause(limit)}
+        RETURN t
+    """, after=after_param(after), limit=limit)
+    async for record in result:
+        yield topic_from_node(record["t"])
+
+
+async def list_topics(tx, after: Optional[str] = None, limit: Optional[int] = None) -> List[Topic]:
+    return [topic async for topic in iter_topics(tx, after, limit)]
+
+
+async def update_name(tx, topic_id: str, new_name: str) -> Optional[Topic]:
+    result = await tx.run("""
+        MATCH (t:Topic {topic_id: $topic_id})
+        SET t.name = $new_name
+        RETURN t
+    """, topic_id=topic_id, new_name=new_name)
+    record = await result.single()
+    if not record:
+        return None
+    return topic_from_node(record["t"])
+
+
+async def delete_topic(tx, topic_id: str) -> bool:
+    result = await tx.run("""
+        MATCH (t:Topic {topic_id: $topic_id})
+        DETACH DELETE t
+    """, topic_id=topic_id)
+    summary = await result.consume()
+    return summary.counters.nodes_deleted > 0
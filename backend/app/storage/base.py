@@ -0,0 +1,164 @@
+"""The storage interface the endpoints talk to.
+
+``Neo4jStore`` (app/storage/neo4j_store.py) runs the Cypher of app/repository against Neo4j,
+``MemoryStore`` (app/storage/memory_store.py) keeps the graph in process for single-user
+deployments, tests and benchmarks. Both return the pydantic models of app/models.py and use
+the same conventions: lookups return None (or False) when the node they start from does not
+exist, list methods take a keyset cursor (``after``) and a page size (``limit``), and
+``iter_*`` methods yield the same items one by one for streaming responses.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.models import Connection, GraphStatistics, NamedEntity, Neighbourhood, Relationship, SearchHit, SimilarStatement, Statement, StatementBatchResult, Topic
+
+
+class GraphStore(ABC):
+    async def open(self):
+        """Prepare the store before the first request (schema migrations, loading a snapshot)."""
+
+    async def close(self):
+        """Release connections and persist what has to survive a restart."""
+
+    async def check_ready(self) -> Optional[str]:
+        """None if the store can serve requests, otherwise what is missing. Called by /ready, so keep it cheap."""
+        return None
+
+    # General
+    @abstractmethod
+    async def describe_graph(self) -> GraphStatistics: ...
+
+    @abstractmethod
+    async def create_node(self, label: str, properties: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def read_node(self, label: str, id_property: str, node_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def update_node(self, label: str, node_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def delete_node(self, label: str, node_id: str) -> bool: ...
+
+    @abstractmethod
+    async def import_batch(self, namedentities: List[dict], topics: List[dict], statements: List[dict], mentions: List[dict]) -> Tuple[Dict[str, StatementBatchResult], Dict[str, List[str]]]:
+        """Merge imported records by their ids (see app/utils/importer.py). Returns the result per statement row and the linked entities per statement of the mention rows."""
+
+    @abstractmethod
+    def iter_export_records(self, namedentity_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """The whole graph, or the subgraph of one NamedEntity, as records in the import format (see app/utils/exporter.py)."""
+
+    # NamedEntity
+    @abstractmethod
+    async def create_namedentity(self, named_entity: NamedEntity): ...
+
+    @abstractmethod
+    async def get_namedentity_by_id(self, namedentity_id: str) -> Optional[NamedEntity]: ...
+
+    @abstractmethod
+    async def get_namedentities_by_name(self, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[NamedEntity]: ...
+
+    @abstractmethod
+    def iter_namedentities_by_name(self, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[NamedEntity]: ...
+
+    @abstractmethod
+    def iter_namedentity_names(self) -> AsyncIterator[Tuple[str, str]]:
+        """Yield (namedentity_id, name) of every NamedEntity, to build the autocomplete index."""
+
+    @abstractmethod
+    async def get_statements_about(self, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> Optional[List[Statement]]: ...
+
+    @abstractmethod
+    def iter_statements_about(self, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Statement]: ...
+
+    @abstractmethod
+    async def get_connections(self, namedentity_id: str) -> Optional[List[Connection]]:
+        """The entities a NamedEntity is directly related to through derived relationships."""
+
+    @abstractmethod
+    async def get_neighbourhood(self, namedentity_id: str, hops: int, fan_out: int, statement_limit: int, relationship_limit: int) -> Optional[Neighbourhood]:
+        """An entity with its statements and the entities up to hops away, adding at most fan_out entities per hop."""
+
+    @abstractmethod
+    async def set_labels(self, namedentity_id: str, additional_labels: List[str]) -> Optional[NamedEntity]: ...
+
+    @abstractmethod
+    async def delete_namedentity_cascade(self, namedentity_id: str, batch_size: int) -> Optional[Dict[str, int]]:
+        """Delete an entity, the statements about it and their relationships. Returns counters per phase."""
+
+    # Statement
+    @abstractmethod
+    async def create_statement(self, statement: Statement, embedding: Optional[List[float]] = None) -> bool: ...
+
+    @abstractmethod
+    async def create_statements_batch(self, rows: List[dict], chunk_size: int) -> Dict[str, StatementBatchResult]:
+        """Create statements from rows of text, statement_id, about_namedentity_id, mentioned_namedentity_ids, topic_id and embedding."""
+
+    @abstractmethod
+    async def get_statement_by_id(self, statement_id: str) -> Optional[Statement]: ...
+
+    @abstractmethod
+    async def get_mentioned_entities(self, statement_id: str) -> Optional[List[NamedEntity]]: ...
+
+    @abstractmethod
+    async def set_topic(self, statement_id: str, topic_id: Optional[str]) -> bool: ...
+
+    @abstractmethod
+    async def update_mentions(self, statement_id: str, mentioned_namedentity_ids: List[str], replace: bool) -> Optional[Dict[str, List[str]]]:
+        """Link (or, with replace, set) the mentions. The derived relationships are updated by app/genai/pipeline.py."""
+
+    @abstractmethod
+    async def get_derivation_inputs(self, statement_ids: List[str]) -> Dict[str, Tuple[Statement, NamedEntity, List[NamedEntity]]]:
+        """The statement, its about-entity and its mentioned entities per existing statement, to derive relationships from."""
+
+    @abstractmethod
+    async def replace_derived_relationships(self, statement_ids: List[str], relationships: List[Relationship]):
+        """Replace the relationships derived from the statements by the given ones in one transaction."""
+
+    @abstractmethod
+    async def update_text(self, statement_id: str, new_text: str, embedding: Optional[List[float]] = None) -> bool: ...
+
+    @abstractmethod
+    async def delete_statement(self, statement_id: str): ...
+
+    @abstractmethod
+    async def get_statements_to_embed(self, dimensions: int, after: Optional[str], limit: int) -> List[Tuple[str, str]]:
+        """The (statement_id, text) of statements without an embedding of the given size, for the backfill of app/genai/embedding.py."""
+
+    @abstractmethod
+    async def get_statement_rows(self, after: Optional[str], limit: int) -> List[dict]:
+        """Statements in statement_id order after the cursor, as rows of text, statement_id, about_namedentity_id, mentioned_namedentity_ids and topic_id."""
+
+    @abstractmethod
+    async def set_statement_embeddings(self, embeddings: Dict[str, List[float]]): ...
+
+    @abstractmethod
+    async def similar_statements(self, embedding: List[float], k: int, about_namedentity_id: Optional[str], exclude_statement_id: Optional[str]) -> Optional[List[SimilarStatement]]:
+        """The k statements with the most similar embedding, best first. None if about_namedentity_id does not exist."""
+
+    # Topic
+    @abstractmethod
+    async def create_topic(self, topic: Topic): ...
+
+    @abstractmethod
+    async def get_topic_by_id(self, topic_id: str) -> Optional[Topic]: ...
+
+    @abstractmethod
+    async def get_topics_by_ids(self, topic_ids: List[str]) -> List[Topic]:
+        """The existing topics among topic_ids, in no particular order."""
+
+    @abstractmethod
+    async def list_topics(self, after: Optional[str] = None, limit: Optional[int] = None) -> List[Topic]: ...
+
+    @abstractmethod
+    def iter_topics(self, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Topic]: ...
+
+    @abstractmethod
+    async def update_name(self, topic_id: str, new_name: str) -> Optional[Topic]: ...
+
+    @abstractmethod
+    async def delete_topic(self, topic_id: str) -> bool: ...
+
+    # Search
+    @abstractmethod
+    async def search(self, text: str, kinds: List[str], about_namedentity_id: Optional[str], topic_id: Optional[str], offset: int, limit: int) -> List[SearchHit]:
+        """Ranked hits for the words of text among statements and/or named entity names, best first."""
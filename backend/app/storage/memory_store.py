@@ -0,0 +1,740 @@
+"""GraphStore that keeps the whole graph in process, for single-user deployments, tests and benchmarks.
+
+There is one copy of the graph per process, so it must not be used with several workers.
+No method awaits in between its reads and writes, so each call is atomic on the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import Counter, defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+from app.models import Connection, GraphStatistics, NamedEntity, Neighbourhood, NeighbourhoodEntity, NeighbourhoodStatement, Relationship, RelationshipAttributes, SearchHit, SimilarStatement, Statement, StatementBatchResult, Topic
+from app.repository.relationships import filter_derived_relationships, observe_derived_relationships
+from app.storage.base import GraphStore
+from app.utils.search import match_score, search_hit, search_terms
+from app.utils.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# (from_node, relationship_type, to_node, source_statement_id)
+Edge = Tuple[str, str, str, str]
+
+# Labels accepted by the generic node endpoints and the kind of node they refer to
+KIND_OF_LABEL = {"namedentity": "namedentity", "person": "namedentity", "statement": "statement", "topic": "topic"}
+
+
+def _page(ids: Iterable[str], after: Optional[str], limit: Optional[int]) -> List[str]:
+    """Keyset pagination over IDs, in the same order as the Neo4j queries."""
+    page = sorted(node_id for node_id in ids if node_id > (after or ""))
+    return page[:limit] if limit is not None else page
+
+
+class MemoryStore(GraphStore):
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._opened = False
+        self._reset()
+
+    def _reset(self):
+        # Nodes: ID -> properties
+        self.namedentities: Dict[str, Dict[str, Any]] = {}
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self.topics: Dict[str, Dict[str, Any]] = {}
+        # Labels of each NamedEntity besides NamedEntity
+        self.labels: Dict[str, List[str]] = {}
+
+        # Adjacency: (:Statement)-[:IS_ABOUT]->(:NamedEntity)
+        self.about: Dict[str, str] = {}
+        self.statements_about: Dict[str, Set[str]] = defaultdict(set)
+        # (:Statement)-[:MENTIONS]->(:NamedEntity)
+        self.mentions: Dict[str, Set[str]] = defaultdict(set)
+        self.mentioned_by: Dict[str, Set[str]] = defaultdict(set)
+        # (:Statement)-[:HAS_TOPIC]->(:Topic)
+        self.topic_of: Dict[str, str] = {}
+        self.statements_with_topic: Dict[str, Set[str]] = defaultdict(set)
+        # Derived relationships between NamedEntities
+        self.outgoing: Dict[str, Set[Edge]] = defaultdict(set)
+        self.incoming: Dict[str, Set[Edge]] = defaultdict(set)
+
+        # Secondary indexes
+        self.by_name: Dict[str, Set[str]] = defaultdict(set)
+        self.by_source_statement: Dict[str, Set[Edge]] = defaultdict(set)
+        self.embeddings = VectorIndex()
+
+    # Lifecycle and snapshots
+    async def open(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            self.load_snapshot(self.snapshot_path)
+            logger.info("Loaded %d named entities and %d statements from %s", len(self.namedentities), len(self.statements), self.snapshot_path)
+        if self.snapshot_path and self.snapshot_interval > 0:
+            self._snapshot_task = asyncio.create_task(self._snapshot_periodically())
+        self._opened = True
+
+    async def close(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+        # Closed before it was opened (a shutdown during startup), the empty graph must not replace the snapshot
+        if self.snapshot_path and self._opened:
+            await self.snapshot()
+
+    async def _snapshot_periodically(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error("Writing the snapshot to %s failed: %s", self.snapshot_path, e)
+
+    async def snapshot(self, path: Optional[str] = None):
+        """Write the graph to path (default: the snapshot path) without blocking the event loop for the I/O."""
+        # Taken synchronously, so the snapshot is consistent; only serialising and writing run in a thread
+        data = self.to_snapshot()
+        await asyncio.to_thread(self._write_snapshot, data, path or self.snapshot_path)
+
+    @staticmethod
+    def _write_snapshot(data: dict, path: str):
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(data, snapshot_file)
+        os.replace(temporary_path, path)
+
+    def to_snapshot(self) -> dict:
+        return {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "namedentities": [
+                {"properties": properties, "additional_labels": self.labels.get(namedentity_id, [])}
+                for namedentity_id, properties in self.namedentities.items()
+            ],
+            "statements": [
+                {
+                    "properties": properties,
+                    "about_namedentity_id": self.about.get(statement_id),
+                    "mentioned_namedentity_ids": sorted(self.mentions.get(statement_id, ())),
+                    "topic_id": self.topic_of.get(statement_id),
+                    "embedding": self.embeddings.get(statement_id),
+                }
+                for statement_id, properties in self.statements.items()
+            ],
+            "topics": list(self.topics.values()),
+            "relationships": [list(edge) for edges in self.outgoing.values() for edge in edges],
+        }
+
+    def load_snapshot(self, path: str):
+        with open(path) as snapshot_file:
+            data = json.load(snapshot_file)
+        if data.get("version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {data.get('version')!r} in {path}")
+        self._reset()
+        for entity in data["namedentities"]:
+            namedentity_id = entity["properties"]["namedentity_id"]
+            self.namedentities[namedentity_id] = entity["properties"]
+            self.labels[namedentity_id] = entity["additional_labels"]
+            self.by_name[entity["properties"].get("name")].add(namedentity_id)
+        for topic in data["topics"]:
+            self.topics[topic["topic_id"]] = topic
+        for statement in data["statements"]:
+            statement_id = statement["properties"]["statement_id"]
+            self.statements[statement_id] = statement["properties"]
+            if statement["about_namedentity_id"] is not None:
+                self._link_about(statement_id, statement["about_namedentity_id"])
+            for mentioned_id in statement["mentioned_namedentity_ids"]:
+                self._link_mention(statement_id, mentioned_id)
+            if statement["topic_id"] is not None:
+                self._link_topic(statement_id, statement["topic_id"])
+            # Snapshots written before embeddings existed have none; the backfill adds them
+            if statement.get("embedding") is not None:
+                self.embeddings.add(statement_id, statement["embedding"])
+        for edge in data["relationships"]:
+            self._add_edge(tuple(edge))
+
+    # Index maintenance
+    def _link_about(self, statement_id: str, namedentity_id: str):
+        self.about[statement_id] = namedentity_id
+        self.statements_about[namedentity_id].add(statement_id)
+
+    def _link_mention(self, statement_id: str, namedentity_id: str):
+        self.mentions[statement_id].add(namedentity_id)
+        self.mentioned_by[namedentity_id].add(statement_id)
+
+    def _unlink_mentions(self, statement_id: str) -> int:
+        mentioned_ids = self.mentions.pop(statement_id, set())
+        for namedentity_id in mentioned_ids:
+            self.mentioned_by[namedentity_id].discard(statement_id)
+        return len(mentioned_ids)
+
+    def _link_topic(self, statement_id: str, topic_id: str):
+        self._unlink_topic(statement_id)
+        self.topic_of[statement_id] = topic_id
+        self.statements_with_topic[topic_id].add(statement_id)
+
+    def _unlink_topic(self, statement_id: str) -> int:
+        topic_id = self.topic_of.pop(statement_id, None)
+        if topic_id is None:
+            return 0
+        self.statements_with_topic[topic_id].discard(statement_id)
+        return 1
+
+    def _add_edge(self, edge: Edge):
+        from_node, _, to_node, source_statement_id = edge
+        self.outgoing[from_node].add(edge)
+        self.incoming[to_node].add(edge)
+        self.by_source_statement[source_statement_id].add(edge)
+
+    def _remove_edge(self, edge: Edge):
+        from_node, _, to_node, source_statement_id = edge
+        self.outgoing[from_node].discard(edge)
+        self.incoming[to_node].discard(edge)
+        self.by_source_statement[source_statement_id].discard(edge)
+
+    def _add_derived_relationships(self, relationships: List[Relationship]):
+        relationships = filter_derived_relationships(relationships)
+        for relationship in relationships:
+            source_statement_id = relationship.attributes.source_statement_id
+            # The statement may have been deleted since its relationships were derived
+            if source_statement_id not in self.statements or relationship.from_node not in self.namedentities or relationship.to_node not in self.namedentities:
+                continue
+            self._add_edge((relationship.from_node, relationship.relationship_type, relationship.to_node, source_statement_id))
+            self._add_edge((relationship.to_node, relationship.relationship_type, relationship.from_node, source_statement_id))
+        observe_derived_relationships(relationships)
+
+    def _delete_derived_relationships(self, statement_id: str) -> int:
+        edges = self.by_source_statement.pop(statement_id, set())
+        for edge in edges:
+            self._remove_edge(edge)
+        return len(edges)
+
+    def _detach_statement(self, statement_id: str) -> int:
+        """Remove a statement and its IS_ABOUT, MENTIONS and HAS_TOPIC relationships. Returns how many relationships it had."""
+        self.statements.pop(statement_id)
+        self.embeddings.remove(statement_id)
+        relationship_count = self._unlink_mentions(statement_id) + self._unlink_topic(statement_id)
+        namedentity_id = self.about.pop(statement_id, None)
+        if namedentity_id is not None:
+            self.statements_about[namedentity_id].discard(statement_id)
+            relationship_count += 1
+        return relationship_count
+
+    def _detach_namedentity(self, namedentity_id: str) -> int:
+        """Remove a NamedEntity and all its relationships. Returns how many relationships it had."""
+        properties = self.namedentities.pop(namedentity_id)
+        self.labels.pop(namedentity_id, None)
+        self.by_name[properties.get("name")].discard(namedentity_id)
+        relationship_count = 0
+        for edge in self.outgoing.pop(namedentity_id, set()) | self.incoming.pop(namedentity_id, set()):
+            self._remove_edge(edge)
+            relationship_count += 1
+        for statement_id in self.mentioned_by.pop(namedentity_id, set()):
+            self.mentions[statement_id].discard(namedentity_id)
+            relationship_count += 1
+        for statement_id in self.statements_about.pop(namedentity_id, set()):
+            self.about.pop(statement_id, None)
+            relationship_count += 1
+        return relationship_count
+
+    # Model conversion
+    def _namedentity(self, namedentity_id: str) -> Optional[NamedEntity]:
+        properties = self.namedentities.get(namedentity_id)
+        if properties is None:
+            return None
+        return NamedEntity(name=properties.get("name"), namedentity_id=namedentity_id, additional_labels=list(self.labels.get(namedentity_id, [])))
+
+    def _statement(self, statement_id: str) -> Optional[Statement]:
+        properties = self.statements.get(statement_id)
+        if properties is None or statement_id not in self.about:
+            return None
+        return Statement(text=properties.get("text"), statement_id=statement_id, about_namedentity_id=self.about[statement_id])
+
+    def _topic(self, topic_id: str) -> Optional[Topic]:
+        properties = self.topics.get(topic_id)
+        if properties is None:
+            return None
+        return Topic(name=properties.get("name"), topic_id=topic_id)
+
+    # General
+    def _nodes_of(self, label: str) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+        kind = KIND_OF_LABEL.get(label.lower())
+        if kind is None:
+            raise ValueError(f"Label {label} is not supported by the in-memory store")
+        return kind, {"namedentity": self.namedentities, "statement": self.statements, "topic": self.topics}[kind]
+
+    def _find_node(self, label: str, id_property: str, node_id: str) -> Optional[Tuple[str, str]]:
+        """Return the kind and ID of the node with label whose id_property is node_id."""
+        kind, nodes = self._nodes_of(label)
+        for candidate_id, properties in ([(node_id, nodes[node_id])] if id_property == f"{kind}_id" and node_id in nodes else nodes.items()):
+            if properties.get(id_property) != node_id:
+                continue
+            if kind == "namedentity" and label.lower() == "person" and "Person" not in self.labels.get(candidate_id, []):
+                continue
+            return kind, candidate_id
+        return None
+
+    async def describe_graph(self) -> GraphStatistics:
+        labels = Counter(label for labels in self.labels.values() for label in labels)
+        labels.update({"NamedEntity": len(self.namedentities), "Statement": len(self.statements), "Topic": len(self.topics)})
+        relationship_types = Counter(relationship_type for edges in self.outgoing.values() for _, relationship_type, _, _ in edges)
+        relationship_types.update({"IS_ABOUT": len(self.about), "MENTIONS": sum(map(len, self.mentions.values())), "HAS_TOPIC": len(self.topic_of)})
+        return GraphStatistics(
+            nodes=len(self.namedentities) + len(self.statements) + len(self.topics),
+            statements=len(self.statements),
+            relationships=sum(relationship_types.values()),
+            labels={label: count for label, count in sorted(labels.items()) if count},
+            relationship_types={relationship_type: count for relationship_type, count in sorted(relationship_types.items()) if count},
+        )
+
+    async def create_node(self, label: str, properties: Dict[str, Any]):
+        kind, nodes = self._nodes_of(label)
+        node_id = properties.get(f"{kind}_id")
+        if node_id is None or node_id in nodes:
+            raise ValueError(f"{label} needs a new, unique {kind}_id")
+        properties = dict(properties)
+        if kind == "statement" and properties.get("embedding") is not None:
+            self.embeddings.add(node_id, properties.pop("embedding"))
+        nodes[node_id] = properties
+        if kind == "namedentity":
+            self.labels[node_id] = [label] if label.lower() == "person" else []
+            self.by_name[properties.get("name")].add(node_id)
+
+    async def read_node(self, label: str, id_property: str, node_id: str) -> Optional[Dict[str, Any]]:
+        found = self._find_node(label, id_property, node_id)
+        if found is None:
+            return None
+        kind, found_id = found
+        return dict(self._nodes_of(label)[1][found_id])
+
+    async def update_node(self, label: str, node_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        found = self._find_node(label, f"{label.lower()}_id", node_id)
+        if found is None:
+            return None
+        kind, found_id = found
+        if f"{kind}_id" in updates and updates[f"{kind}_id"] != found_id:
+            raise ValueError(f"Changing the {kind}_id is not supported by the in-memory store")
+        properties = self._nodes_of(label)[1][found_id]
+        if kind == "statement" and "embedding" in updates:
+            updates = dict(updates)
+            embedding = updates.pop("embedding")
+            if embedding is None:
+                self.embeddings.remove(found_id)
+            else:
+                self.embeddings.add(found_id, embedding)
+        if kind == "namedentity" and "name" in updates:
+            self.by_name[properties.get("name")].discard(found_id)
+            self.by_name[updates["name"]].add(found_id)
+        properties.update(updates)
+        return dict(properties)
+
+    async def delete_node(self, label: str, node_id: str) -> bool:
+        found = self._find_node(label, f"{label.lower()}_id", node_id)
+        if found is None:
+            return False
+        kind, found_id = found
+        if kind == "namedentity":
+            self._detach_namedentity(found_id)
+        elif kind == "statement":
+            self._detach_statement(found_id)
+        else:
+            for statement_id in self.statements_with_topic.pop(found_id, set()):
+                self.topic_of.pop(statement_id, None)
+            self.topics.pop(found_id)
+        return True
+
+    async def import_batch(self, namedentities: List[dict], topics: List[dict], statements: List[dict], mentions: List[dict]) -> Tuple[Dict[str, StatementBatchResult], Dict[str, List[str]]]:
+        # Same semantics as the MERGE queries of the Neo4j store: overwrite properties, move statements, add mentions
+        for row in namedentities:
+            namedentity_id = row["namedentity_id"]
+            previous = self.namedentities.get(namedentity_id)
+            if previous is not None:
+                self.by_name[previous["name"]].discard(namedentity_id)
+            self.namedentities[namedentity_id] = {"name": row["name"], "namedentity_id": namedentity_id}
+            self.labels[namedentity_id] = list(dict.fromkeys(self.labels.get(namedentity_id, []) + row["additional_labels"]))
+            self.by_name[row["name"]].add(namedentity_id)
+        for row in topics:
+            self.topics[row["topic_id"]] = {"name": row["name"], "topic_id": row["topic_id"]}
+
+        results = {}
+        for row in statements:
+            statement_id = row["statement_id"]
+            if row["about_namedentity_id"] not in self.namedentities:
+                results[statement_id] = StatementBatchResult(statement_id=statement_id, created=False, detail="NamedEntity that the statement is about does not exist")
+                continue
+            self.statements[statement_id] = {"text": row["text"], "statement_id": statement_id}
+            if statement_id in self.about:
+                self.statements_about[self.about[statement_id]].discard(statement_id)
+            self._link_about(statement_id, row["about_namedentity_id"])
+            if row.get("embedding") is not None:
+                self.embeddings.add(statement_id, row["embedding"])
+            elif statement_id in self.embeddings:
+                self.embeddings.remove(statement_id)
+            mentioned_ids = [mentioned_id for mentioned_id in dict.fromkeys(row["mentioned_namedentity_ids"]) if mentioned_id in self.namedentities]
+            for mentioned_id in mentioned_ids:
+                self._link_mention(statement_id, mentioned_id)
+            topic_id = row["topic_id"] if row["topic_id"] in self.topics else None
+            if topic_id is not None:
+                self._link_topic(statement_id, topic_id)
+            results[statement_id] = StatementBatchResult(
+                statement_id=statement_id,
+                created=True,
+                mentioned_namedentity_ids=mentioned_ids,
+                missing_namedentity_ids=[mentioned_id for mentioned_id in row["mentioned_namedentity_ids"] if mentioned_id not in mentioned_ids],
+                topic_id=topic_id,
+            )
+
+        linked = defaultdict(list)
+        for row in mentions:
+            if row["statement_id"] in self.statements and row["namedentity_id"] in self.namedentities:
+                self._link_mention(row["statement_id"], row["namedentity_id"])
+                if row["namedentity_id"] not in linked[row["statement_id"]]:
+                    linked[row["statement_id"]].append(row["namedentity_id"])
+        return results, dict(linked)
+
+    async def iter_export_records(self, namedentity_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # The IDs are taken up front; nodes removed while the export runs are left out
+        if namedentity_id is None:
+            namedentity_ids = sorted(self.namedentities)
+            topic_ids = sorted(self.topics)
+            statement_ids = sorted(self.about)
+            edges = sorted(edge for edges in self.outgoing.values() for edge in edges if edge[0] <= edge[2])
+        else:
+            statement_ids = sorted(self.statements_about.get(namedentity_id, ()))
+            edges = sorted(self.outgoing.get(namedentity_id, ()))
+            namedentity_ids = list(dict.fromkeys(
+                [namedentity_id]
+                + [mentioned_id for statement_id in statement_ids for mentioned_id in sorted(self.mentions.get(statement_id, ()))]
+                + [to_node for _, _, to_node, _ in edges]
+            ))
+            topic_ids = list(dict.fromkeys(self.topic_of[statement_id] for statement_id in statement_ids if statement_id in self.topic_of))
+        for exported_id in namedentity_ids:
+            named_entity = self._namedentity(exported_id)
+            if named_entity is not None:
+                yield {"kind": "namedentity", "namedentity_id": named_entity.namedentity_id, "name": named_entity.name, "additional_labels": named_entity.additional_labels}
+        for exported_id in topic_ids:
+            topic = self._topic(exported_id)
+            if topic is not None:
+                yield {"kind": "topic", "topic_id": topic.topic_id, "name": topic.name}
+        for exported_id in statement_ids:
+            statement = self._statement(exported_id)
+            if statement is not None:
+                yield {
+                    "kind": "statement",
+                    "statement_id": statement.statement_id,
+                    "text": statement.text,
+                    "about_namedentity_id": statement.about_namedentity_id,
+                    "mentioned_namedentity_ids": sorted(self.mentions.get(exported_id, ())),
+                    "topic_id": self.topic_of.get(exported_id),
+                }
+        for from_node, relationship_type, to_node, source_statement_id in edges:
+            yield {"kind": "relationship", "from_node": from_node, "to_node": to_node, "relationship_type": relationship_type, "source_statement_id": source_statement_id}
+
+    # NamedEntity
+    async def create_namedentity(self, named_entity: NamedEntity):
+        if named_entity.namedentity_id in self.namedentities:
+            raise ValueError(f"NamedEntity with namedentity_id {named_entity.namedentity_id} already exists")
+        self.namedentities[named_entity.namedentity_id] = {"name": named_entity.name, "namedentity_id": named_entity.namedentity_id}
+        self.labels[named_entity.namedentity_id] = list(dict.fromkeys(named_entity.additional_labels or []))
+        self.by_name[named_entity.name].add(named_entity.namedentity_id)
+
+    async def get_namedentity_by_id(self, namedentity_id: str) -> Optional[NamedEntity]:
+        return self._namedentity(namedentity_id)
+
+    async def get_namedentities_by_name(self, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[NamedEntity]:
+        return [self._namedentity(namedentity_id) for namedentity_id in _page(self.by_name.get(name, ()), after, limit)]
+
+    async def iter_namedentities_by_name(self, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[NamedEntity]:
+        for named_entity in await self.get_namedentities_by_name(name, after, limit):
+            yield named_entity
+
+    async def iter_namedentity_names(self) -> AsyncIterator[Tuple[str, str]]:
+        for namedentity_id, properties in list(self.namedentities.items()):
+            yield namedentity_id, properties.get("name")
+
+    async def get_statements_about(self, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> Optional[List[Statement]]:
+        if namedentity_id not in self.namedentities:
+            return None
+        return [self._statement(statement_id) for statement_id in _page(self.statements_about.get(namedentity_id, ()), after, limit)]
+
+    async def iter_statements_about(self, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Statement]:
+        for statement in await self.get_statements_about(namedentity_id, after, limit) or []:
+            yield statement
+
+    async def get_connections(self, namedentity_id: str) -> Optional[List[Connection]]:
+        if namedentity_id not in self.namedentities:
+            return None
+        return [
+            Connection(
+                connected_entity=self._namedentity(to_node),
+                relationship=Relationship(
+                    from_node=from_node,
+                    to_node=to_node,
+                    relationship_type=relationship_type,
+                    attributes=RelationshipAttributes(source_statement_id=source_statement_id),
+                ),
+            )
+            for from_node, relationship_type, to_node, source_statement_id in sorted(self.outgoing.get(namedentity_id, ()))
+        ]
+
+    async def get_neighbourhood(self, namedentity_id: str, hops: int, fan_out: int, statement_limit: int, relationship_limit: int) -> Optional[Neighbourhood]:
+        if namedentity_id not in self.namedentities:
+            return None
+        statement_ids = sorted(self.statements_about.get(namedentity_id, ()))
+        truncated = len(statement_ids) > statement_limit
+
+        # Same expansion as the Neo4j query: the lowest unseen neighbour IDs of each frontier entity in turn, fan_out per hop
+        seen, frontier, entities = {namedentity_id}, [namedentity_id], []
+        for hop in range(1, hops + 1):
+            next_frontier = []
+            for entity_id in frontier:
+                candidates = sorted({to_node for _, _, to_node, _ in self.outgoing.get(entity_id, ())} - seen - set(next_frontier))
+                next_frontier.extend(candidates)
+                if len(next_frontier) > fan_out:
+                    break
+            truncated = truncated or len(next_frontier) > fan_out
+            next_frontier = next_frontier[:fan_out]
+            seen.update(next_frontier)
+            entities.extend(NeighbourhoodEntity(namedentity=self._namedentity(entity_id), hops=hop) for entity_id in next_frontier)
+            frontier = next_frontier
+
+        # Every derived relationship is stored in both directions, keep the one from the lower ID
+        edges = sorted(
+            (from_node, to_node, relationship_type, source_statement_id)
+            for entity_id in seen
+            for from_node, relationship_type, to_node, source_statement_id in self.outgoing.get(entity_id, ())
+            if from_node < to_node and to_node in seen
+        )
+        truncated = truncated or len(edges) > relationship_limit
+        return Neighbourhood(
+            namedentity=self._namedentity(namedentity_id),
+            statements=[
+                NeighbourhoodStatement(
+                    statement=self._statement(statement_id),
+                    mentioned_namedentities=[self._namedentity(mentioned_id) for mentioned_id in sorted(self.mentions.get(statement_id, ()))],
+                    topic=self._topic(self.topic_of[statement_id]) if statement_id in self.topic_of else None,
+                )
+                for statement_id in statement_ids[:statement_limit]
+            ],
+            connected_entities=entities,
+            relationships=[
+                Relationship(from_node=from_node, to_node=to_node, relationship_type=relationship_type, attributes=RelationshipAttributes(source_statement_id=source_statement_id))
+                for from_node, to_node, relationship_type, source_statement_id in edges[:relationship_limit]
+            ],
+            truncated=truncated,
+        )
+
+    async def set_labels(self, namedentity_id: str, additional_labels: List[str]) -> Optional[NamedEntity]:
+        if namedentity_id not in self.namedentities:
+            return None
+        self.labels[namedentity_id] = [label for label in dict.fromkeys(additional_labels) if label != "NamedEntity"]
+        return self._namedentity(namedentity_id)
+
+    async def delete_namedentity_cascade(self, namedentity_id: str, batch_size: int) -> Optional[Dict[str, int]]:
+        # batch_size only bounds Neo4j transactions; here the whole cascade is one atomic step
+        if namedentity_id not in self.namedentities:
+            return None
+        statement_ids = list(self.statements_about.get(namedentity_id, ()))
+        derived_relationships_deleted = sum(self._delete_derived_relationships(statement_id) for statement_id in statement_ids)
+        for statement_id in statement_ids:
+            self._detach_statement(statement_id)
+        relationships_deleted = self._detach_namedentity(namedentity_id)
+        return {
+            "statements_deleted": len(statement_ids),
+            "derived_relationships_deleted": derived_relationships_deleted,
+            "relationships_deleted": relationships_deleted,
+        }
+
+    # Statement
+    async def create_statement(self, statement: Statement, embedding: Optional[List[float]] = None) -> bool:
+        if statement.about_namedentity_id not in self.namedentities:
+            return False
+        if statement.statement_id in self.statements:
+            raise ValueError(f"Statement with statement_id {statement.statement_id} already exists")
+        self.statements[statement.statement_id] = {"text": statement.text, "statement_id": statement.statement_id}
+        self._link_about(statement.statement_id, statement.about_namedentity_id)
+        if embedding is not None:
+            self.embeddings.add(statement.statement_id, embedding)
+        return True
+
+    async def create_statements_batch(self, rows: List[dict], chunk_size: int) -> Dict[str, StatementBatchResult]:
+        # chunk_size only bounds the size of Neo4j queries; rows are processed one by one here
+        results = {}
+        for row in rows:
+            statement_id = row["statement_id"]
+            if row["about_namedentity_id"] not in self.namedentities:
+                results[statement_id] = StatementBatchResult(statement_id=statement_id, created=False, detail="NamedEntity that the statement is about does not exist")
+                continue
+            if statement_id in self.statements:
+                results[statement_id] = StatementBatchResult(statement_id=statement_id, created=False, detail="Statement with this id already exists")
+                continue
+            self.statements[statement_id] = {"text": row["text"], "statement_id": statement_id}
+            self._link_about(statement_id, row["about_namedentity_id"])
+            if row.get("embedding") is not None:
+                self.embeddings.add(statement_id, row["embedding"])
+            mentioned_ids = [mentioned_id for mentioned_id in row["mentioned_namedentity_ids"] if mentioned_id in self.namedentities]
+            for mentioned_id in mentioned_ids:
+                self._link_mention(statement_id, mentioned_id)
+            topic_id = row["topic_id"] if row["topic_id"] in self.topics else None
+            if topic_id is not None:
+                self._link_topic(statement_id, topic_id)
+            results[statement_id] = StatementBatchResult(
+                statement_id=statement_id,
+                created=True,
+                mentioned_namedentity_ids=mentioned_ids,
+                missing_namedentity_ids=[mentioned_id for mentioned_id in row["mentioned_namedentity_ids"] if mentioned_id not in mentioned_ids],
+                topic_id=topic_id,
+            )
+        return results
+
+    async def get_statement_by_id(self, statement_id: str) -> Optional[Statement]:
+        return self._statement(statement_id)
+
+    async def get_mentioned_entities(self, statement_id: str) -> Optional[List[NamedEntity]]:
+        if statement_id not in self.statements:
+            return None
+        return [self._namedentity(namedentity_id) for namedentity_id in sorted(self.mentions.get(statement_id, ()))]
+
+    async def set_topic(self, statement_id: str, topic_id: Optional[str]) -> bool:
+        if statement_id not in self.statements:
+            return False
+        self._unlink_topic(statement_id)
+        if topic_id in self.topics:
+            self._link_topic(statement_id, topic_id)
+        return True
+
+    async def update_mentions(self, statement_id: str, mentioned_namedentity_ids: List[str], replace: bool) -> Optional[Dict[str, List[str]]]:
+        if self._statement(statement_id) is None:
+            return None
+        if replace:
+            self._unlink_mentions(statement_id)
+        mentioned_namedentity_ids = list(dict.fromkeys(mentioned_namedentity_ids))
+        resolved = [namedentity_id for namedentity_id in mentioned_namedentity_ids if namedentity_id in self.namedentities]
+        missing = [namedentity_id for namedentity_id in mentioned_namedentity_ids if namedentity_id not in self.namedentities]
+        for namedentity_id in resolved:
+            self._link_mention(statement_id, namedentity_id)
+        return {"mentioned_namedentity_ids": resolved, "missing_namedentity_ids": missing}
+
+    async def get_derivation_inputs(self, statement_ids: List[str]) -> Dict[str, Tuple[Statement, NamedEntity, List[NamedEntity]]]:
+        inputs = {}
+        for statement_id in statement_ids:
+            statement = self._statement(statement_id)
+            if statement is None:
+                continue
+            mentioned = [self._namedentity(namedentity_id) for namedentity_id in sorted(self.mentions.get(statement_id, ()))]
+            inputs[statement_id] = (statement, self._namedentity(statement.about_namedentity_id), mentioned)
+        return inputs
+
+    async def replace_derived_relationships(self, statement_ids: List[str], relationships: List[Relationship]):
+        for statement_id in statement_ids:
+            self._delete_derived_relationships(statement_id)
+        self._add_derived_relationships(relationships)
+
+    async def update_text(self, statement_id: str, new_text: str, embedding: Optional[List[float]] = None) -> bool:
+        if statement_id not in self.statements:
+            return False
+        self.statements[statement_id]["text"] = new_text
+        if embedding is None:
+            self.embeddings.remove(statement_id)
+        else:
+            self.embeddings.add(statement_id, embedding)
+        return True
+
+    async def delete_statement(self, statement_id: str):
+        self._delete_derived_relationships(statement_id)
+        if statement_id in self.statements:
+            self._detach_statement(statement_id)
+
+    async def get_statements_to_embed(self, dimensions: int, after: Optional[str], limit: int) -> List[Tuple[str, str]]:
+        # Adding a vector of another size resets the index, so "not in the index" covers both cases
+        missing = (statement_id for statement_id in self.statements if statement_id not in self.embeddings or self.embeddings.dimensions != dimensions)
+        return [(statement_id, self.statements[statement_id].get("text")) for statement_id in _page(missing, after, limit)]
+
+    async def get_statement_rows(self, after: Optional[str], limit: int) -> List[dict]:
+        return [
+            {
+                "text": self.statements[statement_id].get("text"),
+                "statement_id": statement_id,
+                "about_namedentity_id": self.about.get(statement_id),
+                "mentioned_namedentity_ids": sorted(self.mentions.get(statement_id, ())),
+                "topic_id": self.topic_of.get(statement_id),
+            }
+            for statement_id in _page(self.statements, after, limit)
+        ]
+
+    async def set_statement_embeddings(self, embeddings: Dict[str, List[float]]):
+        for statement_id, embedding in embeddings.items():
+            if statement_id in self.statements:
+                self.embeddings.add(statement_id, embedding)
+
+    async def similar_statements(self, embedding: List[float], k: int, about_namedentity_id: Optional[str], exclude_statement_id: Optional[str]) -> Optional[List[SimilarStatement]]:
+        if about_namedentity_id is not None and about_namedentity_id not in self.namedentities:
+            return None
+        scope = None
+        if about_namedentity_id is not None:
+            scope = self.statements_about.get(about_namedentity_id, set())
+        # One extra candidate in case the excluded statement is among them
+        hits = self.embeddings.search(embedding, k + 1 if exclude_statement_id else k, scope)
+        return [
+            SimilarStatement(statement=self._statement(statement_id), score=score)
+            for statement_id, score in hits
+            if statement_id != exclude_statement_id and statement_id in self.about
+        ][:k]
+
+    # Topic
+    async def create_topic(self, topic: Topic):
+        if topic.topic_id in self.topics:
+            raise ValueError(f"Topic with topic_id {topic.topic_id} already exists")
+        self.topics[topic.topic_id] = {"name": topic.name, "topic_id": topic.topic_id}
+
+    async def get_topic_by_id(self, topic_id: str) -> Optional[Topic]:
+        return self._topic(topic_id)
+
+    async def get_topics_by_ids(self, topic_ids: List[str]) -> List[Topic]:
+        return [self._topic(topic_id) for topic_id in dict.fromkeys(topic_ids) if topic_id in self.topics]
+
+    async def list_topics(self, after: Optional[str] = None, limit: Optional[int] = None) -> List[Topic]:
+        return [self._topic(topic_id) for topic_id in _page(self.topics, after, limit)]
+
+    async def iter_topics(self, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Topic]:
+        for topic in await self.list_topics(after, limit):
+            yield topic
+
+    async def update_name(self, topic_id: str, new_name: str) -> Optional[Topic]:
+        if topic_id not in self.topics:
+            return None
+        self.topics[topic_id]["name"] = new_name
+        return self._topic(topic_id)
+
+    async def delete_topic(self, topic_id: str) -> bool:
+        if topic_id not in self.topics:
+            return False
+        await self.delete_node("Topic", topic_id)
+        return True
+
+    # Search
+    async def search(self, text: str, kinds: List[str], about_namedentity_id: Optional[str], topic_id: Optional[str], offset: int, limit: int) -> List[SearchHit]:
+        # No inverted index: a scan over the texts is fast enough for the graph of a single user
+        terms = search_terms(text)
+        if not terms:
+            return []
+        scored = []
+        if "statement" in kinds:
+            for statement_id, properties in self.statements.items():
+                about = self.about.get(statement_id)
+                if about is None or (about_namedentity_id is not None and about != about_namedentity_id):
+                    continue
+                if topic_id is not None and self.topic_of.get(statement_id) != topic_id:
+                    continue
+                score = match_score(properties.get("text"), terms)
+                if score:
+                    scored.append((score, statement_id, "statement", properties.get("text"), about, self.topic_of.get(statement_id)))
+        if "namedentity" in kinds:
+            for namedentity_id, properties in self.namedentities.items():
+                score = match_score(properties.get("name"), terms)
+                if score:
+                    scored.append((score, namedentity_id, "namedentity", properties.get("name"), None, None))
+        scored.sort(key=lambda hit: (-hit[0], hit[1]))
+        return [
+            search_hit(kind, node_id, node_text, score, terms, about, topic)
+            for score, node_id, kind, node_text, about, topic in scored[offset:offset + limit]
+        ]
@@ -0,0 +1,202 @@
+"""GraphStore backed by Neo4j.
+
+Every method runs one function of app/repository as a managed read or write transaction,
+so the Cypher itself stays in the repository modules. With a change log (BACKUP_DIR) the
+Cypher of every committed write is also logged, for app/db/backup.py to replay after a snapshot.
+"""
+import asyncio
+import functools
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from neo4j import AsyncDriver
+from app.db.changelog import ChangeLog, RecordingDriver, RecordingTransaction
+from app.db.migrations import LATEST_SCHEMA_VERSION, get_schema_version, run_migrations
+from app.models import Connection, GraphStatistics, NamedEntity, Neighbourhood, Relationship, SearchHit, SimilarStatement, Statement, StatementBatchResult, Topic
+from app.repository import general as general_repository
+from app.repository import namedentity as namedentity_repository
+from app.repository import statement as statement_repository
+from app.repository import search as search_repository
+from app.repository import topic as topic_repository
+from app.storage.base import GraphStore
+from app.utils.neo4j import execute_read, execute_write, stream_read
+from app.utils.search import lucene_query, search_hit, search_terms
+
+
+class Neo4jStore(GraphStore):
+    def __init__(self, driver: AsyncDriver, change_log: Optional[ChangeLog] = None):
+        self.driver = driver
+        self.change_log = change_log
+
+    async def open(self):
+        # Bring the schema (constraints and indexes) up to date; a no-op if it already is
+        await run_migrations(self.driver)
+
+    async def check_ready(self) -> Optional[str]:
+        # One small read: reaches the database and confirms that no migration is missing
+        version = await get_schema_version(self.driver)
+        if version < LATEST_SCHEMA_VERSION:
+            return f"schema at version {version}, expected {LATEST_SCHEMA_VERSION}"
+        return None
+
+    async def close(self):
+        await self.driver.close()
+        if self.change_log is not None:
+            self.change_log.close()
+
+    async def _write(self, work, *args):
+        """execute_write, logging the statements of the committed transaction to the change log."""
+        if self.change_log is None:
+            return await execute_write(self.driver, work, *args)
+        statements = []
+
+        # Keeps the name of work, under which its queries are timed
+        @functools.wraps(work)
+        async def recorded_work(tx, *args):
+            # Managed transactions are retried; only the statements of the attempt that commits are kept
+            statements.clear()
+            return await work(RecordingTransaction(tx, statements), *args)
+
+        result = await execute_write(self.driver, recorded_work, *args)
+        await asyncio.to_thread(self.change_log.append, statements)
+        return result
+
+    # General
+    async def describe_graph(self) -> GraphStatistics:
+        return await execute_read(self.driver, general_repository.describe_graph)
+
+    async def create_node(self, label: str, properties: Dict[str, Any]):
+        await self._write(general_repository.create_node, label, properties)
+
+    async def read_node(self, label: str, id_property: str, node_id: str) -> Optional[Dict[str, Any]]:
+        return await execute_read(self.driver, general_repository.read_node, label, id_property, node_id)
+
+    async def update_node(self, label: str, node_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self._write(general_repository.update_node, label, node_id, updates)
+
+    async def delete_node(self, label: str, node_id: str) -> bool:
+        return await self._write(general_repository.delete_node, label, node_id)
+
+    async def import_batch(self, namedentities: List[dict], topics: List[dict], statements: List[dict], mentions: List[dict]) -> Tuple[Dict[str, StatementBatchResult], Dict[str, List[str]]]:
+        return await self._write(general_repository.import_batch, namedentities, topics, statements, mentions)
+
+    def iter_export_records(self, namedentity_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        return stream_read(self.driver, general_repository.iter_export_records, namedentity_id)
+
+    # NamedEntity
+    async def create_namedentity(self, named_entity: NamedEntity):
+        await self._write(namedentity_repository.create_namedentity, named_entity)
+
+    async def get_namedentity_by_id(self, namedentity_id: str) -> Optional[NamedEntity]:
+        return await execute_read(self.driver, namedentity_repository.get_namedentity_by_id, namedentity_id)
+
+    async def get_namedentities_by_name(self, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[NamedEntity]:
+        return await execute_read(self.driver, namedentity_repository.get_namedentities_by_name, name, after, limit)
+
+    def iter_namedentities_by_name(self, name: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[NamedEntity]:
+        return stream_read(self.driver, namedentity_repository.iter_namedentities_by_name, name, after, limit)
+
+    def iter_namedentity_names(self) -> AsyncIterator[Tuple[str, str]]:
+        return stream_read(self.driver, namedentity_repository.iter_namedentity_names)
+
+    async def get_statements_about(self, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> Optional[List[Statement]]:
+        return await execute_read(self.driver, namedentity_repository.get_statements_about, namedentity_id, after, limit)
+
+    def iter_statements_about(self, namedentity_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Statement]:
+        return stream_read(self.driver, namedentity_repository.iter_statements_about, namedentity_id, after, limit)
+
+    async def get_connections(self, namedentity_id: str) -> Optional[List[Connection]]:
+        return await execute_read(self.driver, namedentity_repository.get_connections, namedentity_id)
+
+    async def get_neighbourhood(self, namedentity_id: str, hops: int, fan_out: int, statement_limit: int, relationship_limit: int) -> Optional[Neighbourhood]:
+        return await execute_read(self.driver, namedentity_repository.get_neighbourhood, namedentity_id, hops, fan_out, statement_limit, relationship_limit)
+
+    async def set_labels(self, namedentity_id: str, additional_labels: List[str]) -> Optional[NamedEntity]:
+        return await self._write(namedentity_repository.set_labels, namedentity_id, additional_labels)
+
+    async def delete_namedentity_cascade(self, namedentity_id: str, batch_size: int) -> Optional[Dict[str, int]]:
+        # Runs its own batched transactions, see the repository function
+        if self.change_log is None:
+            return await namedentity_repository.delete_namedentity_cascade(self.driver, namedentity_id, batch_size)
+        statements = []
+        result = await namedentity_repository.delete_namedentity_cascade(RecordingDriver(self.driver, statements), namedentity_id, batch_size)
+        if result is not None:
+            await asyncio.to_thread(self.change_log.append, statements, True)
+        return result
+
+    # Statement
+    async def create_statement(self, statement: Statement, embedding: Optional[List[float]] = None) -> bool:
+        return await self._write(statement_repository.create_statement, statement, embedding)
+
+    async def create_statements_batch(self, rows: List[dict], chunk_size: int) -> Dict[str, StatementBatchResult]:
+        return await self._write(statement_repository.create_statements_batch, rows, chunk_size)
+
+    async def get_statement_by_id(self, statement_id: str) -> Optional[Statement]:
+        return await execute_read(self.driver, statement_repository.get_statement_by_id, statement_id)
+
+    async def get_mentioned_entities(self, statement_id: str) -> Optional[List[NamedEntity]]:
+        return await execute_read(self.driver, statement_repository.get_mentioned_entities, statement_id)
+
+    async def set_topic(self, statement_id: str, topic_id: Optional[str]) -> bool:
+        return await self._write(statement_repository.set_topic, statement_id, topic_id)
+
+    async def update_mentions(self, statement_id: str, mentioned_namedentity_ids: List[str], replace: bool) -> Optional[Dict[str, List[str]]]:
+        return await self._write(statement_repository.update_mentions, statement_id, mentioned_namedentity_ids, replace)
+
+    async def get_derivation_inputs(self, statement_ids: List[str]) -> Dict[str, Tuple[Statement, NamedEntity, List[NamedEntity]]]:
+        return await execute_read(self.driver, statement_repository.get_derivation_inputs, statement_ids)
+
+    async def replace_derived_relationships(self, statement_ids: List[str], relationships: List[Relationship]):
+        await self._write(statement_repository.replace_derived_relationships, statement_ids, relationships)
+
+    async def update_text(self, statement_id: str, new_text: str, embedding: Optional[List[float]] = None) -> bool:
+        return await self._write(statement_repository.update_text, statement_id, new_text, embedding)
+
+    async def delete_statement(self, statement_id: str):
+        await self._write(statement_repository.delete_statement, statement_id)
+
+    async def get_statements_to_embed(self, dimensions: int, after: Optional[str], limit: int) -> List[Tuple[str, str]]:
+        return await execute_read(self.driver, statement_repository.get_statements_to_embed, dimensions, after, limit)
+
+    async def get_statement_rows(self, after: Optional[str], limit: int) -> List[dict]:
+        return await execute_read(self.driver, statement_repository.get_statement_rows, after, limit)
+
+    async def set_statement_embeddings(self, embeddings: Dict[str, List[float]]):
+        await self._write(statement_repository.set_statement_embeddings, embeddings)
+
+    async def similar_statements(self, embedding: List[float], k: int, about_namedentity_id: Optional[str], exclude_statement_id: Optional[str]) -> Optional[List[SimilarStatement]]:
+        rows = await execute_read(self.driver, statement_repository.similar_statements, embedding, k, about_namedentity_id, exclude_statement_id)
+        if rows is None:
+            return None
+        return [
+            SimilarStatement(statement=Statement(text=row["text"], statement_id=row["statement_id"], about_namedentity_id=row["about_namedentity_id"]), score=row["score"])
+            for row in rows
+        ]
+
+    # Topic
+    async def create_topic(self, topic: Topic):
+        await self._write(topic_repository.create_topic, topic)
+
+    async def get_topic_by_id(self, topic_id: str) -> Optional[Topic]:
+        return await execute_read(self.driver, topic_repository.get_topic_by_id, topic_id)
+
+    async def get_topics_by_ids(self, topic_ids: List[str]) -> List[Topic]:
+        return await execute_read(self.driver, topic_repository.get_topics_by_ids, topic_ids)
+
+    async def list_topics(self, after: Optional[str] = None, limit: Optional[int] = None) -> List[Topic]:
+        return await execute_read(self.driver, topic_repository.list_topics, after, limit)
+
+    def iter_topics(self, after: Optional[str] = None, limit: Optional[int] = None) -> AsyncIterator[Topic]:
+        return stream_read(self.driver, topic_repository.iter_topics, after, limit)
+
+    async def update_name(self, topic_id: str, new_name: str) -> Optional[Topic]:
+        return await self._write(topic_repository.update_name, topic_id, new_name)
+
+    async def delete_topic(self, topic_id: str) -> bool:
+        return await self._write(topic_repository.delete_topic, topic_id)
+
+    # Search
+    async def search(self, text: str, kinds: List[str], about_namedentity_id: Optional[str], topic_id: Optional[str], offset: int, limit: int) -> List[SearchHit]:
+        terms = search_terms(text)
+        if not terms:
+            return []
+        rows = await execute_read(self.driver, search_repository.search, lucene_query(terms), kinds, about_namedentity_id, topic_id, offset, limit)
+        return [search_hit(row["kind"], row["id"], row["text"], row["score"], terms, row["about_namedentity_id"], row["topic_id"]) for row in rows]
@@ -0,0 +1,22 @@
+import os
+from fastapi import Request
+from app.db.changelog import create_change_log
+from app.storage.base import GraphStore
+from app.storage.memory_store import MemoryStore
+from app.storage.neo4j_store import Neo4jStore
+from app.utils.neo4j import create_driver
+
+def create_store() -> GraphStore:
+    backend = os.getenv("GRAPH_STORE", "neo4j").lower()
+    if backend == "neo4j":
+        return Neo4jStore(create_driver(), change_log=create_change_log())
+    if backend == "memory":
+        return MemoryStore(
+            snapshot_path=os.getenv("MEMORY_STORE_SNAPSHOT_PATH") or None,
+            snapshot_interval=float(os.getenv("MEMORY_STORE_SNAPSHOT_INTERVAL", "0")),
+        )
+    raise ValueError(f"Unknown GRAPH_STORE {backend!r}, expected neo4j or memory")
+
+
+def get_store(request: Request) -> GraphStore:
+    return request.app.state.store
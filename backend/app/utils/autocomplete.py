@@ -0,0 +1,160 @@
+"""In-process type-ahead index over NamedEntity names for ``@``-mentions.
+
+Names are inserted into a trie once per word start, so ``schm`` finds "Anna Schmidt"; names
+within one typo of the query follow the prefix matches. With several workers an entity
+created through another worker shows up after the next restart.
+"""
+import logging
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import Request
+from app.models import NamedEntitySuggestion
+
+logger = logging.getLogger(__name__)
+
+# Shorter queries are one edit away from almost every name, so they only match as a prefix
+FUZZY_MIN_LENGTH = 3
+
+
+def fold(text: str) -> str:
+    """Lowercase text and strip accents, so "Müller" is found by "mul"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(character for character in decomposed if not unicodedata.combining(character))
+
+
+def index_keys(name: str) -> List[str]:
+    """The folded name starting at each of its words."""
+    words = fold(name).split()
+    return list(dict.fromkeys(" ".join(words[i:]) for i in range(len(words))))
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # NamedEntities with a key ending at this node
+        self.ids: Set[str] = set()
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._root = _TrieNode()
+        self._names: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, namedentity_id: str, name: Optional[str]):
+        """Insert a NamedEntity, replacing its previous name if it is already indexed."""
+        self.remove(namedentity_id)
+        if not name:
+            return
+        self._names[namedentity_id] = name
+        for key in index_keys(name):
+            node = self._root
+            for character in key:
+                node = node.children.setdefault(character, _TrieNode())
+            node.ids.add(namedentity_id)
+
+    def name(self, namedentity_id: str) -> Optional[str]:
+        return self._names.get(namedentity_id)
+
+    def remove(self, namedentity_id: str):
+        name = self._names.pop(namedentity_id, None)
+        if name is None:
+            return
+        for key in index_keys(name):
+            path = [self._root]
+            for character in key:
+                path.append(path[-1].children[character])
+            path[-1].ids.discard(namedentity_id)
+            # Prune the branch back to the last node that is still in use
+            for depth in range(len(key), 0, -1):
+                node = path[depth]
+                if node.ids or node.children:
+                    break
+                del path[depth - 1].children[key[depth - 1]]
+
+    def complete(self, prefix: str, limit: int, fuzzy: bool = True) -> List[NamedEntitySuggestion]:
+        """Up to limit NamedEntities whose name has a word starting with prefix, then (if fuzzy) with a prefix one edit away."""
+        query = " ".join(fold(prefix.lstrip("@")).split())
+        if not query or limit <= 0:
+            return []
+        found: Dict[str, bool] = {}
+
+        node = self._root
+        for character in query:
+            node = node.children.get(character)
+            if node is None:
+                break
+        else:
+            self._collect(node, found, limit, fuzzy=False)
+
+        if fuzzy and len(query) >= FUZZY_MIN_LENGTH and len(found) < limit:
+            for node in self._fuzzy_nodes(query):
+                if len(found) >= limit:
+                    break
+                self._collect(node, found, limit, fuzzy=True)
+
+        return [
+            NamedEntitySuggestion(namedentity_id=namedentity_id, name=self._names[namedentity_id], fuzzy=is_fuzzy)
+            for namedentity_id, is_fuzzy in found.items()
+        ]
+
+    def _collect(self, start: _TrieNode, found: Dict[str, bool], limit: int, fuzzy: bool):
+        """Add the IDs below start to found, in key order, until it holds limit entries."""
+        stack = [start]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            for namedentity_id in sorted(node.ids):
+                if namedentity_id not in found:
+                    found[namedentity_id] = fuzzy
+                    if len(found) >= limit:
+                        return
+            stack.extend(node.children[character] for character in sorted(node.children, reverse=True))
+
+    def _fuzzy_nodes(self, query: str) -> List[_TrieNode]:
+        """The topmost trie nodes whose key is within edit distance 1 of query, in key order.
+
+        Walks the trie with one row of the Levenshtein matrix per node and stops descending as
+        soon as no cell of the row is within distance 1 any more. Typos in the first character
+        are not corrected, which keeps the walk to a single subtree.
+        """
+        start = self._root.children.get(query[0])
+        if start is None:
+            return []
+        matches: List[_TrieNode] = []
+        stack: List[Tuple[_TrieNode, List[int]]] = [(start, _next_row(list(range(len(query) + 1)), query[0], query))]
+        while stack:
+            node, row = stack.pop()
+            if row[-1] <= 1:
+                # Everything below completes this key, so there is no need to look further down
+                matches.append(node)
+                continue
+            for character in sorted(node.children, reverse=True):
+                child_row = _next_row(row, character, query)
+                if min(child_row) <= 1:
+                    stack.append((node.children[character], child_row))
+        return matches
+
+
+def _next_row(previous_row: List[int], character: str, query: str) -> List[int]:
+    """The Levenshtein row of query against a key extended by character."""
+    row = [previous_row[0] + 1]
+    for column, query_character in enumerate(query, 1):
+        row.append(min(row[-1] + 1, previous_row[column] + 1, previous_row[column - 1] + (query_character != character)))
+    return row
+
+
+async def build_autocomplete_index(store, index: Optional[AutocompleteIndex] = None) -> AutocompleteIndex:
+    """Fill an index (a new one by default) with the names of all NamedEntities of the store."""
+    index = index if index is not None else AutocompleteIndex()
+    async for namedentity_id, name in store.iter_namedentity_names():
+        index.add(namedentity_id, name)
+    logger.info("Autocomplete index holds %d named entities", len(index))
+    return index
+
+
+def get_autocomplete(request: Request) -> AutocompleteIndex:
+    return request.app.state.autocomplete
@@ -0,0 +1,390 @@
+"""Materialized briefings of NamedEntities, kept in a local SQLite file and updated by the endpoints as deltas.
+
+Next to the briefings the file keeps what each statement contributed, so removals know what
+to subtract. Writes that bypass the endpoints leave briefings behind the graph until
+``listen-rebuild-briefings`` recomputes them.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi import Request
+from app.storage.store import create_store
+
+logger = logging.getLogger(__name__)
+
+# Latest statements kept per briefing
+LATEST_STATEMENTS = 5
+# Statements read from the graph store per page by rebuild_briefings
+REBUILD_BATCH_SIZE = 1000
+# Briefing documents a rebuild holds in memory before writing them
+REBUILD_DOCUMENTS_PER_WRITE = 1000
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS briefing_statements (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        statement_id TEXT NOT NULL UNIQUE,
+        namedentity_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        topic_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS briefing_statements_namedentity ON briefing_statements (namedentity_id, seq);
+    CREATE INDEX IF NOT EXISTS briefing_statements_topic ON briefing_statements (topic_id);
+    CREATE TABLE IF NOT EXISTS briefing_mentions (
+        statement_id TEXT NOT NULL,
+        namedentity_id TEXT NOT NULL,
+        PRIMARY KEY (statement_id, namedentity_id)
+    );
+    CREATE INDEX IF NOT EXISTS briefing_mentions_namedentity ON briefing_mentions (namedentity_id);
+    CREATE TABLE IF NOT EXISTS briefings (
+        namedentity_id TEXT PRIMARY KEY,
+        briefing TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+"""
+
+# Pages of a rebuild are staged in these (per connection) tables until all of them have been read
+REBUILD_SCHEMA = """
+    DROP TABLE IF EXISTS temp.rebuild_statements;
+    DROP TABLE IF EXISTS temp.rebuild_mentions;
+    CREATE TEMP TABLE rebuild_statements (
+        position INTEGER PRIMARY KEY,
+        statement_id TEXT NOT NULL UNIQUE,
+        namedentity_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        topic_id TEXT
+    );
+    CREATE TEMP TABLE rebuild_mentions (
+        statement_id TEXT NOT NULL,
+        namedentity_id TEXT NOT NULL
+    );
+"""
+
+# What a statement contributes to a briefing: the keys of the rows of GraphStore.create_statements_batch,
+# plus the seq that orders the statements by when the index learned about them
+StatementState = dict
+
+
+class BriefingIndex:
+    """The briefings and the statements they are made of. The public methods run the SQLite work in a thread."""
+
+    def __init__(self, path: str, latest_statements: int = LATEST_STATEMENTS):
+        self.latest_statements = latest_statements
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    # Reading
+    async def get(self, namedentity_id: str) -> Optional[dict]:
+        """The briefing document of an entity, or None if no statement is about it.
+
+        The document holds statement_count, latest ([statement_id, text] pairs, newest first),
+        mentioned and topics (statement counts by ID) and updated_at.
+        """
+        return await asyncio.to_thread(self._get, namedentity_id)
+
+    def _get(self, namedentity_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute("SELECT briefing, updated_at FROM briefings WHERE namedentity_id = ?", (namedentity_id,)).fetchone()
+        return {**json.loads(row["briefing"]), "updated_at": row["updated_at"]} if row is not None else None
+
+    async def is_empty(self) -> bool:
+        return await asyncio.to_thread(self._is_empty)
+
+    def _is_empty(self) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM briefing_statements LIMIT 1").fetchone() is None
+
+    # Deltas, called by the endpoints after the graph store committed the change
+    async def add_statements(self, rows: List[dict]):
+        """Add (or replace) statements given as rows of text, statement_id, about_namedentity_id, mentioned_namedentity_ids and topic_id."""
+        by_id = {row["statement_id"]: row for row in rows if row.get("about_namedentity_id")}
+        await asyncio.to_thread(self._apply, lambda connection: by_id, lambda statement_id, old: {
+            **by_id[statement_id], "seq": old["seq"] if old is not None else None,
+        })
+
+    async def set_text(self, statement_id: str, text: str):
+        await asyncio.to_thread(self._apply, lambda connection: [statement_id], lambda _, old: old and {**old, "text": text})
+
+    async def set_topic(self, statement_id: str, topic_id: Optional[str]):
+        await asyncio.to_thread(self._apply, lambda connection: [statement_id], lambda _, old: old and {**old, "topic_id": topic_id})
+
+    async def set_mentions(self, statement_id: str, mentioned_namedentity_ids: List[str], replace: bool):
+        """Add the mentions of a statement or, with replace, set them."""
+        def change(_, old):
+            if old is None:
+                return None
+            mentioned = [] if replace else old["mentioned_namedentity_ids"]
+            return {**old, "mentioned_namedentity_ids": list(dict.fromkeys(mentioned + mentioned_namedentity_ids))}
+        await asyncio.to_thread(self._apply, lambda connection: [statement_id], change)
+
+    async def remove_statements(self, statement_ids: List[str]):
+        await asyncio.to_thread(self._apply, lambda connection: statement_ids, lambda _, old: None)
+
+    async def remove_namedentity(self, namedentity_id: str):
+        """Remove an entity: its briefing and the statements about it, and its mentions from other statements."""
+        def find(connection):
+            return [row[0] for row in connection.execute("""
+                SELECT statement_id FROM briefing_statements WHERE namedentity_id = ?
+                UNION SELECT statement_id FROM briefing_mentions WHERE namedentity_id = ?
+            """, (namedentity_id, namedentity_id))]
+
+        def change(_, old):
+            if old["about_namedentity_id"] == namedentity_id:
+                return None
+            return {**old, "mentioned_namedentity_ids": [m for m in old["mentioned_namedentity_ids"] if m != namedentity_id]}
+        await asyncio.to_thread(self._apply, find, change)
+
+    async def remove_topic(self, topic_id: str):
+        def find(connection):
+            return [row[0] for row in connection.execute("SELECT statement_id FROM briefing_statements WHERE topic_id = ?", (topic_id,))]
+        await asyncio.to_thread(self._apply, find, lambda _, old: {**old, "topic_id": None})
+
+    async def rebuild(self, pages: AsyncIterator[List[dict]]) -> int:
+        """Replace everything by the given statements, as pages of rows like those of add_statements. Returns their number.
+
+        The pages are staged in SQLite one by one and the briefings aggregated from there, so
+        memory does not grow with the number of statements. Statements the index already knew
+        keep their place among the latest ones; the others are ordered after them, in the
+        order of the pages.
+        """
+        await asyncio.to_thread(self._begin_rebuild)
+        async for page in pages:
+            await asyncio.to_thread(self._stage, page)
+        return await asyncio.to_thread(self._finish_rebuild)
+
+    def _apply(self, find: Callable[[sqlite3.Connection], Iterable[str]], change: Callable[[str, Optional[StatementState]], Optional[StatementState]]):
+        """Replace the state of each statement found by find with what change makes of it, in one transaction."""
+        with self._transaction() as connection:
+            documents: Dict[str, dict] = {}
+            for statement_id in list(find(connection)):
+                old = self._read_statement(connection, statement_id)
+                self._replace(connection, documents, statement_id, old, change(statement_id, old))
+            self._write_documents(connection, documents)
+
+    def _begin_rebuild(self):
+        with self._lock:
+            self._connection.executescript(REBUILD_SCHEMA)
+
+    def _stage(self, rows: List[dict]):
+        rows = [row for row in rows if row.get("about_namedentity_id")]
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO rebuild_statements (statement_id, namedentity_id, text, topic_id) VALUES (?, ?, ?, ?)",
+                [(row["statement_id"], row["about_namedentity_id"], row["text"], row.get("topic_id")) for row in rows],
+            )
+            connection.executemany(
+                "INSERT INTO rebuild_mentions (statement_id, namedentity_id) VALUES (?, ?)",
+                [(row["statement_id"], namedentity_id) for row in rows for namedentity_id in row.get("mentioned_namedentity_ids") or []],
+            )
+
+    def _finish_rebuild(self) -> int:
+        with self._transaction() as connection:
+            for table in ("briefing_mentions", "briefings"):
+                connection.execute(f"DELETE FROM {table}")
+            # Known statements keep their seq; new ones get higher seqs, in the order they were staged
+            connection.execute("""
+                CREATE TEMP TABLE rebuild_seqs AS
+                SELECT staged.statement_id, known.seq FROM rebuild_statements AS staged
+                JOIN briefing_statements AS known ON known.statement_id = staged.statement_id
+            """)
+            connection.execute("DELETE FROM briefing_statements")
+            count = connection.execute("""
+                INSERT INTO briefing_statements (seq, statement_id, namedentity_id, text, topic_id)
+                SELECT rebuild_seqs.seq, staged.statement_id, staged.namedentity_id, staged.text, staged.topic_id
+                FROM rebuild_statements AS staged LEFT JOIN rebuild_seqs ON rebuild_seqs.statement_id = staged.statement_id
+                ORDER BY rebuild_seqs.seq IS NULL, staged.position
+            """).rowcount
+            connection.execute("""
+                INSERT OR IGNORE INTO briefing_mentions (statement_id, namedentity_id)
+                SELECT mention.statement_id, mention.namedentity_id FROM rebuild_mentions AS mention
+                JOIN rebuild_statements AS staged ON staged.statement_id = mention.statement_id
+                ORDER BY mention.rowid
+            """)
+            for table in ("rebuild_seqs", "rebuild_statements", "rebuild_mentions"):
+                connection.execute(f"DROP TABLE temp.{table}")
+            entities = self._aggregate_documents(connection)
+        logger.info("Rebuilt the briefings of %d named entities from %d statements", entities, count)
+        return count
+
+    def _aggregate_documents(self, connection: sqlite3.Connection) -> int:
+        """Write the briefing of every entity from briefing_statements and briefing_mentions, a chunk of entities at a time."""
+        entities = 0
+        statement_counts = connection.execute(
+            "SELECT namedentity_id, count(*) FROM briefing_statements GROUP BY namedentity_id ORDER BY namedentity_id"
+        )
+        while True:
+            chunk = statement_counts.fetchmany(REBUILD_DOCUMENTS_PER_WRITE)
+            if not chunk:
+                return entities
+            documents = {namedentity_id: {"statement_count": count, "mentioned": {}, "topics": {}, "latest": []} for namedentity_id, count in chunk}
+            first, last = chunk[0][0], chunk[-1][0]
+            # An entity mentioned in a statement about itself is not one of its contacts
+            for namedentity_id, mentioned, count in connection.execute("""
+                SELECT statement.namedentity_id, mention.namedentity_id, count(*)
+                FROM briefing_statements AS statement JOIN briefing_mentions AS mention ON mention.statement_id = statement.statement_id
+                WHERE statement.namedentity_id BETWEEN ? AND ? AND mention.namedentity_id != statement.namedentity_id
+                GROUP BY statement.namedentity_id, mention.namedentity_id
+            """, (first, last)):
+                documents[namedentity_id]["mentioned"][mentioned] = count
+            for namedentity_id, topic_id, count in connection.execute("""
+                SELECT namedentity_id, topic_id, count(*) FROM briefing_statements
+                WHERE namedentity_id BETWEEN ? AND ? AND topic_id IS NOT NULL
+                GROUP BY namedentity_id, topic_id
+            """, (first, last)):
+                documents[namedentity_id]["topics"][topic_id] = count
+            self._write_documents(connection, documents)
+            entities += len(documents)
+
+    @staticmethod
+    def _read_statement(connection: sqlite3.Connection, statement_id: str) -> Optional[StatementState]:
+        row = connection.execute(
+            "SELECT seq, namedentity_id, text, topic_id FROM briefing_statements WHERE statement_id = ?", (statement_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        mentioned = connection.execute("SELECT namedentity_id FROM briefing_mentions WHERE statement_id = ? ORDER BY rowid", (statement_id,))
+        return {
+            "statement_id": statement_id,
+            "about_namedentity_id": row["namedentity_id"],
+            "text": row["text"],
+            "topic_id": row["topic_id"],
+            "mentioned_namedentity_ids": [mention[0] for mention in mentioned],
+            "seq": row["seq"],
+        }
+
+    def _replace(self, connection: sqlite3.Connection, documents: Dict[str, dict], statement_id: str, old: Optional[StatementState], new: Optional[StatementState]):
+        if old is not None:
+            self._contribute(self._document(connection, documents, old["about_namedentity_id"]), old, -1)
+            connection.execute("DELETE FROM briefing_statements WHERE statement_id = ?", (statement_id,))
+            connection.execute("DELETE FROM briefing_mentions WHERE statement_id = ?", (statement_id,))
+        if new is not None:
+            self._contribute(self._document(connection, documents, new["about_namedentity_id"]), new, 1)
+            connection.execute(
+                "INSERT INTO briefing_statements (seq, statement_id, namedentity_id, text, topic_id) VALUES (?, ?, ?, ?, ?)",
+                (new.get("seq"), statement_id, new["about_namedentity_id"], new["text"], new.get("topic_id")),
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO briefing_mentions (statement_id, namedentity_id) VALUES (?, ?)",
+                [(statement_id, namedentity_id) for namedentity_id in new.get("mentioned_namedentity_ids") or []],
+            )
+
+    @staticmethod
+    def _document(connection: sqlite3.Connection, documents: Dict[str, dict], namedentity_id: str) -> dict:
+        """The briefing of an entity as changed so far in this transaction."""
+        if namedentity_id not in documents:
+            row = connection.execute("SELECT briefing FROM briefings WHERE namedentity_id = ?", (namedentity_id,)).fetchone()
+            documents[namedentity_id] = json.loads(row[0]) if row is not None else {"statement_count": 0, "mentioned": {}, "topics": {}, "latest": []}
+        return documents[namedentity_id]
+
+    @staticmethod
+    def _contribute(document: dict, state: StatementState, sign: int):
+        """Add (sign 1) or subtract (sign -1) the counts of one statement."""
+        document["statement_count"] += sign
+        counted = [("topics", state.get("topic_id"))] + [
+            # An entity mentioned in a statement about itself is not one of its contacts
+            ("mentioned", namedentity_id) for namedentity_id in dict.fromkeys(state.get("mentioned_namedentity_ids") or []) if namedentity_id != state["about_namedentity_id"]
+        ]
+        for field, key in counted:
+            if key is None:
+                continue
+            count = document[field].get(key, 0) + sign
+            if count > 0:
+                document[field][key] = count
+            else:
+                document[field].pop(key, None)
+
+    def _write_documents(self, connection: sqlite3.Connection, documents: Dict[str, dict]):
+        now = time.time()
+        for namedentity_id, document in documents.items():
+            if document["statement_count"] <= 0:
+                connection.execute("DELETE FROM briefings WHERE namedentity_id = ?", (namedentity_id,))
+                continue
+            # The latest statements are read back in seq order, which also covers removing one of them
+            document["latest"] = [list(row) for row in connection.execute(
+                "SELECT statement_id, text FROM briefing_statements WHERE namedentity_id = ? ORDER BY seq DESC LIMIT ?",
+                (namedentity_id, self.latest_statements),
+            )]
+            connection.execute(
+                "INSERT OR REPLACE INTO briefings (namedentity_id, briefing, updated_at) VALUES (?, ?, ?)",
+                (namedentity_id, json.dumps(document), now),
+            )
+
+
+def top_counts(counts: Dict[str, int], limit: int) -> List[Tuple[str, int]]:
+    """The limit (ID, count) pairs with the highest counts, ties by ID."""
+    return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+async def rebuild_briefings(store, briefings: BriefingIndex, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """Recompute all briefings from the statements of the graph store. Returns the number of statements."""
+    async def pages():
+        after = None
+        while True:
+            page = await store.get_statement_rows(after, batch_size)
+            if not page:
+                return
+            after = page[-1]["statement_id"]
+            yield page
+
+    return await briefings.rebuild(pages())
+
+
+def create_briefing_index() -> BriefingIndex:
+    return BriefingIndex(os.getenv("BRIEFING_PATH", "briefings.sqlite3"))
+
+
+def get_briefings(request: Request) -> BriefingIndex:
+    return request.app.state.briefings
+
+
+async def _rebuild_from_environment():
+    store = create_store()
+    await store.open()
+    briefings = create_briefing_index()
+    try:
+        count = await rebuild_briefings(store, briefings)
+    finally:
+        briefings.close()
+        await store.close()
+    print(f"Rebuilt the briefings from {count} statements")
+
+
+def main():
+    """Entry point of ``listen-rebuild-briefings``."""
+    argparse.ArgumentParser(
+        description="Recompute the briefings in BRIEFING_PATH from the graph store configured by the environment. "
+                    "With GRAPH_STORE=memory, stop the server first: the store is read from its snapshot."
+    ).parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_rebuild_from_environment())
+
+
+if __name__ == "__main__":
+    main()
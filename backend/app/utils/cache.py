@@ -0,0 +1,162 @@
+"""Read-through cache for single-entity lookups by ID.
+
+Endpoints that modify or delete a node invalidate it after their transaction committed.
+Misses are not cached, so creating a node needs no invalidation.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Type
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from app.models import NamedEntity, Statement, Topic
+from app.utils.metrics import ENTITY_CACHE_HITS, ENTITY_CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+# Cached kinds and the models their entries are restored to
+ENTITY_MODELS: Dict[str, Type[BaseModel]] = {
+    "namedentity": NamedEntity,
+    "statement": Statement,
+    "topic": Topic,
+}
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with a time-to-live per entry. Only valid within one worker."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+
+class RedisCacheBackend:
+    """Cache shared by all workers, stored in Redis (or anything speaking its protocol) with a TTL per entry.
+
+    Needs the optional ``redis`` package.
+    """
+
+    def __init__(self, url: str, ttl: float, namespace: str = "listen:entity:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("ENTITY_CACHE_BACKEND=redis requires the redis package (pip install redis)") from e
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.namespace = namespace
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = await self.client.get(self.namespace + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: dict):
+        await self.client.set(self.namespace + key, json.dumps(value), px=int(self.ttl * 1000))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.namespace + key)
+
+    async def delete_prefix(self, prefix: str):
+        keys = [key async for key in self.client.scan_iter(match=self.namespace + prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class EntityCache:
+    def __init__(self, backend=None):
+        # Without a backend every lookup goes to the database
+        self.backend = backend
+
+    @staticmethod
+    def _key(kind: str, entity_id: str) -> str:
+        return f"{kind}:{entity_id}"
+
+    async def get_or_load(self, kind: str, entity_id: str, load: Callable[[], Awaitable[Optional[BaseModel]]]) -> Optional[BaseModel]:
+        """Return the cached entity, or call load and cache its result unless it is None."""
+        if self.backend is None:
+            return await load()
+        try:
+            cached = await self.backend.get(self._key(kind, entity_id))
+        except Exception as e:
+            # A cache outage must not take the read endpoints down with it
+            logger.warning("Entity cache lookup failed: %s", e)
+            cached = None
+        if cached is not None:
+            ENTITY_CACHE_HITS.labels(kind).inc()
+            return ENTITY_MODELS[kind](**cached)
+        ENTITY_CACHE_MISSES.labels(kind).inc()
+        entity = await load()
+        if entity is not None:
+            try:
+                await self.backend.set(self._key(kind, entity_id), jsonable_encoder(entity))
+            except Exception as e:
+                logger.warning("Entity cache update failed: %s", e)
+        return entity
+
+    async def invalidate(self, kind: str, entity_id: str):
+        if self.backend is None:
+            return
+        try:
+            await self.backend.delete(self._key(kind, entity_id))
+        except Exception as e:
+            # The write has committed; failing the request would not undo it. The entry expires with its TTL.
+            logger.warning("Entity cache invalidation of %s %s failed: %s", kind, entity_id, e)
+
+    async def invalidate_kind(self, kind: str):
+        """Drop every cached entity of one kind, e.g. after a cascade removed an unknown set of them."""
+        if self.backend is None:
+            return
+        try:
+            await self.backend.delete_prefix(f"{kind}:")
+        except Exception as e:
+            logger.warning("Entity cache invalidation of all %s entries failed: %s", kind, e)
+
+    async def close(self):
+        if hasattr(self.backend, "close"):
+            await self.backend.close()
+
+
+def create_cache() -> EntityCache:
+    backend = os.getenv("ENTITY_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("ENTITY_CACHE_TTL", "60"))
+    if backend == "memory":
+        return EntityCache(MemoryCacheBackend(int(os.getenv("ENTITY_CACHE_MAXSIZE", "10000")), ttl))
+    if backend == "redis":
+        return EntityCache(RedisCacheBackend(os.getenv("ENTITY_CACHE_REDIS_URL", "redis://localhost:6379/0"), ttl))
+    if backend == "none":
+        return EntityCache()
+    raise ValueError(f"Unknown ENTITY_CACHE_BACKEND {backend!r}, expected memory, redis or none")
+
+
+def get_cache(request: Request) -> EntityCache:
+    return request.app.state.cache
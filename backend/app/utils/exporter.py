@@ -0,0 +1,209 @@
+"""Streaming export of the graph, or of the subgraph of one NamedEntity, as NDJSON or Arrow IPC.
+
+Entities, topics and statements are written as the records of app/utils/importer.py, so an
+export can be imported again; derived relationships follow as records of kind relationship:
+
+    {"kind": "relationship", "from_node": "ne1", "to_node": "ne2", "relationship_type": "KNOWS", "source_statement_id": "s1"}
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import zlib
+from typing import Any, AsyncIterator, Dict, Optional
+from app.storage.store import create_store
+from app.utils.streaming import NDJSON_MEDIA_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Media type of each export format
+FORMATS = {"ndjson": NDJSON_MEDIA_TYPE, "arrow": "application/vnd.apache.arrow.stream"}
+COMPRESSIONS = ("gzip", "zstd")
+# File name suffix of each format and compression, as listen-export infers them
+SUFFIXES = {"ndjson": ".ndjson", "arrow": ".arrow", "gzip": ".gz", "zstd": ".zst"}
+
+# Bytes of NDJSON collected before a chunk is compressed and sent
+EXPORT_CHUNK_SIZE = 1 << 16
+# Rows per Arrow record batch
+EXPORT_ARROW_BATCH_ROWS = int(os.getenv("EXPORT_ARROW_BATCH_ROWS", "10000"))
+
+# Columns of the Arrow stream: the fields of all kinds of records, null where a kind has none
+ARROW_COLUMNS = (
+    "kind", "namedentity_id", "name", "additional_labels", "topic_id", "statement_id", "text",
+    "about_namedentity_id", "mentioned_namedentity_ids", "from_node", "to_node", "relationship_type", "source_statement_id",
+)
+ARROW_LIST_COLUMNS = ("additional_labels", "mentioned_namedentity_ids")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError as e:
+        raise RuntimeError("format=arrow requires the pyarrow package (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _compressor(compression: Optional[str]):
+    """A streaming compressor with compress() and flush(), or None without compression."""
+    if compression is None:
+        return None
+    if compression == "gzip":
+        # wbits 31 writes the gzip container instead of a raw zlib stream
+        return zlib.compressobj(wbits=31)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError("compression=zstd requires the zstandard package (pip install zstandard)") from e
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unknown compression {compression!r}, expected one of {', '.join(COMPRESSIONS)}")
+
+
+async def ndjson_chunks(records: AsyncIterator[Dict[str, Any]], chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Encode records as NDJSON, joined into chunks of about chunk_size bytes."""
+    lines, size = [], 0
+    async for record in records:
+        line = (json.dumps(record) + "\n").encode()
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b"".join(lines)
+
+
+class _ArrowSink:
+    """Write-only file collecting the bytes of the Arrow writer until they are taken."""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+async def arrow_chunks(records: AsyncIterator[Dict[str, Any]], batch_rows: int = EXPORT_ARROW_BATCH_ROWS) -> AsyncIterator[bytes]:
+    """Encode records as an Arrow IPC stream, one chunk per record batch of batch_rows rows."""
+    pyarrow = _pyarrow()
+    schema = pyarrow.schema([
+        (column, pyarrow.list_(pyarrow.string()) if column in ARROW_LIST_COLUMNS else pyarrow.string())
+        for column in ARROW_COLUMNS
+    ])
+    sink = _ArrowSink()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    rows = []
+    async for record in records:
+        rows.append(record)
+        if len(rows) >= batch_rows:
+            writer.write_batch(pyarrow.RecordBatch.from_pylist(rows, schema=schema))
+            rows = []
+            yield sink.take()
+    if rows:
+        writer.write_batch(pyarrow.RecordBatch.from_pylist(rows, schema=schema))
+    writer.close()
+    yield sink.take()
+
+
+async def _compress(chunks: AsyncIterator[bytes], compressor) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(store, namedentity_id: Optional[str] = None, format: str = "ndjson", compression: Optional[str] = None) -> AsyncIterator[bytes]:
+    """The bytes of an export of the graph, or of the subgraph of namedentity_id.
+
+    Missing optional packages (pyarrow, zstandard) raise RuntimeError here, before anything
+    is read or sent.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+    if format == "arrow":
+        _pyarrow()
+    compressor = _compressor(compression)
+    records = store.iter_export_records(namedentity_id)
+    chunks = arrow_chunks(records) if format == "arrow" else ndjson_chunks(records)
+    return _compress(chunks, compressor) if compressor is not None else chunks
+
+
+def export_filename(namedentity_id: Optional[str], format: str, compression: Optional[str]) -> str:
+    """The suggested file name of an export."""
+    name = f"listen-{namedentity_id}" if namedentity_id is not None else "listen-graph"
+    return name + SUFFIXES[format] + (SUFFIXES[compression] if compression else "")
+
+
+def _infer_compression(path: str) -> Optional[str]:
+    for compression in COMPRESSIONS:
+        if path.endswith(SUFFIXES[compression]):
+            return compression
+    return None
+
+
+async def _export_file(args) -> int:
+    compression = _infer_compression(args.path) if args.compression is None else (None if args.compression == "none" else args.compression)
+    store = create_store()
+    await store.open()
+    written = 0
+    try:
+        if args.namedentity_id is not None and await store.get_namedentity_by_id(args.namedentity_id) is None:
+            raise SystemExit(f"NamedEntity {args.namedentity_id} not found")
+        chunks = export_stream(store, args.namedentity_id, args.format, compression)
+        if args.path == "-":
+            async for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+                written += len(chunk)
+            sys.stdout.buffer.flush()
+            return written
+        # Written under a temporary name and renamed when complete, like the backup snapshots
+        temporary_path = args.path + ".tmp"
+        output_file = await asyncio.to_thread(open, temporary_path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(output_file.write, chunk)
+                written += len(chunk)
+        finally:
+            await asyncio.to_thread(output_file.close)
+        os.replace(temporary_path, args.path)
+    finally:
+        await store.close()
+    logger.info("Exported %d bytes to %s", written, args.path)
+    return written
+
+
+def main():
+    """Entry point of ``listen-export``."""
+    parser = argparse.ArgumentParser(
+        description="Export the graph store configured by the environment, or the subgraph of one entity, "
+                    "as NDJSON (which listen-import reads back) or Arrow IPC."
+    )
+    parser.add_argument("path", help="Output file, or - for stdout")
+    parser.add_argument("--namedentity-id", help="Export only the subgraph of this entity")
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--compression", choices=[*COMPRESSIONS, "none"], help="Default: gzip for .gz and zstd for .zst paths, none otherwise")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_export_file(args))
+
+
+if __name__ == "__main__":
+    main()
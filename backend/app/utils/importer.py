@@ -0,0 +1,304 @@
+"""Bulk import of entities, topics, statements and mentions from NDJSON, one record per line:
+
+    {"kind": "namedentity", "namedentity_id": "ne1", "name": "Marie Weber", "additional_labels": ["Person"]}
+    {"kind": "topic", "topic_id": "t1", "name": "Work"}
+    {"kind": "statement", "statement_id": "s1", "text": "Marie met Paul", "about_namedentity_id": "ne1",
+     "mentioned_namedentity_ids": ["ne2"], "topic_id": "t1"}
+    {"kind": "mention", "statement_id": "s1", "namedentity_id": "ne3"}
+
+Records are merged by ID in batches, so an import can be repeated or resumed from its
+checkpoint. Relationship records of exports are skipped and derived again. A statement
+whose about-entity only comes in a later batch is skipped, so list entities first.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.genai.embedding import Embedder, create_embedder
+from app.genai.pipeline import DerivationQueue
+from app.models import ImportResult, StatementBatchResult
+from app.storage.store import create_store
+from app.utils.briefing import BriefingIndex, create_briefing_index
+
+logger = logging.getLogger(__name__)
+
+# Rows written per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Problems listed in ImportResult.errors; further ones are only counted
+MAX_REPORTED_ERRORS = 20
+# Bytes read from the input file per chunk by listen-import
+READ_CHUNK_SIZE = 1 << 20
+
+# The required string fields of each kind of record, in the order the batches are written
+FIELDS = {
+    "namedentity": ("namedentity_id", "name"),
+    "topic": ("topic_id", "name"),
+    "statement": ("statement_id", "text", "about_namedentity_id"),
+    "mention": ("statement_id", "namedentity_id"),
+}
+
+# Kinds of records that are read but not written
+SKIPPED_KINDS = ("relationship",)
+
+# Rows per kind of one batch
+ImportBatch = Dict[str, List[dict]]
+OnBatch = Callable[[ImportBatch, Dict[str, StatementBatchResult], Dict[str, List[str]], ImportResult], Awaitable[None]]
+
+
+class ImportInterrupted(Exception):
+    """Writing a batch failed. ``result`` counts what was written before, up to its checkpoint."""
+
+    def __init__(self, result: ImportResult, cause: Exception):
+        super().__init__(f"{cause} (imported up to line {result.checkpoint}, resume from there)")
+        self.result = result
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a stream of byte chunks into lines, holding at most one partial line."""
+    pending = b""
+    async for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def _strings(record: dict, field: str) -> List[str]:
+    values = record.get(field) or []
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"{field} must be a list of strings")
+    return list(dict.fromkeys(values))
+
+
+def parse_record(line: bytes) -> Tuple[str, Optional[dict]]:
+    """The kind and the row of one line, without a row for SKIPPED_KINDS. Raises ValueError if it is not a valid record."""
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+    kind = record.get("kind")
+    if kind in SKIPPED_KINDS:
+        return kind, None
+    if kind not in FIELDS:
+        raise ValueError(f"unknown kind {kind!r}, expected one of {', '.join(FIELDS)}")
+    for field in FIELDS[kind]:
+        if not isinstance(record.get(field), str) or not record[field].strip():
+            raise ValueError(f"{kind} without {field}")
+    row = {field: record[field] for field in FIELDS[kind]}
+    if kind == "namedentity":
+        row["additional_labels"] = [label for label in _strings(record, "additional_labels") if label != "NamedEntity"]
+    elif kind == "statement":
+        row["mentioned_namedentity_ids"] = _strings(record, "mentioned_namedentity_ids")
+        topic_id = record.get("topic_id")
+        if topic_id is not None and not isinstance(topic_id, str):
+            raise ValueError("topic_id must be a string")
+        row["topic_id"] = topic_id if topic_id and topic_id.strip() else None
+    return kind, row
+
+
+async def prefetch(items: AsyncIterator, depth: int = 1) -> AsyncIterator:
+    """Yield the items of an async iterator while up to depth further items are produced concurrently."""
+    queue = asyncio.Queue(depth)
+
+    async def produce():
+        try:
+            async for item in items:
+                await queue.put((item, None))
+            await queue.put((None, StopAsyncIteration()))
+        except Exception as e:
+            await queue.put((None, e))
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if isinstance(error, StopAsyncIteration):
+                return
+            if error is not None:
+                raise error
+            yield item
+    finally:
+        producer.cancel()
+
+
+async def _read_batches(chunks: AsyncIterator[bytes], embedder: Optional[Embedder], batch_size: int, resume_from: int, result: ImportResult, report: Callable[[str], None]) -> AsyncIterator[Tuple[ImportBatch, int, int]]:
+    """Parse the lines into batches and embed their statements. Yields each batch with its number of rows and its last line."""
+    batch: ImportBatch = {kind: [] for kind in FIELDS}
+    rows = 0
+    async for line in iter_lines(chunks):
+        result.lines += 1
+        if result.lines > resume_from and line.strip():
+            try:
+                kind, row = parse_record(line)
+                if row is not None:
+                    batch[kind].append(row)
+                    rows += 1
+            except ValueError as e:
+                result.invalid += 1
+                report(f"line {result.lines}: {e}")
+        if rows >= batch_size:
+            await _embed(embedder, batch["statement"])
+            yield batch, rows, result.lines
+            batch, rows = {kind: [] for kind in FIELDS}, 0
+    if rows:
+        await _embed(embedder, batch["statement"])
+        yield batch, rows, result.lines
+
+
+async def _embed(embedder: Optional[Embedder], statements: List[dict]):
+    embeddings = await embedder.embed([row["text"] for row in statements]) if embedder is not None and statements else [None] * len(statements)
+    for row, embedding in zip(statements, embeddings):
+        row["embedding"] = embedding.tolist() if embedding is not None else None
+
+
+async def import_ndjson(store, chunks: AsyncIterator[bytes], embedder: Optional[Embedder] = None, batch_size: int = IMPORT_BATCH_SIZE, resume_from: int = 0, on_batch: Optional[OnBatch] = None) -> ImportResult:
+    """Import the records of an NDJSON stream, skipping the first resume_from lines.
+
+    The next batch is parsed and embedded (if an embedder is given) while the current one is
+    written, so the CPU work overlaps the round trips to the database. on_batch is called after
+    every written batch with its rows, the result per statement, the mentions linked per
+    statement and the progress so far; it runs while the next batch is written, one call at a
+    time. Raises ImportInterrupted if a batch cannot be written.
+    """
+    result = ImportResult(lines=0, checkpoint=resume_from)
+    records, started = 0, time.monotonic()
+    side_effects: Optional[asyncio.Task] = None
+
+    def report(problem: str):
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(problem)
+
+    try:
+        # aclosing stops the producer as soon as a batch fails, instead of when the generator is collected
+        async with aclosing(prefetch(_read_batches(chunks, embedder, batch_size, resume_from, result, report))) as batches:
+            async for batch, rows, last_line in batches:
+                statement_results, linked = await store.import_batch(batch["namedentity"], batch["topic"], batch["statement"], batch["mention"])
+                result.namedentities += len(batch["namedentity"])
+                result.topics += len(batch["topic"])
+                for statement_result in statement_results.values():
+                    if statement_result.created:
+                        result.statements += 1
+                        result.mentions += len(statement_result.mentioned_namedentity_ids)
+                    else:
+                        result.skipped_statements += 1
+                        report(f"statement {statement_result.statement_id}: {statement_result.detail}")
+                result.mentions += sum(len(mentioned_ids) for mentioned_ids in linked.values())
+                records += rows
+                result.checkpoint = last_line
+                result.seconds = time.monotonic() - started
+                result.rows_per_second = records / result.seconds
+                logger.info("Imported %d rows up to line %d (%.0f rows/s)", records, result.checkpoint, result.rows_per_second)
+                if on_batch is not None:
+                    if side_effects is not None:
+                        await side_effects
+                    side_effects = asyncio.create_task(on_batch(batch, statement_results, linked, result.model_copy()))
+        if side_effects is not None:
+            await side_effects
+    except Exception as e:
+        if side_effects is not None:
+            await asyncio.gather(side_effects, return_exceptions=True)
+        raise ImportInterrupted(result, e) from e
+    # Lines after the last batch are blank or invalid; there is nothing left to resume
+    result.checkpoint = result.lines
+    result.seconds = time.monotonic() - started
+    result.rows_per_second = records / result.seconds if result.seconds else 0
+    return result
+
+
+async def update_indexes(batch: ImportBatch, statement_results: Dict[str, StatementBatchResult], linked: Dict[str, List[str]], briefings: BriefingIndex, enqueue_derivation: Callable[[List[str]], Awaitable], autocomplete=None):
+    """Apply a written batch to the autocomplete index, the briefings and the derivation queue, as the create endpoints do.
+
+    A briefing takes the mentions and topic of the statement row. A statement that already
+    existed and kept other mentions in the graph (which the import only adds to) is
+    corrected by the next ``listen-rebuild-briefings``.
+    """
+    if autocomplete is not None:
+        for row in batch["namedentity"]:
+            autocomplete.add(row["namedentity_id"], row["name"])
+    created = [(row, statement_results[row["statement_id"]]) for row in batch["statement"] if statement_results[row["statement_id"]].created]
+    await briefings.add_statements([
+        {**row, "mentioned_namedentity_ids": statement_result.mentioned_namedentity_ids, "topic_id": statement_result.topic_id}
+        for row, statement_result in created
+    ])
+    for statement_id, mentioned_ids in linked.items():
+        await briefings.set_mentions(statement_id, mentioned_ids, replace=False)
+    # Relationships are derived from the mentions in the background, like after /statement/create_batch/
+    derive = [row["statement_id"] for row, statement_result in created if statement_result.mentioned_namedentity_ids] + list(linked)
+    if derive:
+        await enqueue_derivation(list(dict.fromkeys(derive)))
+
+
+async def read_chunks(path: str) -> AsyncIterator[bytes]:
+    """The bytes of a (optionally gzipped) file, read in a thread chunk by chunk."""
+    opener = gzip.open if path.endswith(".gz") else open
+    input_file = await asyncio.to_thread(opener, path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(input_file.read, READ_CHUNK_SIZE):
+            yield chunk
+    finally:
+        input_file.close()
+
+
+def _write_checkpoint(path: str, result: ImportResult):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        checkpoint_file.write(result.model_dump_json())
+    os.replace(temporary_path, path)
+
+
+async def _import_file(args) -> ImportResult:
+    checkpoint_path = args.checkpoint or args.path + ".checkpoint"
+    resume_from = 0
+    if os.path.exists(checkpoint_path) and not args.restart:
+        with open(checkpoint_path) as checkpoint_file:
+            resume_from = json.load(checkpoint_file)["checkpoint"]
+        logger.info("Resuming after line %d (checkpoint %s)", resume_from, checkpoint_path)
+
+    store = create_store()
+    await store.open()
+    embedder = create_embedder()
+    await embedder.open()
+    briefings = create_briefing_index()
+    # Queued for the derivation workers of the running application, which poll the same file
+    derivation_queue = DerivationQueue(os.getenv("DERIVATION_QUEUE_PATH", "derivation_jobs.sqlite3"))
+
+    async def on_batch(batch, statement_results, linked, progress):
+        await update_indexes(batch, statement_results, linked, briefings, lambda statement_ids: asyncio.to_thread(derivation_queue.enqueue, statement_ids))
+        await asyncio.to_thread(_write_checkpoint, checkpoint_path, progress)
+
+    try:
+        result = await import_ndjson(store, read_chunks(args.path), embedder, args.batch_size, resume_from, on_batch)
+    finally:
+        derivation_queue.close()
+        briefings.close()
+        await embedder.close()
+        await store.close()
+    # Complete, a later run starts from the first line again
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return result
+
+
+def main():
+    """Entry point of ``listen-import``."""
+    parser = argparse.ArgumentParser(
+        description="Import an NDJSON file (optionally .gz) of entities, topics, statements and mentions into the graph store "
+                    "configured by the environment. An interrupted import continues from its checkpoint when run again. "
+                    "With GRAPH_STORE=memory, stop the server first: the store is read from and written to its snapshot."
+    )
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: the input path plus .checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and import from the first line")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(asyncio.run(_import_file(args)).model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
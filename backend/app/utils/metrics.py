@@ -0,0 +1,168 @@
+"""Prometheus metrics of the backend, served on /metrics."""
+import re
+import time
+from prometheus_client import Counter, Gauge, Histogram
+
+# From a cached lookup to a large import or export
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+HTTP_REQUEST_DURATION = Histogram(
+    "listen_http_request_duration_seconds",
+    "Time from receiving a request to sending the end of its response, by the path template of the matched route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "listen_http_requests_in_flight",
+    "Requests being handled",
+)
+
+# Round trip as the client sees it, and the server's result_available_after and result_consumed_after
+NEO4J_QUERY_DURATION = Histogram(
+    "listen_neo4j_query_duration_seconds",
+    "Time of a Cypher query, named after the repository function that runs it (#2, #3, ... for its later queries), "
+    "by phase: round_trip from running the query until its result is exhausted on the client, available_after "
+    "and consumed_after as reported by Neo4j in the result summary",
+    ["query", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+
+NEO4J_POOL_CONNECTIONS = Gauge(
+    "listen_neo4j_pool_connections",
+    "Connections of the Neo4j driver pool, in_use by a session or idle",
+    ["state"],
+)
+
+NEO4J_POOL_MAX_CONNECTIONS = Gauge(
+    "listen_neo4j_pool_max_connections",
+    "Size limit of the Neo4j driver pool (NEO4J_MAX_CONNECTION_POOL_SIZE)",
+)
+
+INFERENCE_DURATION = Histogram(
+    "listen_inference_duration_seconds",
+    "Time of one call to the derivation backend, for a whole batch of statements",
+    buckets=LATENCY_BUCKETS,
+)
+
+# A statement connecting k entities derives k*(k-1) edges, so the buckets follow k = 1, 2, 3, 4, 5, 7, 10, 15, 21
+DERIVED_RELATIONSHIPS_PER_STATEMENT = Histogram(
+    "listen_derived_relationships_per_statement",
+    "Number of derived relationships (edges, both directions) written for one statement",
+    buckets=(0, 2, 6, 12, 20, 42, 90, 210, 420, float("inf")),
+)
+
+REJECTED_RELATIONSHIP_TYPES = Counter(
+    "listen_rejected_relationship_types_total",
+    "Derived relationships dropped because their type is not in the allow-list",
+    ["relationship_type"],
+)
+
+ENTITY_CACHE_HITS = Counter(
+    "listen_entity_cache_hits_total",
+    "Lookups of a NamedEntity, Statement or Topic by ID answered from the entity cache",
+    ["kind"],
+)
+
+ENTITY_CACHE_MISSES = Counter(
+    "listen_entity_cache_misses_total",
+    "Lookups of a NamedEntity, Statement or Topic by ID that went to the database",
+    ["kind"],
+)
+
+DERIVATION_JOBS = Counter(
+    "listen_derivation_jobs_total",
+    "Background derivation jobs by the status they ended in (done, superseded, failed) or were queued again after an error (retried)",
+    ["status"],
+)
+
+DERIVATION_QUEUE_DEPTH = Gauge(
+    "listen_derivation_queue_depth",
+    "Derivation jobs waiting for a worker",
+)
+
+DERIVATION_CACHE_HITS = Counter(
+    "listen_derivation_cache_hits_total",
+    "Statements whose relationships were taken from the derivation cache instead of being derived",
+)
+
+DERIVATION_CACHE_MISSES = Counter(
+    "listen_derivation_cache_misses_total",
+    "Statements whose relationships had to be derived because the derivation cache had no result for them",
+)
+
+DERIVATION_CACHE_EVICTIONS = Counter(
+    "listen_derivation_cache_evictions_total",
+    "Derivation results evicted from the cache to keep it within its size bound",
+)
+
+INFERENCE_BATCH_SIZE = Histogram(
+    "listen_inference_batch_size",
+    "Number of statements sent to the derivation backend in one call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, float("inf")),
+)
+
+GRAPH_NODES = Gauge(
+    "listen_graph_nodes",
+    "Nodes in the graph, as of the last refresh of the graph statistics",
+)
+
+GRAPH_RELATIONSHIPS = Gauge(
+    "listen_graph_relationships",
+    "Relationships in the graph, as of the last refresh of the graph statistics",
+)
+
+GRAPH_NODES_BY_LABEL = Gauge(
+    "listen_graph_nodes_by_label",
+    "Nodes with a label; a node with several labels counts for each",
+    ["label"],
+)
+
+GRAPH_RELATIONSHIPS_BY_TYPE = Gauge(
+    "listen_graph_relationships_by_type",
+    "Relationships of a type",
+    ["relationship_type"],
+)
+
+
+def route_template(scope) -> str:
+    """The path template of the route the router matched for a request, or "unmatched"."""
+    route = scope.get("route")
+    if route is None or not hasattr(route, "path_regex"):
+        return "unmatched"
+    # Routes of included routers may carry only their own part of the path; the prefix is what precedes it
+    match = re.search(route.path_regex.pattern.lstrip("^"), scope["path"])
+    prefix = scope["path"][:match.start()] if match else ""
+    return prefix + route.path_format
+
+
+class RequestMetrics:
+    """ASGI middleware observing the duration of every request and counting the requests in flight.
+
+    Requests are labelled with the path template of their route (``/namedentity/read/``); requests
+    no route matched count as ``unmatched``, so probes of arbitrary paths create no new series.
+    Scrapes of /metrics are left out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/metrics"):
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_and_note_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_note_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_DURATION.labels(scope["method"], route_template(scope), str(status)).observe(time.perf_counter() - started)
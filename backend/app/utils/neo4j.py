@@ -1,68 +1,185 @@
+import functools
+import logging
 import os
-from app.models import NamedEntity, Statement
-from neo4j import GraphDatabase
-
-def named_entity_exists(driver, namedentity_id: str) -> bool:
-    """Check if a NamedEntity exists in the database."""
-    with driver.session() as session:
-        result = session.run("""
-            MATCH (p:NamedEntity {namedentity_id: $namedentity_id})
-            RETURN count(p) > 0 AS exists
-        """, namedentity_id=namedentity_id)
-        return result.single()[0]
-
-
-#def get_driver(uri: str = "bolt://neo4j:7687", user: str = "neo4j", password: str = "password"):
-#    driver = GraphDatabase.driver(uri, auth=(user, password))
-#    return driver
-
-def get_namedentity_by_id(driver, namedentity_id: str):
-    with driver.session() as session:
-        result = session.run("""
-            MATCH (n:NamedEntity {namedentity_id: $namedentity_id})
-            RETURN n, labels(n) AS labels
-        """, namedentity_id=namedentity_id)
-
-        record = result.single()
-        if not record:
-            return None 
-
-        node = record["n"]
-        labels = record["labels"]
-
-        named_entity = NamedEntity(
-            name=node["name"],
-            namedentity_id=node["namedentity_id"],
-            additional_labels=[label for label in labels if label != "NamedEntity"]
-        )
-        return named_entity
-    
-
-def get_statement_by_id(driver, statement_id: str) -> Statement:
-    with driver.session() as session:
-        result = session.run("""
-            MATCH (s:Statement {statement_id: $statement_id})-[:IS_ABOUT]->(n:NamedEntity)
-            RETURN s.text AS text, s.statement_id AS statement_id, n.namedentity_id AS about_namedentity_id
-        """, statement_id=statement_id)
-
-        record = result.single()
-        if not record:
-            return None
-
-        statement = Statement(
-            text=record["text"],
-            statement_id=record["statement_id"],
-            about_namedentity_id=record["about_namedentity_id"],
-        )
-
-        return statement
-
-
-    
-def get_driver():
-    uri = os.getenv("NEO4J_URI", "bolt://neo4j:7687")
-    user = os.getenv("NEO4J_USER", "neo4j")
-    password = os.getenv("NEO4J_PASSWORD", "password")
-    print(uri,user)
-    driver = GraphDatabase.driver(uri, auth=(user, password))
-    return driver
\ No newline at end of file
+import time
+from typing import Optional
+import neo4j
+from neo4j import AsyncGraphDatabase, AsyncDriver
+from app.utils.metrics import NEO4J_POOL_CONNECTIONS, NEO4J_POOL_MAX_CONNECTIONS, NEO4J_QUERY_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Set once reading the driver pool failed, so that every scrape does not log it again
+_pool_warning_logged = False
+
+def get_driver_settings():
+    """Read the connection and pool settings for the shared driver from the environment."""
+    return {
+        "uri": os.getenv("NEO4J_URI", "bolt://neo4j:7687"),
+        "user": os.getenv("NEO4J_USER", "neo4j"),
+        "password": os.getenv("NEO4J_PASSWORD", "password"),
+        "max_connection_pool_size": int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", "100")),
+        "connection_acquisition_timeout": float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "60")),
+        "max_connection_lifetime": float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600")),
+    }
+
+
+def create_driver() -> AsyncDriver:
+    settings = get_driver_settings()
+    driver = AsyncGraphDatabase.driver(
+        settings["uri"],
+        auth=(settings["user"], settings["password"]),
+        max_connection_pool_size=settings["max_connection_pool_size"],
+        connection_acquisition_timeout=settings["connection_acquisition_timeout"],
+        max_connection_lifetime=settings["max_connection_lifetime"],
+    )
+    observe_connection_pool(driver)
+    return driver
+
+
+def _count_connections(pool, in_use: bool) -> int:
+    return sum(1 for connections in list(pool.connections.values()) for connection in list(connections) if connection.in_use == in_use)
+
+
+def _read_pool(driver: AsyncDriver, read) -> float:
+    """Read a statistic of the driver pool, which the driver only exposes through private attributes.
+
+    If a driver version changes them, the gauge reports NaN instead of failing the scrape,
+    and a warning is logged once.
+    """
+    global _pool_warning_logged
+    try:
+        return read(getattr(driver, "_pool", None))
+    except Exception as e:
+        if not _pool_warning_logged:
+            _pool_warning_logged = True
+            logger.warning("Cannot read the connection pool of neo4j driver %s, the pool gauges report NaN: %r", neo4j.__version__, e)
+        return float("nan")
+
+
+def observe_connection_pool(driver: AsyncDriver):
+    """Report the connections of the driver pool in the pool gauges, read when /metrics is scraped."""
+    NEO4J_POOL_CONNECTIONS.labels("in_use").set_function(lambda: _read_pool(driver, lambda pool: _count_connections(pool, True)))
+    NEO4J_POOL_CONNECTIONS.labels("idle").set_function(lambda: _read_pool(driver, lambda pool: _count_connections(pool, False)))
+    NEO4J_POOL_MAX_CONNECTIONS.set_function(lambda: _read_pool(driver, lambda pool: pool.pool_config.max_connection_pool_size))
+
+
+class TimedResult:
+    """Wraps a result and observes the timings of its query once the result is exhausted.
+
+    The round trip is measured from running the query until its last record has arrived;
+    the result summary adds the time Neo4j took until the first record was available
+    (result_available_after) and to stream all of them (result_consumed_after).
+    """
+
+    def __init__(self, result, name: str, started: float):
+        self._result = result
+        self._name = name
+        self._started = started
+        self._observed = False
+
+    def _observe(self, summary):
+        if self._observed:
+            return
+        self._observed = True
+        NEO4J_QUERY_DURATION.labels(self._name, "round_trip").observe(time.perf_counter() - self._started)
+        for phase in ("result_available_after", "result_consumed_after"):
+            milliseconds = getattr(summary, phase, None)
+            if milliseconds is not None:
+                NEO4J_QUERY_DURATION.labels(self._name, phase[len("result_"):]).observe(milliseconds / 1000)
+
+    async def single(self, *args, **kwargs):
+        record = await self._result.single(*args, **kwargs)
+        # single() exhausts the result, so the summary is already there
+        self._observe(await self._result.consume())
+        return record
+
+    async def consume(self):
+        summary = await self._result.consume()
+        self._observe(summary)
+        return summary
+
+    async def __aiter__(self):
+        async for record in self._result:
+            yield record
+        self._observe(await self._result.consume())
+
+    async def finish(self):
+        """Consume the result if the repository function left it unread, as the commit would."""
+        if not self._observed:
+            await self.consume()
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+
+class TimedTransaction:
+    """Wraps a transaction so that the results of its queries are TimedResults.
+
+    Queries are named after the repository function running them; its second and later
+    queries get the suffixes #2, #3 and so on.
+    """
+
+    def __init__(self, transaction, name: str):
+        self._transaction = transaction
+        self._name = name
+        self._results = []
+
+    async def run(self, query: str, parameters: Optional[dict] = None, **kwargs):
+        name = self._name if not self._results else f"{self._name}#{len(self._results) + 1}"
+        started = time.perf_counter()
+        result = TimedResult(await self._transaction.run(query, parameters, **kwargs), name, started)
+        self._results.append(result)
+        return result
+
+    async def finish(self):
+        for result in self._results:
+            await result.finish()
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+
+def query_name(work) -> str:
+    """The name of the queries of a repository function in the query metrics, such as statement.update_mentions."""
+    return f"{work.__module__.rsplit('.', 1)[-1]}.{work.__name__}"
+
+
+def timed(work):
+    """Wrap a repository function so that the queries it runs are timed under its name."""
+    name = query_name(work)
+
+    @functools.wraps(work)
+    async def timed_work(tx, *args, **kwargs):
+        timed_tx = TimedTransaction(tx, name)
+        result = await work(timed_tx, *args, **kwargs)
+        await timed_tx.finish()
+        return result
+
+    return timed_work
+
+
+async def execute_read(driver: AsyncDriver, work, *args, **kwargs):
+    """Run a repository read function as one managed (retried) read transaction."""
+    async with driver.session() as session:
+        return await session.execute_read(timed(work), *args, **kwargs)
+
+
+async def execute_write(driver: AsyncDriver, work, *args, **kwargs):
+    """Run a repository write function as one managed (retried) write transaction."""
+    async with driver.session() as session:
+        return await session.execute_write(timed(work), *args, **kwargs)
+
+
+async def stream_read(driver: AsyncDriver, work, *args, **kwargs):
+    """Run a repository generator function in a read transaction and yield its items as they arrive.
+
+    Unlike execute_read the transaction is not retried, since items may already have been
+    sent to the client. The session stays open until the generator is exhausted or closed.
+    """
+    async with driver.session() as session:
+        async with await session.begin_transaction() as tx:
+            timed_tx = TimedTransaction(tx, query_name(work))
+            async for item in work(timed_tx, *args, **kwargs):
+                yield item
+            await timed_tx.finish()
@@ -0,0 +1,60 @@
+"""Query parsing and snippet highlighting shared by the search implementations of the stores."""
+import os
+import re
+from typing import List, Optional, Tuple
+from app.models import SearchHit
+
+SNIPPET_LENGTH = 160
+# Shorter terms are only matched as whole words; prefix queries on them would match too much
+MIN_PREFIX_LENGTH = 3
+# Best matches of the full-text index considered by a search filtered by entity or topic (Neo4j store)
+SEARCH_FILTERED_CANDIDATES = int(os.getenv("SEARCH_FILTERED_CANDIDATES", "1000"))
+
+def search_terms(text: str) -> List[str]:
+    """Split a user query into lowercase word terms, dropping everything Lucene would interpret as syntax."""
+    return list(dict.fromkeys(re.findall(r"\w+", text.lower())))
+
+
+def lucene_query(terms: List[str]) -> str:
+    """Full-text query matching any term, as a whole word or (for longer terms) as a word prefix."""
+    return " ".join(f"{term} {term}*" if len(term) >= MIN_PREFIX_LENGTH else term for term in terms)
+
+
+def _term_pattern(terms: List[str]) -> re.Pattern:
+    alternatives = [re.escape(term) + (r"\w*" if len(term) >= MIN_PREFIX_LENGTH else r"\b") for term in sorted(terms, key=len, reverse=True)]
+    return re.compile(r"\b(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+
+
+def match_score(text: Optional[str], terms: List[str]) -> float:
+    """Simple relevance for stores without a full-text index: whole-word matches count 1, prefix matches 0.5."""
+    words = set(re.findall(r"\w+", (text or "").lower()))
+    score = 0.0
+    for term in terms:
+        if term in words:
+            score += 1
+        elif len(term) >= MIN_PREFIX_LENGTH and any(word.startswith(term) for word in words):
+            score += 0.5
+    return score
+
+
+def make_snippet(text: Optional[str], terms: List[str], length: int = SNIPPET_LENGTH) -> Tuple[str, List[List[int]]]:
+    """Cut a window of text around the first matched term and return it with the [start, end) offsets of all matches in it."""
+    text = text or ""
+    matches = list(_term_pattern(terms).finditer(text)) if terms else []
+    start = 0
+    if matches and len(text) > length:
+        start = max(0, min(matches[0].start() - length // 4, len(text) - length))
+    end = min(len(text), start + length)
+    prefix = "…" if start > 0 else ""
+    snippet = prefix + text[start:end] + ("…" if end < len(text) else "")
+    highlights = [
+        [match.start() - start + len(prefix), min(match.end(), end) - start + len(prefix)]
+        for match in matches
+        if match.start() >= start and match.start() < end
+    ]
+    return snippet, highlights
+
+
+def search_hit(kind: str, node_id: str, text: Optional[str], score: float, terms: List[str], about_namedentity_id: Optional[str] = None, topic_id: Optional[str] = None) -> SearchHit:
+    snippet, highlights = make_snippet(text, terms)
+    return SearchHit(kind=kind, id=node_id, score=score, snippet=snippet, highlights=highlights, about_namedentity_id=about_namedentity_id, topic_id=topic_id)
@@ -0,0 +1,105 @@
+"""Startup of the application without blocking the server.
+
+The steps that need the database run in a background task, opening the store with backoff
+until Neo4j can be reached. Until they are complete, /ready and ReadinessGate answer 503.
+"""
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from app.models import Readiness
+
+logger = logging.getLogger(__name__)
+
+# Delays between attempts to reach the database, doubled after every failure up to the maximum
+STARTUP_RETRY_INITIAL_DELAY = 0.5
+STARTUP_RETRY_MAX_DELAY = float(os.getenv("STARTUP_RETRY_MAX_DELAY", "30"))
+# Seconds /ready waits for the database before reporting it unreachable
+READY_CHECK_TIMEOUT = 2
+
+# Paths served while the application is starting up
+ALWAYS_SERVED_PATHS = ("/health", "/ready", "/metrics", "/docs", "/redoc", "/openapi.json")
+
+StartupStep = Tuple[str, Callable[[], Awaitable]]
+
+
+async def retry_with_backoff(operation: Callable[[], Awaitable], description: str, initial_delay: float = STARTUP_RETRY_INITIAL_DELAY, max_delay: float = STARTUP_RETRY_MAX_DELAY):
+    """Await operation until it succeeds, sleeping exponentially longer (up to max_delay) after each failure."""
+    delay = initial_delay
+    while True:
+        try:
+            return await operation()
+        except Exception as e:
+            logger.warning("%s failed, retrying in %.1f s: %s", description, delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+
+class Startup:
+    """Runs the startup steps in order in a background task and reports their progress."""
+
+    def __init__(self, store, steps: List[StartupStep]):
+        self.store = store
+        self.steps = steps
+        self.ready = False
+        self.current_step: Optional[str] = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        try:
+            for name, step in self.steps:
+                self.current_step = name
+                await step()
+        except Exception as e:
+            # Steps after opening the store are not retried: a restore, for one, must not run twice
+            logger.exception("Startup failed in step %s", self.current_step)
+            self.error = f"{self.current_step}: {e}"
+            return
+        self.current_step = None
+        self.ready = True
+        logger.info("Startup complete, ready to serve requests")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def check(self) -> Readiness:
+        """The readiness of the worker: startup complete, database reachable and schema current."""
+        if not self.ready:
+            startup = f"failed in {self.error}" if self.error else f"running: {self.current_step or 'not started'}"
+            return Readiness(ready=False, checks={"startup": startup})
+        try:
+            problem = await asyncio.wait_for(self.store.check_ready(), READY_CHECK_TIMEOUT)
+        except Exception as e:
+            problem = f"unreachable: {e or type(e).__name__}"
+        return Readiness(ready=problem is None, checks={"startup": "ok", "database": problem or "ok"})
+
+
+class ReadinessGate:
+    """ASGI middleware answering 503 to requests until the startup is complete, except for ALWAYS_SERVED_PATHS.
+
+    Without a startup (app.state.startup, set by the lifespan) every request passes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith(ALWAYS_SERVED_PATHS):
+            startup = getattr(scope["app"].state, "startup", None)
+            if startup is not None and not startup.ready:
+                response = JSONResponse({"detail": "Starting up, see /ready"}, status_code=503, headers={"Retry-After": "1"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def get_startup(request: Request) -> Startup:
+    return request.app.state.startup
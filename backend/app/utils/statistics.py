@@ -0,0 +1,87 @@
+"""Graph statistics for /general/describe_graph and the ``listen_graph_*`` gauges on /metrics.
+
+Dashboards poll describe_graph, so the statistics are kept for ``ttl`` seconds and requests
+arriving while they are refreshed wait for that one refresh instead of querying too. Every
+refresh also sets the gauges; with an ``interval``, a background task refreshes them
+periodically, so they stay current when nobody calls the endpoint.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+from fastapi import Request
+from app.models import GraphStatistics
+from app.utils.metrics import GRAPH_NODES, GRAPH_NODES_BY_LABEL, GRAPH_RELATIONSHIPS, GRAPH_RELATIONSHIPS_BY_TYPE
+
+logger = logging.getLogger(__name__)
+
+
+class GraphStatisticsCache:
+    def __init__(self, store, ttl: float, interval: float = 0):
+        self.store = store
+        self.ttl = ttl
+        self.interval = interval
+        self._statistics: Optional[GraphStatistics] = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _is_fresh(self) -> bool:
+        return self._statistics is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    async def get(self) -> GraphStatistics:
+        if self._is_fresh():
+            return self._statistics
+        async with self._lock:
+            # Checked again: a concurrent request may have refreshed while this one waited for the lock
+            if not self._is_fresh():
+                await self._refresh()
+            return self._statistics
+
+    async def refresh(self) -> GraphStatistics:
+        async with self._lock:
+            await self._refresh()
+            return self._statistics
+
+    async def _refresh(self):
+        statistics = await self.store.describe_graph()
+        self._statistics, self._fetched_at = statistics, time.monotonic()
+        GRAPH_NODES.set(statistics.nodes)
+        GRAPH_RELATIONSHIPS.set(statistics.relationships)
+        # Cleared first, so labels and types without nodes or relationships left are not reported with their last count
+        GRAPH_NODES_BY_LABEL.clear()
+        for label, count in statistics.labels.items():
+            GRAPH_NODES_BY_LABEL.labels(label=label).set(count)
+        GRAPH_RELATIONSHIPS_BY_TYPE.clear()
+        for relationship_type, count in statistics.relationship_types.items():
+            GRAPH_RELATIONSHIPS_BY_TYPE.labels(relationship_type=relationship_type).set(count)
+
+    async def _refresh_periodically(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Refreshing the graph statistics failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+def create_graph_statistics(store) -> GraphStatisticsCache:
+    return GraphStatisticsCache(
+        store,
+        ttl=float(os.getenv("GRAPH_STATISTICS_TTL", "10")),
+        interval=float(os.getenv("GRAPH_STATISTICS_INTERVAL", "60")),
+    )
+
+
+def get_graph_statistics(request: Request) -> GraphStatisticsCache:
+    return request.app.state.graph_statistics
@@ -0,0 +1,15 @@
+import json
+from typing import AsyncIterator
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+async def _ndjson_lines(items: AsyncIterator) -> AsyncIterator[str]:
+    async for item in items:
+        yield json.dumps(jsonable_encoder(item)) + "\n"
+
+
+def ndjson_response(items: AsyncIterator) -> StreamingResponse:
+    """Stream items as newline-delimited JSON, one object per line, while they are produced."""
+    return StreamingResponse(_ndjson_lines(items), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,79 @@
+"""Brute-force nearest-neighbour search over unit vectors, for the in-memory store.
+
+The vectors are rows of one NumPy matrix, so a query is a single matrix-vector product over
+all of them (or over the rows of a scope) followed by a partial sort for the top k. That is
+exact and, for the graph of a single user, faster than maintaining an approximate index.
+Rows of removed vectors are filled with the last row, so the matrix stays dense.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+
+class VectorIndex:
+    def __init__(self, capacity: int = 1024):
+        self._matrix: Optional[np.ndarray] = None
+        self._capacity = capacity
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return self._matrix.shape[1] if self._matrix is not None else None
+
+    def get(self, key: str) -> Optional[List[float]]:
+        row = self._rows.get(key)
+        return self._matrix[row].tolist() if row is not None else None
+
+    def add(self, key: str, vector: List[float]):
+        vector = np.asarray(vector, dtype=np.float32)
+        if self._matrix is None or vector.shape[0] != self._matrix.shape[1]:
+            # The first vector, or an embedder with another size: the old vectors cannot be compared with the new ones
+            self._matrix = np.zeros((self._capacity, vector.shape[0]), dtype=np.float32)
+            self._ids, self._rows = [], {}
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._ids)
+            if row == self._matrix.shape[0]:
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._ids.append(key)
+            self._rows[key] = row
+        self._matrix[row] = vector
+
+    def remove(self, key: str):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._rows[self._ids[row]] = row
+        self._ids.pop()
+
+    def search(self, vector: List[float], k: int, keys: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """The k (key, cosine similarity) closest to vector, best first; among keys only, if given."""
+        if not self._ids or k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != self._matrix.shape[1]:
+            return []
+        if keys is None:
+            rows = None
+            scores = self._matrix[:len(self._ids)] @ query
+        else:
+            rows = np.fromiter((self._rows[key] for key in keys if key in self._rows), dtype=np.int64)
+            scores = self._matrix[rows] @ query
+        if len(scores) > k:
+            # argpartition finds the top k in linear time; only those are sorted
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        positions = top if rows is None else rows[top]
+        return [(self._ids[position], float(scores[index])) for position, index in zip(positions, top)]
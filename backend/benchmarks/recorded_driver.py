@@ -0,0 +1,119 @@
+"""A stand-in for the async Neo4j driver that answers queries from recorded fixtures.
+
+It implements the part of the driver API the repository layer uses (sessions, managed and
+explicit transactions, results) and counts every query, so the benchmarks measure the cost
+of the application code and its number of database round trips without a running Neo4j.
+
+Fixtures are a JSON list of ``{"name", "match", "records", "counters"}`` objects. ``match`` is
+a regular expression searched in the query text; the first fixture that matches answers it.
+Queries without a fixture return no records and are counted as unmatched.
+"""
+import json
+import re
+from typing import Dict, List
+
+
+class RecordedRecord(dict):
+    """A record that, like neo4j.Record, can be indexed by key or by position."""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+    def data(self) -> dict:
+        return dict(self)
+
+
+class RecordedCounters:
+    def __init__(self, counters: Dict[str, int]):
+        self.nodes_created = 0
+        self.nodes_deleted = 0
+        self.relationships_created = 0
+        self.relationships_deleted = 0
+        self.properties_set = 0
+        self.__dict__.update(counters)
+
+
+class RecordedSummary:
+    def __init__(self, query: str, counters: Dict[str, int]):
+        self.query = query
+        self.counters = RecordedCounters(counters)
+        self.result_available_after = 0
+        self.result_consumed_after = 0
+
+
+class RecordedResult:
+    def __init__(self, query: str, records: List[dict], counters: Dict[str, int]):
+        self._records = [RecordedRecord(record) for record in records]
+        self._summary = RecordedSummary(query, counters)
+
+    async def single(self):
+        return self._records[0] if self._records else None
+
+    async def data(self) -> List[dict]:
+        return [record.data() for record in self._records]
+
+    async def consume(self) -> RecordedSummary:
+        return self._summary
+
+    async def __aiter__(self):
+        for record in self._records:
+            yield record
+
+
+class RecordedTransaction:
+    def __init__(self, driver: "RecordedDriver"):
+        self._driver = driver
+
+    async def run(self, query: str, parameters: dict = None, **kwargs) -> RecordedResult:
+        return self._driver.answer(query)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def close(self):
+        pass
+
+
+class RecordedSession(RecordedTransaction):
+    async def execute_read(self, work, *args, **kwargs):
+        return await work(RecordedTransaction(self._driver), *args, **kwargs)
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await work(RecordedTransaction(self._driver), *args, **kwargs)
+
+    async def begin_transaction(self) -> RecordedTransaction:
+        return RecordedTransaction(self._driver)
+
+
+class RecordedDriver:
+    def __init__(self, fixtures: List[dict]):
+        self.fixtures = [(re.compile(fixture["match"], re.S), fixture) for fixture in fixtures]
+        self.query_count = 0
+        self.unmatched_queries: List[str] = []
+
+    @classmethod
+    def from_file(cls, path: str) -> "RecordedDriver":
+        with open(path) as fixture_file:
+            return cls(json.load(fixture_file))
+
+    def answer(self, query: str) -> RecordedResult:
+        self.query_count += 1
+        for pattern, fixture in self.fixtures:
+            if pattern.search(query):
+                return RecordedResult(query, fixture.get("records", []), fixture.get("counters", {}))
+        self.unmatched_queries.append(query)
+        return RecordedResult(query, [], {})
+
+    def session(self, **kwargs) -> RecordedSession:
+        return RecordedSession(self)
+
+    async def verify_connectivity(self):
+        pass
+
+    async def close(self):
+        pass
@@ -0,0 +1,206 @@
+"""Micro-benchmarks for every endpoint of the API, without a running Neo4j.
+
+Each scenario in scenarios.py is sent through an in-process ASGI client to ``app.main.app``,
+whose store runs on a RecordedDriver answering from fixtures.json. Per endpoint the
+runner reports p50/p95/p99 latency, queries per request and peak memory allocated while
+handling one request (tracemalloc, measured in a separate pass so it does not skew latency).
+
+Run from the backend directory:
+
+    python -m benchmarks.run_benchmarks                          # print the results
+    python -m benchmarks.run_benchmarks --save benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json
+
+With --baseline the exit status is 1 if an endpoint got slower than --max-regression
+(relative, on p95), needs more queries, or allocates more than --max-regression more memory.
+Latencies depend on the machine, so only compare against a baseline recorded on the same one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+import httpx
+
+from app.genai.embedding import HashingEmbedder
+from app.genai.genai import StubDerivationBackend
+from app.genai.pipeline import DerivationPipeline, DerivationQueue
+from app.genai.scheduler import BatchScheduler
+from app.main import app
+from app.storage.neo4j_store import Neo4jStore
+from app.utils.autocomplete import build_autocomplete_index
+from app.utils.briefing import BriefingIndex
+from app.utils.cache import EntityCache, MemoryCacheBackend
+from app.utils.startup import Startup
+from app.utils.statistics import GraphStatisticsCache
+from benchmarks.recorded_driver import RecordedDriver
+from benchmarks.scenarios import SCENARIOS, Scenario
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures.json")
+
+
+def check_coverage():
+    """Fail if an API route of the app has no scenario."""
+    covered = {(scenario.method, scenario.path) for scenario in SCENARIOS}
+    missing = [
+        f"{method.upper()} {path}"
+        for path, operations in app.openapi()["paths"].items()
+        for method in operations
+        if (method.upper(), path) not in covered
+    ]
+    if missing:
+        sys.exit("No benchmark scenario for: " + ", ".join(sorted(missing)))
+
+
+async def send(client: httpx.AsyncClient, scenario: Scenario) -> httpx.Response:
+    response = await client.request(scenario.method, scenario.path, params=scenario.params, json=scenario.json, content=scenario.content)
+    if response.status_code != scenario.expected_status:
+        raise RuntimeError(f"{scenario.name}: expected status {scenario.expected_status}, got {response.status_code}: {response.text[:200]}")
+    return response
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client: httpx.AsyncClient, driver: RecordedDriver, scenario: Scenario, iterations: int, warmup: int, allocation_samples: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        await send(client, scenario)
+
+    latencies = []
+    queries_before = driver.query_count
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await send(client, scenario)
+        latencies.append((time.perf_counter() - start) * 1000)
+    queries_per_request = (driver.query_count - queries_before) / iterations
+
+    allocations = []
+    tracemalloc.start()
+    try:
+        for _ in range(allocation_samples):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            await send(client, scenario)
+            _, peak = tracemalloc.get_traced_memory()
+            allocations.append(peak - current)
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 0.50), 4),
+        "p95_ms": round(percentile(latencies, 0.95), 4),
+        "p99_ms": round(percentile(latencies, 0.99), 4),
+        "queries_per_request": round(queries_per_request, 2),
+        "peak_alloc_kib": round(statistics.median(allocations) / 1024, 1),
+    }
+
+
+async def run_benchmarks(iterations: int, warmup: int, allocation_samples: int, use_cache: bool, only: List[str]) -> Dict[str, Dict[str, float]]:
+    driver = RecordedDriver.from_file(FIXTURES_PATH)
+    # The lifespan is not run: it would connect and migrate, which the benchmarks leave out
+    app.state.store = Neo4jStore(driver)
+    app.state.cache = EntityCache(MemoryCacheBackend(10000, 60) if use_cache else None)
+    app.state.autocomplete = await build_autocomplete_index(app.state.store)
+    app.state.briefings = BriefingIndex(":memory:")
+    app.state.graph_statistics = GraphStatisticsCache(app.state.store, ttl=10 if use_cache else 0)
+    # A briefing of the scale the fixtures use, for /namedentity/briefing
+    await app.state.briefings.add_statements([
+        {"text": f"Statement {i}", "statement_id": f"s{i:03d}", "about_namedentity_id": "ne1", "mentioned_namedentity_ids": [f"ne{2 + i % 20}"], "topic_id": f"t{i % 5}"}
+        for i in range(50)
+    ])
+    # Without workers, so the endpoints are measured up to queueing the derivation
+    app.state.derivation = DerivationPipeline(
+        app.state.store, DerivationQueue(":memory:"), BatchScheduler(StubDerivationBackend(), 32, 0.05, 2),
+        workers=0, batch_size=50, max_attempts=3, retention=86400,
+    )
+    app.state.embedder = HashingEmbedder()
+    # Everything the startup steps would do is set up above, so the startup has none left and is ready
+    app.state.startup = Startup(app.state.store, [])
+    await app.state.startup.run()
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for scenario in SCENARIOS:
+            if only and not any(scenario.name.startswith(prefix) for prefix in only):
+                continue
+            results[scenario.name] = await run_scenario(client, driver, scenario, iterations, warmup, allocation_samples)
+
+    if driver.unmatched_queries:
+        print(f"Warning: {len(set(driver.unmatched_queries))} distinct queries had no fixture and returned no records", file=sys.stderr)
+    return results
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]] = None):
+    columns = ["p50_ms", "p95_ms", "p99_ms", "queries_per_request", "peak_alloc_kib"]
+    name_width = max(len(name) for name in results)
+    print(f"{'endpoint':<{name_width}}  " + "  ".join(f"{column:>22}" for column in columns))
+    for name, metrics in results.items():
+        cells = []
+        for column in columns:
+            cell = f"{metrics[column]:g}"
+            if baseline and name in baseline and baseline[name].get(column):
+                change = (metrics[column] - baseline[name][column]) / baseline[name][column]
+                cell += f" ({change:+.0%})"
+            cells.append(f"{cell:>22}")
+        print(f"{name:<{name_width}}  " + "  ".join(cells))
+
+
+def find_regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], max_regression: float) -> List[str]:
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        if metrics["p95_ms"] > reference["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {reference['p95_ms']:g} ms -> {metrics['p95_ms']:g} ms")
+        if metrics["queries_per_request"] > reference["queries_per_request"]:
+            regressions.append(f"{name}: queries per request {reference['queries_per_request']:g} -> {metrics['queries_per_request']:g}")
+        if metrics["peak_alloc_kib"] > reference["peak_alloc_kib"] * (1 + max_regression):
+            regressions.append(f"{name}: peak allocation {reference['peak_alloc_kib']:g} KiB -> {metrics['peak_alloc_kib']:g} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every API endpoint against recorded Neo4j fixtures.")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per endpoint before measuring")
+    parser.add_argument("--allocation-samples", type=int, default=20, help="Requests per endpoint traced with tracemalloc")
+    parser.add_argument("--cache", action="store_true", help="Enable the in-memory entity cache (disabled by default, so every request reaches the driver)")
+    parser.add_argument("--only", nargs="*", default=[], help="Only run scenarios whose name starts with one of these prefixes")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed relative increase of p95 latency and peak allocation")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    check_coverage()
+    results = asyncio.run(run_benchmarks(args.iterations, args.warmup, args.allocation_samples, args.cache, args.only))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+            results_file.write("\n")
+
+    if baseline:
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions against " + args.baseline + ":\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""One request per endpoint of app.main, answered by the records in fixtures.json.
+
+The runner refuses to start if an API route has no scenario, so new endpoints are benchmarked
+from the day they are added.
+"""
+import json
+from typing import Any, Dict, NamedTuple, Optional
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    path: str
+    params: Optional[Dict[str, Any]] = None
+    json: Any = None
+    expected_status: int = 200
+    content: Optional[str] = None  # Raw request body, for endpoints reading a stream
+
+
+def _batch_item(i: int) -> dict:
+    return {
+        "statement": {"text": f"Met @Anna at the lake ({i})", "statement_id": f"s_batch{i}", "about_namedentity_id": "ne1"},
+        "mentioned_namedentity_ids": ["ne3"],
+        "topic_id": "t1",
+    }
+
+
+def _import_body(statements: int) -> str:
+    records = [{"kind": "namedentity", "namedentity_id": f"ne_import{i}", "name": f"Person {i}"} for i in range(statements // 10)]
+    records.append({"kind": "topic", "topic_id": "t_import", "name": "Imported"})
+    records += [
+        {"kind": "statement", "statement_id": f"s_import{i}", "text": f"Met @Person {i % 10} at the lake ({i})", "about_namedentity_id": "ne1", "mentioned_namedentity_ids": [f"ne_import{i % 10}"], "topic_id": "t_import"}
+        for i in range(statements)
+    ]
+    return "\n".join(json.dumps(record) for record in records)
+
+
+SCENARIOS = [
+    Scenario("root", "GET", "/"),
+    Scenario("health", "GET", "/health"),
+    Scenario("ready", "GET", "/ready"),
+
+    Scenario("general.describe_graph", "GET", "/general/describe_graph"),
+    Scenario("general.create_node", "POST", "/general/create_node/", params={"label": "Topic"}, json={"name": "Holidays", "topic_id": "t2"}),
+    Scenario("general.read_node", "POST", "/general/read_node/", params={"label": "Topic", "node_id": "t1"}),
+    Scenario("general.update_node", "POST", "/general/update_node/", params={"label": "Topic", "node_id": "t1"}, json={"name": "Family"}),
+    Scenario("general.delete_node", "POST", "/general/delete_node/", params={"label": "Topic", "node_id": "t1"}),
+    Scenario("general.import", "POST", "/general/import", params={"batch_size": 500}, content=_import_body(1000)),
+    Scenario("general.export", "GET", "/general/export"),
+    Scenario("general.export[subgraph,gzip]", "GET", "/general/export", params={"namedentity_id": "ne1", "compression": "gzip"}),
+
+    Scenario("namedentity.create", "POST", "/namedentity/create", json={"name": "Bob", "namedentity_id": "ne1", "additional_labels": ["Person"]}),
+    Scenario("namedentity.read", "GET", "/namedentity/read/", params={"namedentity_id": "ne1"}),
+    Scenario("namedentity.autocomplete", "GET", "/namedentity/autocomplete/", params={"q": "@ann"}),
+    Scenario("namedentity.autocomplete[fuzzy]", "GET", "/namedentity/autocomplete/", params={"q": "schmitd"}),
+    Scenario("namedentity.get_by_name", "POST", "/namedentity/get_by_name/", params={"name": "Bob"}),
+    Scenario("namedentity.get_by_name[stream]", "POST", "/namedentity/get_by_name/", params={"name": "Bob", "stream": True}),
+    Scenario("namedentity.get_statements", "POST", "/namedentity/get_statements/", params={"namedentity_id": "ne1", "limit": 50}),
+    Scenario("namedentity.get_statements[stream]", "POST", "/namedentity/get_statements/", params={"namedentity_id": "ne1", "stream": True}),
+    Scenario("namedentity.briefing", "GET", "/namedentity/briefing/", params={"namedentity_id": "ne1"}),
+    Scenario("namedentity.neighbourhood", "GET", "/namedentity/neighbourhood/", params={"namedentity_id": "ne1", "hops": 2}),
+    Scenario("namedentity.get_connections", "GET", "/namedentity/get_connections/", params={"namedentity_id": "ne1"}),
+    Scenario("namedentity.update_labels", "POST", "/namedentity/update_labels/", params={"namedentity_id": "ne1", "additional_labels": ["Person"]}),
+    Scenario("namedentity.delete", "POST", "/namedentity/delete/", params={"namedentity_id": "ne1"}),
+
+    Scenario("statement.create", "POST", "/statement/create/", json={"text": "Married @Anna in Venice", "statement_id": "s1", "about_namedentity_id": "ne1"}),
+    Scenario("statement.create_batch", "POST", "/statement/create_batch/", json=[_batch_item(i) for i in range(3)]),
+    Scenario("statement.read", "GET", "/statement/read/", params={"statement_id": "s1"}),
+    Scenario("statement.get_mentions", "POST", "/statement/get_mentions/", params={"statement_id": "s1"}),
+    Scenario("statement.set_topic", "POST", "/statement/set_topic/", params={"statement_id": "s1", "topic_id": "t1"}),
+    Scenario("statement.add_mentions", "POST", "/statement/add_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne3"]}),
+    Scenario("statement.update_mentions", "POST", "/statement/update_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne3"]}),
+    Scenario("statement.derivation_job", "GET", "/statement/derivation_job/", params={"job_id": "unknown"}, expected_status=404),
+    Scenario("statement.similar", "GET", "/statement/similar/", params={"q": "wedding in Venice"}),
+    Scenario("statement.similar[scoped]", "GET", "/statement/similar/", params={"q": "wedding in Venice", "about_namedentity_id": "ne1", "k": 5}),
+    Scenario("statement.update_text", "POST", "/statement/update_text/", params={"statement_id": "s1", "new_text": "Married @Anna in Venice on 26.05.2023"}),
+    Scenario("statement.delete", "POST", "/statement/delete/", params={"statement_id": "s1"}),
+
+    Scenario("topic.create", "POST", "/topic/create/", json={"name": "Holidays", "topic_id": "t2"}),
+    Scenario("topic.read", "GET", "/topic/read/", params={"topic_id": "t1"}),
+    Scenario("topic.list_all_topics", "GET", "/topic/list_all_topics/", params={"limit": 50}),
+    Scenario("topic.list_all_topics[stream]", "GET", "/topic/list_all_topics/", params={"stream": True}),
+    Scenario("topic.update_name", "POST", "/topic/update_name/", params={"topic_id": "t1", "new_name": "Family"}),
+    Scenario("topic.delete", "POST", "/topic/delete/", params={"topic_id": "t1"}),
+
+    Scenario("search", "GET", "/search/", params={"q": "married venice"}),
+    Scenario("search[filtered]", "GET", "/search/", params={"q": "married", "about_namedentity_id": "ne1", "limit": 10}),
+]
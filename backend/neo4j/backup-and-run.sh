@@ -1,27 +1,19 @@
 #!/bin/bash
 neo4j start
 
-# Load backup if it exists
-if [ -f /backups/database.cypher ]; then
+# Backups are snapshots plus a change log written by the backend (app/db/backup.py), which restores the
+# newest snapshot into the empty database on startup. The Cypher exports below are only loaded without one.
+if ls /backups/snapshot-*.ndjson.gz >/dev/null 2>&1; then
+    echo "Found a snapshot, the backend restores it on startup"
+elif [ -f /backups/database.cypher ]; then
     echo "Loading exisiting Cypher export..."
     cypher-shell -u neo4j -p password -d neo4j -f /backups/database.cypher
-elif [ -f /backups/database-initial.cypher ]; then
+elif [ -f /backups/database_initial.cypher ]; then
     echo "Loading Cypher export containing the inital database setup..."
-    cypher-shell -u neo4j -p password -d neo4j -f /backups/database.cypher
+    cypher-shell -u neo4j -p password -d neo4j -f /backups/database_initial.cypher
 fi
 
-while true; do
-
-    echo "Neo4j is running. Waiting for the next backup cycle..."
-
-    # Wait for 5 minutes (300 seconds)
-    sleep 300
-
-    echo "Creating Cypher export..."
-
-    # Perform the Cypher export while Neo4j is running
-    cypher-shell -u neo4j -p password -d neo4j "CALL apoc.export.cypher.all('/backups/database.cypher', {useOptimizations: {type: 'UNWIND_BATCH', unwindBatchSize: 20}, format: 'plain'})"
-    
-    echo "Cypher export completed and saved to /backups/database.cypher"
+echo "Neo4j is running."
 
-done
+# Keep the container running as long as Neo4j does
+tail -f /dev/null
@@ -9,7 +9,25 @@ setup(
         "uvicorn",
         "neo4j",
         "pydantic",
+        "prometheus_client",
         "requests",
+        "httpx",
+        "numpy",
         "pytest"
     ],
+    entry_points={
+        "console_scripts": [
+            "listen-rebuild-briefings=app.utils.briefing:main",
+            "listen-backup=app.db.backup:main",
+            "listen-import=app.utils.importer:main",
+            "listen-export=app.utils.exporter:main",
+        ],
+    },
+    extras_require={
+        # Shared entity cache for deployments with several workers (ENTITY_CACHE_BACKEND=redis)
+        "redis": ["redis"],
+        # Arrow IPC and zstd compression of /general/export and listen-export
+        "arrow": ["pyarrow"],
+        "zstd": ["zstandard"],
+    },
 )
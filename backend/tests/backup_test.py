@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from benchmarks.recorded_driver import RecordedDriver, RecordedTransaction
+from app.db.backup import list_snapshots, load_snapshot, prune_snapshots, replay_changes, write_snapshot
+from app.db.changelog import ChangeLog
+from app.models import Topic
+from app.storage.neo4j_store import Neo4jStore
+
+# Neo4j is replaced by the recorded driver of the benchmarks; restoring into a real database is covered by hand
+
+GRAPH = [
+    {"match": r"RETURN elementId\(n\) AS id", "records": [
+        {"id": "4:a:0", "labels": ["NamedEntity", "Person"], "properties": {"namedentity_id": "ne1", "name": "Marie Weber"}},
+        {"id": "4:a:1", "labels": ["Person", "NamedEntity"], "properties": {"namedentity_id": "ne2", "name": "Paul Klein"}},
+        {"id": "4:a:2", "labels": ["Statement"], "properties": {"statement_id": "s1", "text": "Marie met Paul"}},
+    ]},
+    {"match": r"RETURN type\(r\) AS type", "records": [
+        {"type": "IS_ABOUT", "start": "4:a:2", "end": "4:a:0", "properties": {}},
+        {"type": "MENTIONS", "start": "4:a:2", "end": "4:a:1", "properties": {}},
+        {"type": "SOME_RELATION", "start": "4:a:0", "end": "4:a:1", "properties": {"source_statement_id": "s1"}},
+    ]},
+]
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """The (query, parameters) of every statement run against a recorded driver."""
+    runs = []
+    original_run = RecordedTransaction.run
+
+    async def run(self, query, parameters=None, **kwargs):
+        runs.append((query, {**(parameters or {}), **kwargs}))
+        return await original_run(self, query, parameters, **kwargs)
+
+    monkeypatch.setattr(RecordedTransaction, "run", run)
+    return runs
+
+
+def test_change_log_keeps_its_position_after_truncation():
+    change_log = ChangeLog(":memory:")
+    assert change_log.position() == 0
+    first = change_log.append([("CREATE (t:Topic {topic_id: $topic_id})", {"topic_id": "t1"})])
+    second = change_log.append([("MATCH (n) DETACH DELETE n", {})], autocommit=True)
+    assert change_log.read(0, 10) == [
+        (first, False, [("CREATE (t:Topic {topic_id: $topic_id})", {"topic_id": "t1"})]),
+        (second, True, [("MATCH (n) DETACH DELETE n", {})]),
+    ]
+    assert change_log.truncate(second) == 2
+    assert change_log.read(0, 10) == [] and change_log.position() == second
+
+
+def test_neo4j_store_logs_the_statements_of_its_writes():
+    change_log = ChangeLog(":memory:")
+    store = Neo4jStore(RecordedDriver([
+        {"match": r"RETURN n\.namedentity_id AS namedentity_id\s*$", "records": [{"namedentity_id": "ne1"}]},
+        {"match": r"AS deleted\s*$", "records": [{"deleted": 0}]},
+    ]), change_log)
+    asyncio.run(store.create_topic(Topic(topic_id="t1", name="Work")))
+    asyncio.run(store.get_topic_by_id("t1"))
+    asyncio.run(store.delete_namedentity_cascade("ne1", batch_size=10))
+
+    (_, autocommit, statements), (_, cascade_autocommit, cascade) = change_log.read(0, 10)
+    assert not autocommit and statements == [(statements[0][0], {"name": "Work", "topic_id": "t1"})]
+    assert "CREATE (p:Topic" in statements[0][0]
+    # The cascade runs auto-commit transactions (CALL {} IN TRANSACTIONS) and is replayed that way
+    assert cascade_autocommit and len(cascade) == 5
+
+
+def test_snapshot_is_restored_in_batches_per_label_set_and_type(tmp_path, runs):
+    counts = asyncio.run(write_snapshot(RecordedDriver(GRAPH), str(tmp_path), position=7))
+    assert counts == {"nodes": 3, "relationships": 3}
+    [(position, path)] = list_snapshots(str(tmp_path))
+    assert position == 7
+
+    runs.clear()
+    counts = asyncio.run(load_snapshot(RecordedDriver([]), path, batch_size=2, concurrency=2))
+    assert counts == {"nodes": 3, "relationships": 3, "position": 7}
+    batches = [(query, parameters["rows"]) for query, parameters in runs if "UNWIND $rows" in query]
+    # Nodes with the same labels in any order share batches, all nodes exist before the first relationship
+    assert [len(rows) for _, rows in batches] == [2, 1, 1, 1, 1]
+    assert ":`_Restore`:`NamedEntity`:`Person` {_restore_id: row.id}" in batches[0][0]
+    assert [row["id"] for row in batches[0][1]] == ["4:a:0", "4:a:1"]
+    assert all("CREATE (a)-[r:" in query for query, _ in batches[2:])
+    assert {"start": "4:a:0", "end": "4:a:1", "properties": {"source_statement_id": "s1"}} in batches[4][1]
+    assert "REMOVE n:_Restore, n._restore_id" in runs[-2][0] and "DROP INDEX" in runs[-1][0]
+
+
+def test_replay_and_pruning_follow_the_snapshot_positions(tmp_path, runs):
+    change_log = ChangeLog(":memory:")
+    for topic_id in ("t1", "t2", "t3"):
+        change_log.append([("CREATE (t:Topic {topic_id: $topic_id})", {"topic_id": topic_id})])
+    runs.clear()
+    assert asyncio.run(replay_changes(RecordedDriver([]), change_log, after=1)) == {"replayed": 2, "skipped": 0}
+    assert [parameters for _, parameters in runs] == [{"topic_id": "t2"}, {"topic_id": "t3"}]
+
+    for position in (1, 2, 3):
+        (tmp_path / f"snapshot-{position:012d}-0.ndjson.gz").write_bytes(b"")
+    assert prune_snapshots(str(tmp_path), keep=2, change_log=change_log) == 1
+    assert [position for position, _ in list_snapshots(str(tmp_path))] == [2, 3]
+    # Changes contained in the oldest kept snapshot are no longer needed
+    assert [seq for seq, _, _ in change_log.read(0, 10)] == [3]
@@ -0,0 +1,59 @@
+import asyncio
+from app.utils.briefing import BriefingIndex, rebuild_briefings, top_counts
+
+
+def row(statement_id, about="ne1", mentioned=(), topic_id=None, text=None):
+    return {"text": text or f"Statement {statement_id}", "statement_id": statement_id, "about_namedentity_id": about,
+            "mentioned_namedentity_ids": list(mentioned), "topic_id": topic_id}
+
+
+class RowStore:
+    """The one GraphStore method rebuild_briefings reads."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: row["statement_id"])
+
+    async def get_statement_rows(self, after, limit):
+        return [row for row in self.rows if row["statement_id"] > (after or "")][:limit]
+
+
+def test_deltas_match_a_rebuild(tmp_path):
+    async def run():
+        index = BriefingIndex(str(tmp_path / "briefings.sqlite3"), latest_statements=2)
+        await index.add_statements([row("s1", mentioned=["ne2", "ne1"], topic_id="t1"), row("s2", mentioned=["ne2"]), row("s3", about="ne2", mentioned=["ne1"])])
+        await index.set_mentions("s2", ["ne3", "ne2"], replace=False)
+        await index.set_topic("s2", "t1")
+        await index.remove_statements(["s1", "missing"])
+        await index.set_text("s2", "Edited")
+        await index.add_statements([row("s4", mentioned=["ne3"])])
+        incremental = {namedentity_id: await index.get(namedentity_id) for namedentity_id in ("ne1", "ne2")}
+
+        current = [row("s2", mentioned=["ne2", "ne3"], topic_id="t1", text="Edited"), row("s3", about="ne2", mentioned=["ne1"]), row("s4", mentioned=["ne3"])]
+        assert await rebuild_briefings(RowStore(current), index, batch_size=2) == 3
+        rebuilt = {namedentity_id: await index.get(namedentity_id) for namedentity_id in ("ne1", "ne2")}
+        index.close()
+        return incremental, rebuilt
+
+    incremental, rebuilt = asyncio.run(run())
+    for document in (incremental["ne1"], rebuilt["ne1"]):
+        assert document["statement_count"] == 2
+        # The entity itself is not counted among the mentioned ones, and the rebuild keeps the order of the statements
+        assert document["mentioned"] == {"ne2": 1, "ne3": 2} and document["topics"] == {"t1": 1}
+        assert document["latest"] == [["s4", "Statement s4"], ["s2", "Edited"]]
+    assert incremental["ne2"]["mentioned"] == rebuilt["ne2"]["mentioned"] == {"ne1": 1}
+
+
+def test_removing_an_entity_drops_its_briefing_and_mentions(tmp_path):
+    async def run():
+        index = BriefingIndex(str(tmp_path / "briefings.sqlite3"))
+        await index.add_statements([row("s1", mentioned=["ne2"]), row("s2", about="ne2", mentioned=["ne1"])])
+        await index.remove_namedentity("ne2")
+        return await index.get("ne1"), await index.get("ne2"), await index.is_empty()
+
+    ne1, ne2, empty = asyncio.run(run())
+    assert ne1["statement_count"] == 1 and ne1["mentioned"] == {}
+    assert ne2 is None and not empty
+
+
+def test_top_counts_breaks_ties_by_id():
+    assert top_counts({"b": 2, "a": 2, "c": 5, "d": 1}, 3) == [("c", 5), ("a", 2), ("b", 2)]
@@ -0,0 +1,57 @@
+import asyncio
+from app.genai.cache import DerivationCache, derivation_key
+from app.genai.genai import StubDerivationBackend
+from app.genai.pipeline import derive_relationships
+from app.genai.scheduler import BatchScheduler
+from app.models import NamedEntity, Statement
+from app.utils.metrics import DERIVATION_CACHE_HITS
+
+
+def statement_inputs(statement_id, text="Married @Anna", mentioned=("ne2",)):
+    statement = Statement(text=text, statement_id=statement_id, about_namedentity_id="ne1")
+    return statement, NamedEntity(name="Bob", namedentity_id="ne1"), [NamedEntity(name=f"Entity {i}", namedentity_id=i) for i in mentioned]
+
+
+def test_same_content_is_answered_from_the_cache(tmp_path, monkeypatch):
+    cache = DerivationCache(str(tmp_path / "cache.sqlite3"), max_bytes=1_000_000)
+    scheduler = BatchScheduler(StubDerivationBackend(), max_batch_size=32, max_wait=0.01, concurrency=1)
+
+    async def derive_twice():
+        await scheduler.start()
+        await derive_relationships({"s1": statement_inputs("s1")}, scheduler, cache)
+        # Fail loudly if the model were called again
+        monkeypatch.setattr("app.genai.genai.derive_relationships_from_statement", None)
+        hits = DERIVATION_CACHE_HITS._value.get()
+        relationships = await derive_relationships({"s2": statement_inputs("s2")}, scheduler, cache)
+        assert DERIVATION_CACHE_HITS._value.get() == hits + 1
+        return relationships
+
+    relationships = asyncio.run(derive_twice())
+    assert [(r.from_node, r.to_node, r.attributes.source_statement_id) for r in relationships["s2"]] == [("ne1", "ne2", "s2")]
+
+
+def test_text_mentions_and_version_are_part_of_the_key():
+    key = derivation_key("v1", *statement_inputs("s1"))
+    assert derivation_key("v1", *statement_inputs("s2")) == key
+    assert derivation_key("v1", *statement_inputs("s1", text="Divorced @Anna")) != key
+    assert derivation_key("v1", *statement_inputs("s1", mentioned=("ne2", "ne3"))) != key
+    assert derivation_key("v1", *statement_inputs("s1", mentioned=("ne3", "ne2"))) == derivation_key("v1", *statement_inputs("s1", mentioned=("ne2", "ne3")))
+    assert derivation_key("v2", *statement_inputs("s1")) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DerivationCache(str(tmp_path / "cache.sqlite3"), max_bytes=600)
+    entry = [("ne1", "SOME_RELATION", "ne2")]
+    cache.put_many({f"key{i}": entry for i in range(10)})
+    cache.get_many(["key0"])
+    cache.put_many({f"key{i}": entry for i in range(10, 20)})
+
+    assert cache.size() <= 600
+    present = set(cache.get_many([f"key{i}" for i in range(20)]))
+    # The entries written last and the one read after them are kept, older ones were evicted
+    assert {"key0", *(f"key{i}" for i in range(10, 20))} <= present
+    assert len(present) < 20
+
+    # The size survives a restart
+    reopened = DerivationCache(str(tmp_path / "cache.sqlite3"), max_bytes=600)
+    assert reopened.size() == cache.size()
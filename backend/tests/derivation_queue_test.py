@@ -0,0 +1,63 @@
+from app.genai.pipeline import DerivationQueue
+
+# The job bookkeeping of the background derivation; the workers are covered by memory_store_test.py
+
+
+def test_queued_job_absorbs_later_requests():
+    queue = DerivationQueue(":memory:")
+    first = queue.enqueue(["s1", "s2"])
+    assert queue.enqueue(["s1"]) == {"s1": first["s1"]}
+    assert queue.depth() == 2
+
+
+def test_job_for_a_running_statement_waits_and_supersedes_it():
+    queue = DerivationQueue(":memory:")
+    running_id = queue.enqueue(["s1"])["s1"]
+    assert queue.claim(10) == [(running_id, "s1")]
+
+    newer_id = queue.enqueue(["s1"])["s1"]
+    assert newer_id != running_id
+    # Not started while the older job is running, which sees that its result is outdated
+    assert queue.claim(10) == []
+    assert queue.queued_statements(["s1", "s2"]) == {"s1"}
+
+    queue.finish([(running_id, "superseded", None)])
+    assert queue.claim(10) == [(newer_id, "s1")]
+
+
+def test_failed_jobs_are_retried_and_interrupted_jobs_recovered():
+    queue = DerivationQueue(":memory:")
+    job_id = queue.enqueue(["s1"])["s1"]
+    queue.claim(10)
+    assert queue.retry_or_fail(job_id, "model unavailable", max_attempts=2) == "queued"
+    queue.claim(10)
+    assert queue.retry_or_fail(job_id, "model unavailable", max_attempts=2) == "failed"
+    assert queue.get(job_id)["error"] == "model unavailable"
+
+    interrupted_id = queue.enqueue(["s2"])["s2"]
+    queue.claim(10)
+    # Stopping workers hand their jobs back
+    assert queue.release() == 1
+    assert queue.claim(10) == [(interrupted_id, "s2")]
+
+
+def test_processes_sharing_the_file_take_over_only_expired_leases(tmp_path):
+    path = str(tmp_path / "derivation_jobs.sqlite3")
+    running, starting = DerivationQueue(path), DerivationQueue(path)
+    job_id = running.enqueue(["s1"])["s1"]
+    assert running.claim(10) == [(job_id, "s1")]
+    # A process starting next to a live one leaves its jobs alone
+    assert starting.recover() == 0
+    assert starting.claim(10) == []
+    running.finish([(job_id, "done", 2)])
+    assert starting.get(job_id)["status"] == "done"
+
+    stopped = DerivationQueue(path, lease=0)
+    job_id = stopped.enqueue(["s2"])["s2"]
+    stopped.claim(10)
+    # The lease of a stopped process expires and another one takes the job over
+    assert starting.recover() == 1
+    assert starting.claim(10) == [(job_id, "s2")]
+    stopped.finish([(job_id, "done", 0)])
+    assert stopped.retry_or_fail(job_id, "late failure", max_attempts=3) is None
+    assert starting.get(job_id)["status"] == "running" and starting.get(job_id)["owner"] == starting.owner
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from app.genai.genai import DerivationBackend, StubDerivationBackend
+from app.genai.scheduler import BatchScheduler
+from app.models import NamedEntity, Statement
+
+
+class RecordingBackend(DerivationBackend):
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    async def derive_batch(self, inputs):
+        self.batches.append([statement.statement_id for statement, _, _ in inputs])
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return await StubDerivationBackend().derive_batch(inputs)
+
+
+def statement_inputs(statement_id):
+    statement = Statement(text="Met @Anna", statement_id=statement_id, about_namedentity_id="ne1")
+    return statement, NamedEntity(name="Bob", namedentity_id="ne1"), [NamedEntity(name="Anna", namedentity_id="ne2")]
+
+
+async def run(backend, max_batch_size, max_wait, requests):
+    scheduler = BatchScheduler(backend, max_batch_size=max_batch_size, max_wait=max_wait, concurrency=2)
+    await scheduler.start()
+    try:
+        return await requests(scheduler)
+    finally:
+        await scheduler.stop()
+
+
+def test_concurrent_requests_are_coalesced_into_full_batches():
+    backend = RecordingBackend()
+    results = asyncio.run(run(backend, 50, 1.0, lambda scheduler: asyncio.gather(
+        *(scheduler.derive(statement_inputs(f"s{i}")) for i in range(100))
+    )))
+    assert [len(batch) for batch in backend.batches] == [50, 50]
+    # Every caller gets the relationships of its own statement
+    assert [relationships[0].attributes.source_statement_id for relationships in results] == [f"s{i}" for i in range(100)]
+
+
+def test_a_partial_batch_is_dispatched_after_max_wait():
+    backend = RecordingBackend()
+
+    async def requests(scheduler):
+        started = asyncio.get_running_loop().time()
+        await scheduler.derive_many([statement_inputs("s1"), statement_inputs("s2")])
+        return asyncio.get_running_loop().time() - started
+
+    elapsed = asyncio.run(run(backend, 50, 0.05, requests))
+    assert backend.batches == [["s1", "s2"]]
+    assert 0.04 <= elapsed < 1.0
+
+
+def test_backend_errors_reach_every_caller_of_the_batch():
+    backend = RecordingBackend(fail=True)
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        asyncio.run(run(backend, 50, 0.01, lambda scheduler: scheduler.derive_many([statement_inputs("s1"), statement_inputs("s2")])))
+    assert backend.batches == [["s1", "s2"]]
@@ -1,7 +1,11 @@
+import json
 import os
+import time
 import pytest
 import requests
-from app.utils.neo4j import get_driver
+from neo4j import GraphDatabase
+from app.utils.neo4j import get_driver_settings
+from app.db.migrations import LATEST_SCHEMA_VERSION
 
 # The FastAPI service should be running on port 8001
 URL = "http://localhost:8001/"
@@ -16,25 +20,36 @@ def set_test_env_vars():
 
 @pytest.fixture(scope="module")
 def driver():
-    driver = get_driver()
+    # The app itself uses a pooled async driver; the tests only need a plain synchronous one
+    settings = get_driver_settings()
+    driver = GraphDatabase.driver(settings["uri"], auth=(settings["user"], settings["password"]))
     yield driver
     driver.close()  # Ensure the driver is properly closed after tests
 
 
 @pytest.fixture(scope="module", autouse=True)
 def database_setup_and_teardown(driver):
-    # Setup: Create necessary constraints
-    with driver.session() as session:
-        session.run("CREATE CONSTRAINT c1 FOR (s:Statement) REQUIRE s.statement_id IS UNIQUE;")
-        session.run("CREATE CONSTRAINT c2 FOR (p:NamedEntity) REQUIRE p.namedentity_id IS UNIQUE;")
-    
+    # Setup: Constraints and indexes are created by the schema migrations when the backend starts
+
     yield  # This is where the test runs
 
-    # Teardown: Remove all nodes, relationships, and constraints
+    # Teardown: Remove all nodes and relationships, but keep the recorded schema version
     with driver.session() as session:
-        session.run("MATCH (n) DETACH DELETE n")
-        session.run("DROP CONSTRAINT c1")
-        session.run("DROP CONSTRAINT c2")
+        session.run("MATCH (n) WHERE NOT n:SchemaVersion DETACH DELETE n")
+
+
+def test_schema_migrations_applied(driver):
+    # The backend applies all migrations at startup and records the latest version
+    with driver.session() as session:
+        version = session.run("MATCH (v:SchemaVersion {name: 'listen'}) RETURN v.version AS version").single()
+        assert version is not None
+        assert version["version"] == LATEST_SCHEMA_VERSION
+
+        indexes = [record["name"] for record in session.run("SHOW INDEXES YIELD name")]
+        assert "some_relation_source_statement_id" in indexes
+        assert "namedentity_name" in indexes
+        constraints = [record["name"] for record in session.run("SHOW CONSTRAINTS YIELD name")]
+        assert "topic_id_unique" in constraints
 
 
 def test_create_namedentity(driver):
@@ -87,11 +102,13 @@ def test_remove_entity_and_associated_statements(driver):
 
     # Delete the NamedEntity
     # Test removing an entity
-    namedentity_delete_payload = {"namedentity_id": "ne_delete"}
+    # A batch size of 1 spreads the cascade over one transaction per statement
+    namedentity_delete_payload = {"namedentity_id": "ne_delete", "batch_size": 1}
     response = requests.post(URL + "namedentity/delete/", params=namedentity_delete_payload)
     print(response.json())  # Add this line to see the response message for debugging
 
     assert response.status_code == 200
+    assert response.json()["statements_deleted"] == 2
 
     # Verify that the entity and associated statements are deleted
     with driver.session() as session:
@@ -179,6 +196,17 @@ def test_create_statemet_and_update_text(driver):
         assert result["text"] == "Some new text", f"Expected text to be 'new_text', but got {result['text']}"
 
 
+def wait_for_derivation(job_id, timeout=10):
+    # Relationships are derived from the mentions by background workers
+    deadline = time.monotonic() + timeout
+    while True:
+        job = requests.get(URL + "statement/derivation_job/", params={"job_id": job_id}).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        assert time.monotonic() < deadline, f"Derivation job {job_id} did not finish"
+        time.sleep(0.05)
+
+
 def test_add_mentions_and_check_connections(driver):
     # Create NamedEntities
     entity1_payload = {"name": "Entity1", "namedentity_id": "ne_mention1", "additional_labels": ["Person"]}
@@ -199,6 +227,7 @@ def test_add_mentions_and_check_connections(driver):
     }   
     response = requests.post(URL + "statement/update_mentions/", params=mentions_payload)
     assert response.status_code == 200
+    assert wait_for_derivation(response.json()["derivation_job_id"])["status"] == "done"
 
     # Verify the relationships are created
     with driver.session() as session:
@@ -208,6 +237,26 @@ def test_add_mentions_and_check_connections(driver):
         """).single()
         assert connection is not None
 
+def test_update_mentions_reports_missing_entities(driver):
+    # Create a NamedEntity and a statement about it
+    requests.post(URL + "namedentity/create/", json={"name": "Entity1", "namedentity_id": "ne_missing_mention", "additional_labels": ["Person"]})
+    requests.post(URL + "statement/create/", json={"text": "Statement with unknown mention", "statement_id": "s_missing_mention", "about_namedentity_id": "ne_missing_mention"})
+
+    # Mention one existing and one unknown entity
+    mentions_payload = {"statement_id": "s_missing_mention", "mentioned_namedentity_ids": ["ne_missing_mention", "ne_unknown"]}
+    response = requests.post(URL + "statement/update_mentions/", params=mentions_payload)
+    assert response.status_code == 200
+    assert response.json()["mentioned_namedentity_ids"] == ["ne_missing_mention"]
+    assert response.json()["missing_namedentity_ids"] == ["ne_unknown"]
+
+    # Verify that only the existing entity is linked
+    with driver.session() as session:
+        mentioned = session.run("""
+            MATCH (:Statement {statement_id: 's_missing_mention'})-[:MENTIONS]->(m:NamedEntity)
+            RETURN collect(m.namedentity_id) AS ids
+        """).single()["ids"]
+        assert mentioned == ["ne_missing_mention"]
+
 def test_remove_statement_and_derived_relationships(driver):
     # Create NamedEntities
     entity1_payload = {"name": "Entity1", "namedentity_id": "ne_rel1", "additional_labels": ["Person"]}
@@ -220,6 +269,7 @@ def test_remove_statement_and_derived_relationships(driver):
     requests.post(URL + "statement/create/", json=statement_payload)
     mentions_payload = {"statement_id": "s5", "mentioned_namedentity_ids": ["ne_rel1", "ne_rel2"]}
     response = requests.post(URL + "statement/update_mentions/", params=mentions_payload)
+    wait_for_derivation(response.json()["derivation_job_id"])
 
     # Verify the relationships exist
     with driver.session() as session:
@@ -300,3 +350,193 @@ def test_set_topic_and_update_name(driver):
             RETURN s, t
         """).single()
         assert not result, "HAS_TOPIC relationship was not removed"
+
+
+def test_create_statement_batch(driver):
+    # Create NamedEntities and a Topic
+    requests.post(URL + "namedentity/create/", json={"name": "Entity1", "namedentity_id": "ne_batch1", "additional_labels": ["Person"]})
+    requests.post(URL + "namedentity/create/", json={"name": "Entity2", "namedentity_id": "ne_batch2", "additional_labels": ["Person"]})
+    requests.post(URL + "topic/create/", json={"topic_id": "t_batch", "name": "Batch Topic"})
+
+    # Create three statements in one request, one of them about a missing entity
+    batch_payload = [
+        {"statement": {"text": "Batch statement 1", "statement_id": "s_batch1", "about_namedentity_id": "ne_batch1"},
+         "mentioned_namedentity_ids": ["ne_batch2", "ne_missing"], "topic_id": "t_batch"},
+        {"statement": {"text": "Batch statement 2", "statement_id": "s_batch2", "about_namedentity_id": "ne_batch2"}},
+        {"statement": {"text": "Batch statement 3", "statement_id": "s_batch3", "about_namedentity_id": "ne_missing"}},
+    ]
+    response = requests.post(URL + "statement/create_batch/", params={"chunk_size": 2}, json=batch_payload)
+    assert response.status_code == 200
+
+    results = response.json()
+    assert [result["created"] for result in results] == [True, True, False]
+    assert results[0]["mentioned_namedentity_ids"] == ["ne_batch2"]
+    assert results[0]["missing_namedentity_ids"] == ["ne_missing"]
+    assert results[0]["topic_id"] == "t_batch"
+    assert results[1]["derivation_job_id"] is None
+    wait_for_derivation(results[0]["derivation_job_id"])
+
+    # Verify the statements, mentions, topic and derived relationships in the database
+    with driver.session() as session:
+        result = session.run("""
+            MATCH (s:Statement {statement_id: 's_batch1'})-[:IS_ABOUT]->(:NamedEntity {namedentity_id: 'ne_batch1'}),
+                  (s)-[:MENTIONS]->(:NamedEntity {namedentity_id: 'ne_batch2'}),
+                  (s)-[:HAS_TOPIC]->(:Topic {topic_id: 't_batch'})
+            RETURN s
+        """).single()
+        assert result, "Batch statement was not linked correctly"
+
+        connection = session.run("""
+            MATCH (:NamedEntity {namedentity_id: 'ne_batch1'})-[r:SOME_RELATION {source_statement_id: 's_batch1'}]->(:NamedEntity {namedentity_id: 'ne_batch2'})
+            RETURN r
+        """).single()
+        assert connection is not None
+
+        missing = session.run("MATCH (s:Statement {statement_id: 's_batch3'}) RETURN s").single()
+        assert missing is None
+
+def test_paginate_and_stream_statements(driver):
+    requests.post(URL + "namedentity/create/", json={"name": "Paged", "namedentity_id": "ne_paged", "additional_labels": ["Person"]})
+    for i in range(5):
+        requests.post(URL + "statement/create/", json={"text": f"Statement {i}", "statement_id": f"s_page{i}", "about_namedentity_id": "ne_paged"})
+
+    # Walk the pages by passing the last statement_id of a page as the cursor of the next
+    seen = []
+    after = None
+    while True:
+        params = {"namedentity_id": "ne_paged", "limit": 2}
+        if after:
+            params["after"] = after
+        response = requests.post(URL + "namedentity/get_statements/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        if not page:
+            break
+        assert len(page) <= 2
+        seen.extend(statement["statement_id"] for statement in page)
+        after = page[-1]["statement_id"]
+    assert seen == [f"s_page{i}" for i in range(5)]
+
+    # The streaming mode returns the same statements as newline-delimited JSON
+    response = requests.post(URL + "namedentity/get_statements/", params={"namedentity_id": "ne_paged", "stream": True}, stream=True)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    streamed = [json.loads(line)["statement_id"] for line in response.iter_lines() if line]
+    assert streamed == seen
+
+def test_read_after_write_is_not_served_from_cache(driver):
+    requests.post(URL + "topic/create/", json={"topic_id": "t_cached", "name": "Before"})
+
+    # The first read fills the cache, the second is answered from it
+    for _ in range(2):
+        response = requests.get(URL + "topic/read/", params={"topic_id": "t_cached"})
+        assert response.status_code == 200
+        assert response.json()["name"] == "Before"
+
+    requests.post(URL + "topic/update_name/", params={"topic_id": "t_cached", "new_name": "After"})
+    response = requests.get(URL + "topic/read/", params={"topic_id": "t_cached"})
+    assert response.json()["name"] == "After"
+
+    requests.post(URL + "general/delete_node/", params={"label": "Topic", "node_id": "t_cached"})
+    response = requests.get(URL + "topic/read/", params={"topic_id": "t_cached"})
+    assert response.status_code == 404
+
+def test_search_statements(driver):
+    requests.post(URL + "namedentity/create/", json={"name": "Searcher", "namedentity_id": "ne_search", "additional_labels": ["Person"]})
+    requests.post(URL + "statement/create/", json={"text": "Loves sailing on Lake Garda", "statement_id": "s_search1", "about_namedentity_id": "ne_search"})
+    requests.post(URL + "statement/create/", json={"text": "Allergic to peanuts", "statement_id": "s_search2", "about_namedentity_id": "ne_search"})
+
+    # Full-text indexes are eventually consistent, so give the index a moment to pick up the new nodes
+    with driver.session() as session:
+        session.run("CALL db.awaitIndexes(60)").consume()
+
+    response = requests.get(URL + "search/", params={"q": "sail garda", "about_namedentity_id": "ne_search"})
+    assert response.status_code == 200
+    hits = response.json()["hits"]
+    assert [hit["id"] for hit in hits] == ["s_search1"]
+    start, end = hits[0]["highlights"][0]
+    assert hits[0]["snippet"][start:end].lower().startswith("sail")
+
+def test_autocomplete_namedentity(driver):
+    requests.post(URL + "namedentity/create/", json={"name": "Zebulon Quartermaine", "namedentity_id": "ne_autocomplete", "additional_labels": ["Person"]})
+
+    response = requests.get(URL + "namedentity/autocomplete/", params={"q": "@quarterm"})
+    assert response.status_code == 200
+    assert {"namedentity_id": "ne_autocomplete", "name": "Zebulon Quartermaine", "fuzzy": False} in response.json()
+
+    # One typo still finds the entity
+    response = requests.get(URL + "namedentity/autocomplete/", params={"q": "zebulin"})
+    assert "ne_autocomplete" in [suggestion["namedentity_id"] for suggestion in response.json()]
+
+    requests.post(URL + "namedentity/delete/", params={"namedentity_id": "ne_autocomplete"})
+    response = requests.get(URL + "namedentity/autocomplete/", params={"q": "quarterm"})
+    assert "ne_autocomplete" not in [suggestion["namedentity_id"] for suggestion in response.json()]
+
+def test_similar_statements(driver):
+    requests.post(URL + "namedentity/create/", json={"name": "Sailor", "namedentity_id": "ne_similar", "additional_labels": ["Person"]})
+    requests.post(URL + "statement/create/", json={"text": "Loves sailing on Lake Garda", "statement_id": "s_similar1", "about_namedentity_id": "ne_similar"})
+    requests.post(URL + "statement/create/", json={"text": "Allergic to peanuts", "statement_id": "s_similar2", "about_namedentity_id": "ne_similar"})
+
+    # Scoped to an entity the statements are scored exactly, so this does not wait for the vector index
+    response = requests.get(URL + "statement/similar/", params={"q": "sailing on a lake", "about_namedentity_id": "ne_similar"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert [hit["statement"]["statement_id"] for hit in hits] == ["s_similar1", "s_similar2"]
+    assert hits[0]["score"] > hits[1]["score"]
+
+    with driver.session() as session:
+        session.run("CALL db.awaitIndexes(60)").consume()
+    response = requests.get(URL + "statement/similar/", params={"statement_id": "s_similar1", "k": 100})
+    assert "s_similar1" not in [hit["statement"]["statement_id"] for hit in response.json()]
+
+def test_namedentity_neighbourhood(driver):
+    for namedentity_id, name in [("ne_hood1", "Hub"), ("ne_hood2", "Spoke"), ("ne_hood3", "Rim")]:
+        requests.post(URL + "namedentity/create/", json={"name": name, "namedentity_id": namedentity_id, "additional_labels": ["Person"]})
+    requests.post(URL + "topic/create/", json={"name": "Neighbours", "topic_id": "t_hood"})
+    response = requests.post(URL + "statement/create_batch/", json=[
+        {"statement": {"text": "Lives next to @Spoke", "statement_id": "s_hood1", "about_namedentity_id": "ne_hood1"}, "mentioned_namedentity_ids": ["ne_hood2"], "topic_id": "t_hood"},
+        {"statement": {"text": "Works with @Rim", "statement_id": "s_hood2", "about_namedentity_id": "ne_hood2"}, "mentioned_namedentity_ids": ["ne_hood3"]},
+    ])
+    for result in response.json():
+        assert wait_for_derivation(result["derivation_job_id"])["status"] == "done"
+
+    response = requests.get(URL + "namedentity/neighbourhood/", params={"namedentity_id": "ne_hood1", "hops": 2})
+    assert response.status_code == 200
+    neighbourhood = response.json()
+    [statement] = neighbourhood["statements"]
+    assert statement["topic"]["topic_id"] == "t_hood"
+    assert [m["namedentity_id"] for m in statement["mentioned_namedentities"]] == ["ne_hood2"]
+    assert [(e["namedentity"]["namedentity_id"], e["hops"]) for e in neighbourhood["connected_entities"]] == [("ne_hood2", 1), ("ne_hood3", 2)]
+    assert {(r["from_node"], r["to_node"]) for r in neighbourhood["relationships"]} == {("ne_hood1", "ne_hood2"), ("ne_hood2", "ne_hood3")}
+    assert not neighbourhood["truncated"]
+
+    response = requests.get(URL + "namedentity/neighbourhood/", params={"namedentity_id": "ne_hood1", "hops": 2, "fan_out": 1})
+    assert [e["namedentity"]["namedentity_id"] for e in response.json()["connected_entities"]] == ["ne_hood2", "ne_hood3"]
+    assert requests.get(URL + "namedentity/neighbourhood/", params={"namedentity_id": "ne_missing"}).status_code == 404
+
+def test_namedentity_briefing(driver):
+    for namedentity_id, name in [("ne_brief1", "Briefed"), ("ne_brief2", "Contact")]:
+        requests.post(URL + "namedentity/create/", json={"name": name, "namedentity_id": namedentity_id, "additional_labels": ["Person"]})
+    requests.post(URL + "statement/create_batch/", json=[
+        {"statement": {"text": "Met @Contact at the harbour", "statement_id": "s_brief1", "about_namedentity_id": "ne_brief1"}, "mentioned_namedentity_ids": ["ne_brief2"]},
+        {"statement": {"text": "Owns a boat", "statement_id": "s_brief2", "about_namedentity_id": "ne_brief1"}},
+    ])
+    requests.post(URL + "statement/delete/", params={"statement_id": "s_brief1"})
+
+    response = requests.get(URL + "namedentity/briefing/", params={"namedentity_id": "ne_brief1"})
+    assert response.status_code == 200
+    briefing = response.json()
+    assert briefing["statement_count"] == 1
+    assert [statement["statement_id"] for statement in briefing["latest_statements"]] == ["s_brief2"]
+    assert briefing["top_mentioned"] == []
+    assert requests.get(URL + "namedentity/briefing/", params={"namedentity_id": "ne_missing"}).status_code == 404
+
+def test_describe_graph(driver):
+    requests.post(URL + "namedentity/create/", json={"name": "Counted", "namedentity_id": "ne_counted", "additional_labels": ["Person"]})
+    response = requests.get(URL + "general/describe_graph")
+    assert response.status_code == 200
+    statistics = response.json()
+    # The counts may be a few seconds old, so they are checked against each other rather than against the database
+    assert statistics["labels"]["NamedEntity"] >= 1 and statistics["nodes"] >= statistics["labels"]["NamedEntity"]
+    assert statistics["statements"] == statistics["labels"].get("Statement", 0)
+    assert sum(statistics["relationship_types"].values()) == statistics["relationships"]
@@ -0,0 +1,416 @@
+import json
+import time
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.main import app
+
+# Runs the API against the in-memory store, so unlike integration_test.py it needs neither Neo4j nor a running server
+
+@pytest.fixture
+def memory_store_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("GRAPH_STORE", "memory")
+    monkeypatch.setenv("MEMORY_STORE_SNAPSHOT_PATH", str(tmp_path / "graph.json"))
+    monkeypatch.setenv("ENTITY_CACHE_BACKEND", "none")
+    monkeypatch.setenv("DERIVATION_QUEUE_PATH", str(tmp_path / "derivation_jobs.sqlite3"))
+    monkeypatch.setenv("DERIVATION_CACHE_PATH", str(tmp_path / "derivation_cache.sqlite3"))
+    monkeypatch.setenv("BRIEFING_PATH", str(tmp_path / "briefings.sqlite3"))
+    # Every request sees the writes before it
+    monkeypatch.setenv("GRAPH_STATISTICS_TTL", "0")
+
+
+def wait_until_ready(client, timeout=5):
+    deadline = time.monotonic() + timeout
+    while client.get("/ready").status_code != 200:
+        assert time.monotonic() < deadline, "The application did not become ready"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def client(memory_store_env):
+    with TestClient(app) as client:
+        # The startup runs in the background after the lifespan yields
+        wait_until_ready(client)
+        yield client
+
+
+def create_people(client, *people):
+    for namedentity_id, name in people:
+        response = client.post("/namedentity/create", json={"name": name, "namedentity_id": namedentity_id, "additional_labels": ["Person"]})
+        assert response.status_code == 200
+
+
+def wait_for_derivation(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get("/statement/derivation_job/", params={"job_id": job_id}).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        assert time.monotonic() < deadline, f"Derivation job {job_id} did not finish"
+        time.sleep(0.01)
+
+
+def test_statements_mentions_and_derived_relationships(client):
+    create_people(client, ("ne1", "Bob"), ("ne2", "Anna"), ("ne3", "Carl"))
+    response = client.post("/statement/create/", json={"text": "Married @Anna", "statement_id": "s1", "about_namedentity_id": "ne1"})
+    assert response.status_code == 200
+
+    response = client.post("/statement/add_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne2", "ne_missing"]})
+    assert response.json()["mentioned_namedentity_ids"] == ["ne2"]
+    assert response.json()["missing_namedentity_ids"] == ["ne_missing"]
+    job = wait_for_derivation(client, response.json()["derivation_job_id"])
+    assert job["status"] == "done" and job["relationships_written"] == 1
+
+    connections = client.get("/namedentity/get_connections/", params={"namedentity_id": "ne2"}).json()
+    assert [connection["connected_entity"]["namedentity_id"] for connection in connections] == ["ne1"]
+    assert connections[0]["relationship"]["attributes"]["source_statement_id"] == "s1"
+
+    # Replacing the mentions replaces the derived relationships
+    response = client.post("/statement/update_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne3"]})
+    wait_for_derivation(client, response.json()["derivation_job_id"])
+    assert client.get("/namedentity/get_connections/", params={"namedentity_id": "ne2"}).json() == []
+    assert [m["namedentity_id"] for m in client.post("/statement/get_mentions/", params={"statement_id": "s1"}).json()] == ["ne3"]
+
+    client.post("/statement/delete/", params={"statement_id": "s1"})
+    assert client.get("/statement/read/", params={"statement_id": "s1"}).status_code == 404
+    assert client.get("/namedentity/get_connections/", params={"namedentity_id": "ne3"}).json() == []
+
+
+def test_derivation_does_not_recreate_relationships_of_a_deleted_statement(client, monkeypatch):
+    create_people(client, ("ne1", "Bob"), ("ne2", "Anna"))
+    store = app.state.store
+    read_inputs = store.get_derivation_inputs
+
+    async def read_inputs_then_delete(statement_ids):
+        inputs = await read_inputs(statement_ids)
+        # The statement is deleted between the read and the write of the worker
+        for statement_id in statement_ids:
+            await store.delete_statement(statement_id)
+        return inputs
+
+    monkeypatch.setattr(store, "get_derivation_inputs", read_inputs_then_delete)
+    client.post("/statement/create/", json={"text": "Married @Anna", "statement_id": "s1", "about_namedentity_id": "ne1"})
+    response = client.post("/statement/add_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne2"]})
+    assert wait_for_derivation(client, response.json()["derivation_job_id"])["status"] == "done"
+    assert client.get("/namedentity/get_connections/", params={"namedentity_id": "ne2"}).json() == []
+    assert client.get("/general/describe_graph").json()["relationships"] == 0
+
+
+def test_name_index_and_pagination(client):
+    create_people(client, ("ne_b", "Sam"), ("ne_a", "Sam"), ("ne_c", "Alex"))
+    response = client.post("/namedentity/get_by_name/", params={"name": "Sam", "limit": 1})
+    assert [entity["namedentity_id"] for entity in response.json()["namedentities"]] == ["ne_a"]
+    response = client.post("/namedentity/get_by_name/", params={"name": "Sam", "after": "ne_a"})
+    assert [entity["namedentity_id"] for entity in response.json()["namedentities"]] == ["ne_b"]
+
+    client.post("/general/update_node/", params={"label": "NamedEntity", "node_id": "ne_b"}, json={"name": "Samuel"})
+    response = client.post("/namedentity/get_by_name/", params={"name": "Samuel"})
+    assert [entity["namedentity_id"] for entity in response.json()["namedentities"]] == ["ne_b"]
+
+
+def test_cascade_delete(client):
+    create_people(client, ("ne1", "Bob"), ("ne2", "Anna"))
+    client.post("/topic/create/", json={"topic_id": "t1", "name": "Family"})
+    batch = [
+        {"statement": {"text": f"Statement {i}", "statement_id": f"s{i}", "about_namedentity_id": "ne1"}, "mentioned_namedentity_ids": ["ne2"], "topic_id": "t1"}
+        for i in range(3)
+    ]
+    results = client.post("/statement/create_batch/", json=batch).json()
+    assert all(result["created"] for result in results)
+    for result in results:
+        wait_for_derivation(client, result["derivation_job_id"])
+
+    response = client.post("/namedentity/delete/", params={"namedentity_id": "ne1"})
+    assert response.status_code == 200
+    assert response.json()["statements_deleted"] == 3
+    assert response.json()["derived_relationships_deleted"] == 6
+    assert client.get("/namedentity/get_connections/", params={"namedentity_id": "ne2"}).json() == []
+    assert client.get("/general/describe_graph").json() == {
+        "nodes": 2, "statements": 0, "relationships": 0, "labels": {"NamedEntity": 1, "Person": 1, "Topic": 1}, "relationship_types": {},
+    }
+
+
+class UnreachableCacheBackend:
+    async def get(self, key):
+        raise ConnectionError("cache unreachable")
+
+    set = delete = delete_prefix = get
+
+
+def test_writes_succeed_while_the_cache_is_unreachable(client, monkeypatch):
+    create_people(client, ("ne1", "Anna"), ("ne2", "Annabel"))
+    monkeypatch.setattr(app.state.cache, "backend", UnreachableCacheBackend())
+    assert client.post("/namedentity/update_labels/", params={"namedentity_id": "ne1", "additional_labels": ["Friend"]}).status_code == 200
+    assert client.post("/namedentity/delete/", params={"namedentity_id": "ne2"}).status_code == 200
+    # The indexes are updated after the invalidation
+    response = client.get("/namedentity/autocomplete/", params={"q": "ann"})
+    assert [suggestion["namedentity_id"] for suggestion in response.json()] == ["ne1"]
+    assert client.get("/namedentity/read/", params={"namedentity_id": "ne1"}).json()["additional_labels"] == ["Friend"]
+
+
+def test_snapshot_survives_restart(memory_store_env):
+    # Leaving the client shuts the app down, which writes the snapshot; the next lifespan loads it
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        create_people(client, ("ne1", "Bob"), ("ne2", "Anna"))
+        client.post("/statement/create/", json={"text": "Married @Anna", "statement_id": "s1", "about_namedentity_id": "ne1"})
+        response = client.post("/statement/add_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne2"]})
+        wait_for_derivation(client, response.json()["derivation_job_id"])
+        before = client.get("/general/describe_graph").json()
+        assert before["relationship_types"] == {"IS_ABOUT": 1, "MENTIONS": 1, "SOME_RELATION": 2}
+
+    with TestClient(app) as restarted:
+        wait_until_ready(restarted)
+        assert restarted.get("/general/describe_graph").json() == before
+        assert restarted.get("/statement/read/", params={"statement_id": "s1"}).json()["about_namedentity_id"] == "ne1"
+        assert len(restarted.get("/namedentity/get_connections/", params={"namedentity_id": "ne1"}).json()) == 1
+
+
+def test_search_ranks_filters_and_highlights(client):
+    create_people(client, ("ne1", "Bob"), ("ne2", "Venice Beach"))
+    client.post("/topic/create/", json={"topic_id": "t1", "name": "Holidays"})
+    client.post("/statement/create/", json={"text": "Married Anna in Venice", "statement_id": "s1", "about_namedentity_id": "ne1"})
+    client.post("/statement/create/", json={"text": "Travelled to Venice by train", "statement_id": "s2", "about_namedentity_id": "ne1"})
+    client.post("/statement/set_topic/", params={"statement_id": "s2", "topic_id": "t1"})
+
+    response = client.get("/search/", params={"q": "married venice"})
+    assert response.status_code == 200
+    hits = response.json()["hits"]
+    assert hits[0]["id"] == "s1"
+    assert {hit["id"] for hit in hits} == {"s1", "s2", "ne2"}
+    start, end = hits[0]["highlights"][0]
+    assert hits[0]["snippet"][start:end] == "Married"
+
+    hits = client.get("/search/", params={"q": "venice", "topic_id": "t1"}).json()["hits"]
+    assert [hit["id"] for hit in hits] == ["s2"]
+
+    page = client.get("/search/", params={"q": "venice", "limit": 2}).json()
+    assert len(page["hits"]) == 2 and page["next_offset"] == 2
+    assert client.get("/search/", params={"q": "venice", "offset": 2}).json()["next_offset"] is None
+
+
+def test_autocomplete_follows_writes_and_is_warmed_at_startup(memory_store_env):
+    def suggestions(client, q, **params):
+        response = client.get("/namedentity/autocomplete/", params={"q": q, **params})
+        assert response.status_code == 200
+        return [(s["namedentity_id"], s["fuzzy"]) for s in response.json()]
+
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        create_people(client, ("ne1", "Anna Schmidt"), ("ne2", "Annabel"), ("ne3", "Bob"))
+        assert suggestions(client, "@ann") == [("ne1", False), ("ne2", False)]
+        assert suggestions(client, "schm") == [("ne1", False)]
+        assert suggestions(client, "anan") == [("ne1", True), ("ne2", True)]
+        assert suggestions(client, "anan", fuzzy=False) == []
+
+        client.post("/general/update_node/", params={"label": "NamedEntity", "node_id": "ne3"}, json={"name": "Annika"})
+        assert suggestions(client, "ann", limit=5) == [("ne1", False), ("ne2", False), ("ne3", False)]
+        client.post("/namedentity/delete/", params={"namedentity_id": "ne2"})
+        assert suggestions(client, "ann") == [("ne1", False), ("ne3", False)]
+
+    # Rebuilt from the snapshot on the next start
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        assert suggestions(client, "ann") == [("ne1", False), ("ne3", False)]
+
+
+def test_similar_statements_are_ranked_scoped_and_backfilled(memory_store_env, tmp_path):
+    def similar(client, **params):
+        response = client.get("/statement/similar/", params=params)
+        assert response.status_code == 200
+        return [hit["statement"]["statement_id"] for hit in response.json()]
+
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        create_people(client, ("ne1", "Bob"), ("ne2", "Anna"))
+        client.post("/statement/create/", json={"text": "Married Anna in Venice", "statement_id": "s1", "about_namedentity_id": "ne1"})
+        client.post("/statement/create_batch/", json=[
+            {"statement": {"text": "Wants to get married in Venice", "statement_id": "s2", "about_namedentity_id": "ne2"}},
+            {"statement": {"text": "Runs a bakery downtown", "statement_id": "s3", "about_namedentity_id": "ne1"}},
+        ])
+
+        assert similar(client, q="marriage in Venice", k=2) == ["s1", "s2"]
+        assert similar(client, q="married", about_namedentity_id="ne1") == ["s1", "s3"]
+        # A statement is not similar to itself
+        assert similar(client, statement_id="s1", k=1) == ["s2"]
+        client.post("/statement/update_text/", params={"statement_id": "s3", "new_text": "Married in Venice, too"})
+        assert similar(client, statement_id="s1", k=1) == ["s3"]
+
+        assert client.get("/statement/similar/", params={"q": "x", "statement_id": "s1"}).status_code == 400
+        assert client.get("/statement/similar/", params={"statement_id": "missing"}).status_code == 404
+        assert client.get("/statement/similar/", params={"q": "x", "about_namedentity_id": "missing"}).status_code == 404
+
+    # Statements without an embedding, like those of older snapshots, are embedded after startup
+    snapshot_path = tmp_path / "graph.json"
+    snapshot = json.loads(snapshot_path.read_text())
+    for statement in snapshot["statements"]:
+        statement.pop("embedding")
+    snapshot_path.write_text(json.dumps(snapshot))
+    with TestClient(app) as client:
+        wait_until_ready(client)
+        deadline = time.monotonic() + 5
+        while not similar(client, q="bakery"):
+            assert time.monotonic() < deadline, "Statements were not embedded"
+            time.sleep(0.01)
+        assert len(similar(client, q="married")) == 3
+
+
+def test_neighbourhood_expands_by_hops_within_fan_out(client):
+    def neighbourhood(**params):
+        response = client.get("/namedentity/neighbourhood/", params={"namedentity_id": "ne1", **params})
+        assert response.status_code == 200
+        return response.json()
+
+    create_people(client, ("ne1", "Bob"), ("ne2", "Anna"), ("ne3", "Carl"), ("ne4", "Dana"), ("ne5", "Eve"))
+    client.post("/topic/create/", json={"name": "Family", "topic_id": "t1"})
+    results = client.post("/statement/create_batch/", json=[
+        {"statement": {"text": "Married @Anna, @Carl was the best man", "statement_id": "s1", "about_namedentity_id": "ne1"}, "mentioned_namedentity_ids": ["ne2", "ne3"], "topic_id": "t1"},
+        {"statement": {"text": "Plays tennis with @Dana", "statement_id": "s2", "about_namedentity_id": "ne2"}, "mentioned_namedentity_ids": ["ne4"]},
+        {"statement": {"text": "Works for @Eve", "statement_id": "s3", "about_namedentity_id": "ne4"}, "mentioned_namedentity_ids": ["ne5"]},
+    ]).json()
+    for result in results:
+        assert wait_for_derivation(client, result["derivation_job_id"])["status"] == "done"
+
+    result = neighbourhood()
+    assert result["namedentity"]["name"] == "Bob"
+    [statement] = result["statements"]
+    assert statement["statement"]["statement_id"] == "s1" and statement["topic"]["topic_id"] == "t1"
+    assert [m["namedentity_id"] for m in statement["mentioned_namedentities"]] == ["ne2", "ne3"]
+    assert [(e["namedentity"]["namedentity_id"], e["hops"]) for e in result["connected_entities"]] == [("ne2", 1), ("ne3", 1)]
+    assert {(r["from_node"], r["to_node"]) for r in result["relationships"]} == {("ne1", "ne2"), ("ne1", "ne3"), ("ne2", "ne3")}
+    assert not result["truncated"]
+
+    result = neighbourhood(hops=3)
+    assert [(e["namedentity"]["namedentity_id"], e["hops"]) for e in result["connected_entities"]] == [("ne2", 1), ("ne3", 1), ("ne4", 2), ("ne5", 3)]
+    assert len(result["relationships"]) == 5
+
+    # Each hop adds at most fan_out entities, and says so
+    result = neighbourhood(hops=2, fan_out=1)
+    assert [e["namedentity"]["namedentity_id"] for e in result["connected_entities"]] == ["ne2", "ne3"]
+    assert result["truncated"]
+    assert neighbourhood(statement_limit=1)["truncated"] is False
+
+    assert client.get("/namedentity/neighbourhood/", params={"namedentity_id": "missing"}).status_code == 404
+    assert client.get("/namedentity/neighbourhood/", params={"namedentity_id": "ne1", "hops": 4}).status_code == 422
+
+
+def test_briefing_follows_statement_changes(client):
+    def briefing(namedentity_id="ne1"):
+        response = client.get("/namedentity/briefing/", params={"namedentity_id": namedentity_id})
+        assert response.status_code == 200
+        return response.json()
+
+    create_people(client, ("ne1", "Bob"), ("ne2", "Anna"), ("ne3", "Carl"))
+    client.post("/topic/create/", json={"name": "Family", "topic_id": "t1"})
+    assert briefing()["statement_count"] == 0 and briefing()["updated_at"] is None
+
+    client.post("/statement/create_batch/", json=[
+        {"statement": {"text": "Married @Anna", "statement_id": "s1", "about_namedentity_id": "ne1"}, "mentioned_namedentity_ids": ["ne2"], "topic_id": "t1"},
+        {"statement": {"text": "Went sailing with @Anna and @Carl", "statement_id": "s2", "about_namedentity_id": "ne1"}, "mentioned_namedentity_ids": ["ne2", "ne3"]},
+    ])
+    client.post("/statement/create/", json={"text": "Likes jazz", "statement_id": "s3", "about_namedentity_id": "ne1"})
+    result = briefing()
+    assert result["statement_count"] == 3
+    assert [statement["statement_id"] for statement in result["latest_statements"]] == ["s3", "s2", "s1"]
+    assert [(m["namedentity_id"], m["name"], m["statement_count"]) for m in result["top_mentioned"]] == [("ne2", "Anna", 2), ("ne3", "Carl", 1)]
+    assert [(t["name"], t["statement_count"]) for t in result["topics"]] == [("Family", 1)]
+
+    client.post("/statement/update_text/", params={"statement_id": "s3", "new_text": "Loves jazz"})
+    client.post("/statement/set_topic/", params={"statement_id": "s2", "topic_id": "t1"})
+    client.post("/statement/update_mentions/", params={"statement_id": "s2", "mentioned_namedentity_ids": ["ne3"]})
+    client.post("/statement/delete/", params={"statement_id": "s1"})
+    result = briefing()
+    assert result["statement_count"] == 2
+    assert [statement["text"] for statement in result["latest_statements"]] == ["Loves jazz", "Went sailing with @Anna and @Carl"]
+    assert [(m["namedentity_id"], m["statement_count"]) for m in result["top_mentioned"]] == [("ne3", 1)]
+    assert [(t["topic_id"], t["statement_count"]) for t in result["topics"]] == [("t1", 1)]
+
+    # Deleting a mentioned entity or a topic takes it out of the briefing
+    client.post("/namedentity/delete/", params={"namedentity_id": "ne3"})
+    client.post("/topic/delete/", params={"topic_id": "t1"})
+    result = briefing()
+    assert result["top_mentioned"] == [] and result["topics"] == []
+    assert client.get("/namedentity/briefing/", params={"namedentity_id": "missing"}).status_code == 404
+
+
+def test_import_merges_batches_and_resumes(client):
+    records = [
+        {"kind": "namedentity", "namedentity_id": "ne1", "name": "Bob", "additional_labels": ["Person"]},
+        {"kind": "namedentity", "namedentity_id": "ne2", "name": "Anna"},
+        {"kind": "topic", "topic_id": "t1", "name": "Family"},
+        {"kind": "statement", "statement_id": "s1", "text": "Married @Anna", "about_namedentity_id": "ne1", "mentioned_namedentity_ids": ["ne2", "ne_missing"], "topic_id": "t1"},
+        {"kind": "statement", "statement_id": "s2", "text": "Orphan", "about_namedentity_id": "ne_missing"},
+        {"kind": "mention", "statement_id": "s1", "namedentity_id": "ne1"},
+    ]
+    body = "\n".join(json.dumps(record) for record in records[:3]) + "\n{not json\n\n" + "\n".join(json.dumps(record) for record in records[3:])
+
+    response = client.post("/general/import", params={"batch_size": 2}, content=body)
+    assert response.status_code == 200
+    result = response.json()
+    assert {key: result[key] for key in ("lines", "namedentities", "topics", "statements", "mentions", "skipped_statements", "invalid", "checkpoint")} == {
+        "lines": 8, "namedentities": 2, "topics": 1, "statements": 1, "mentions": 2, "skipped_statements": 1, "invalid": 1, "checkpoint": 8,
+    }
+    assert result["errors"][0].startswith("line 4:")
+    assert result["errors"][1] == "statement s2: NamedEntity that the statement is about does not exist"
+    assert client.get("/namedentity/read/", params={"namedentity_id": "ne1"}).json()["additional_labels"] == ["Person"]
+    assert [m["namedentity_id"] for m in client.post("/statement/get_mentions/", params={"statement_id": "s1"}).json()] == ["ne1", "ne2"]
+    assert client.get("/namedentity/briefing/", params={"namedentity_id": "ne1"}).json()["statement_count"] == 1
+    assert client.get("/namedentity/autocomplete/", params={"q": "ann"}).json()[0]["namedentity_id"] == "ne2"
+
+    # Importing again (here: the part after line 3) merges instead of duplicating
+    response = client.post("/general/import", params={"resume_from": 3}, content=body.replace("Married @Anna", "Married @Anna in May"))
+    assert response.json()["lines"] == 8 and response.json()["namedentities"] == 0 and response.json()["statements"] == 1
+    assert client.get("/statement/read/", params={"statement_id": "s1"}).json()["text"] == "Married @Anna in May"
+    assert client.get("/general/describe_graph").json()["labels"] == {"NamedEntity": 2, "Person": 1, "Statement": 1, "Topic": 1}
+
+
+def test_export_streams_records_that_import_again(client):
+    records = [
+        {"kind": "namedentity", "namedentity_id": "ne1", "name": "Bob", "additional_labels": ["Person"]},
+        {"kind": "namedentity", "namedentity_id": "ne2", "name": "Anna"},
+        {"kind": "namedentity", "namedentity_id": "ne3", "name": "Carl"},
+        {"kind": "topic", "topic_id": "t1", "name": "Family"},
+        {"kind": "statement", "statement_id": "s1", "text": "Married @Anna", "about_namedentity_id": "ne1", "topic_id": "t1"},
+        {"kind": "statement", "statement_id": "s2", "text": "Works with Bob", "about_namedentity_id": "ne3"},
+    ]
+    client.post("/general/import", content="\n".join(json.dumps(record) for record in records))
+    response = client.post("/statement/add_mentions/", params={"statement_id": "s1", "mentioned_namedentity_ids": ["ne2"]})
+    wait_for_derivation(client, response.json()["derivation_job_id"])
+
+    response = client.get("/general/export", params={"compression": "gzip"})
+    assert response.status_code == 200 and response.headers["content-encoding"] == "gzip"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["kind"] for record in exported] == ["namedentity"] * 3 + ["topic"] + ["statement"] * 2 + ["relationship"]
+    assert exported[4] == {**records[4], "mentioned_namedentity_ids": ["ne2"]}
+    # Derived relationships exist in both directions and are exported once
+    assert (exported[-1]["from_node"], exported[-1]["to_node"], exported[-1]["source_statement_id"]) == ("ne1", "ne2", "s1")
+
+    subgraph = [json.loads(line) for line in client.get("/general/export", params={"namedentity_id": "ne1"}).text.splitlines()]
+    key = {"namedentity": "namedentity_id", "topic": "topic_id", "statement": "statement_id", "relationship": "to_node"}
+    assert [(record["kind"], record[key[record["kind"]]]) for record in subgraph] == [
+        ("namedentity", "ne1"), ("namedentity", "ne2"), ("topic", "t1"), ("statement", "s1"), ("relationship", "ne2"),
+    ]
+    assert client.get("/general/export", params={"namedentity_id": "ne_missing"}).status_code == 404
+
+    # The relationship records are skipped, everything else merges into the existing records
+    result = client.post("/general/import", content=response.text).json()
+    assert (result["lines"], result["invalid"], result["namedentities"], result["statements"]) == (7, 0, 3, 2)
+    assert client.get("/general/describe_graph").json()["labels"] == {"NamedEntity": 3, "Person": 1, "Statement": 2, "Topic": 1}
+
+
+def test_request_durations_are_labelled_with_the_route_template(client):
+    def count(route, status):
+        labels = {"method": "GET", "route": route, "status": status}
+        return REGISTRY.get_sample_value("listen_http_request_duration_seconds_count", labels) or 0
+
+    before = count("/namedentity/read/", "404"), count("unmatched", "404")
+    client.get("/namedentity/read/", params={"namedentity_id": "ne1"})
+    client.get("/namedentity/read/", params={"namedentity_id": "ne2"})
+    client.get("/no/such/path")
+    assert (count("/namedentity/read/", "404"), count("unmatched", "404")) == (before[0] + 2, before[1] + 1)
+    assert REGISTRY.get_sample_value("listen_http_requests_in_flight") == 0
+
+
+def test_health_and_readiness(client):
+    assert client.get("/health").json() == {"status": "ok"}
+    assert client.get("/ready").json() == {"ready": True, "checks": {"startup": "ok", "database": "ok"}}
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import math
+from types import SimpleNamespace
+from prometheus_client import REGISTRY
+from app.utils import neo4j as neo4j_utils
+from app.utils.neo4j import observe_connection_pool, timed
+
+
+class FakeResult:
+    def __init__(self, records, available_after, consumed_after):
+        self.records = records
+        self.summary = SimpleNamespace(result_available_after=available_after, result_consumed_after=consumed_after)
+        self.consumed = False
+
+    async def single(self):
+        return self.records[0] if self.records else None
+
+    async def consume(self):
+        self.consumed = True
+        return self.summary
+
+    async def __aiter__(self):
+        for record in self.records:
+            yield record
+
+
+class FakeTransaction:
+    def __init__(self):
+        self.results = []
+
+    async def run(self, query, parameters=None, **kwargs):
+        result = FakeResult([{"n": 1}, {"n": 2}], available_after=3, consumed_after=7)
+        self.results.append(result)
+        return result
+
+
+async def count_twice(tx):
+    first = await (await tx.run("RETURN 1 AS n")).single()
+    second = [record async for record in await tx.run("UNWIND [1, 2] AS n RETURN n")]
+    # Left unread; timed once the function returns
+    await tx.run("RETURN 3 AS n")
+    return first, second
+
+
+def sample(query, phase):
+    return REGISTRY.get_sample_value("listen_neo4j_query_duration_seconds_count", {"query": query, "phase": phase})
+
+
+def test_queries_are_timed_under_the_name_of_their_repository_function():
+    tx = FakeTransaction()
+    first, second = asyncio.run(timed(count_twice)(tx))
+    assert first == {"n": 1} and len(second) == 2
+    assert all(result.consumed for result in tx.results)
+    for query in ("metrics_test.count_twice", "metrics_test.count_twice#2", "metrics_test.count_twice#3"):
+        assert sample(query, "round_trip") == 1
+        assert sample(query, "available_after") == 1
+    assert REGISTRY.get_sample_value(
+        "listen_neo4j_query_duration_seconds_sum", {"query": "metrics_test.count_twice", "phase": "consumed_after"}
+    ) == 0.007
+
+
+def test_pool_gauges_read_the_driver_pool_and_report_nan_if_it_changes(monkeypatch, caplog):
+    connections = [SimpleNamespace(in_use=True), SimpleNamespace(in_use=False), SimpleNamespace(in_use=False)]
+    pool = SimpleNamespace(connections={"neo4j:7687": connections}, pool_config=SimpleNamespace(max_connection_pool_size=100))
+    observe_connection_pool(SimpleNamespace(_pool=pool))
+    assert REGISTRY.get_sample_value("listen_neo4j_pool_connections", {"state": "idle"}) == 2
+    assert REGISTRY.get_sample_value("listen_neo4j_pool_max_connections") == 100
+
+    monkeypatch.setattr(neo4j_utils, "_pool_warning_logged", False)
+    # A driver version without the private pool attribute
+    observe_connection_pool(SimpleNamespace())
+    with caplog.at_level(logging.WARNING, logger="app.utils.neo4j"):
+        assert math.isnan(REGISTRY.get_sample_value("listen_neo4j_pool_connections", {"state": "in_use"}))
+        assert math.isnan(REGISTRY.get_sample_value("listen_neo4j_pool_max_connections"))
+    assert len(caplog.records) == 1
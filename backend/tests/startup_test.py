@@ -0,0 +1,59 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.main import app
+from app.storage.memory_store import MemoryStore
+from app.utils.startup import Startup, retry_with_backoff
+
+
+class FlakyStore(MemoryStore):
+    """Fails to open until the given attempt, like Neo4j while its container starts."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    async def open(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("Neo4j is not available yet")
+
+
+def test_startup_retries_opening_the_store_and_reports_progress():
+    store = FlakyStore(failures=3)
+    released = asyncio.Event()
+
+    async def run():
+        startup = Startup(store, [
+            ("store", lambda: retry_with_backoff(store.open, "Opening the graph store", initial_delay=0.001)),
+            ("briefings", released.wait),
+        ])
+        startup.start()
+        while startup.current_step != "briefings":
+            await asyncio.sleep(0.001)
+        waiting = await startup.check()
+        released.set()
+        await startup._task
+        return waiting, await startup.check()
+
+    waiting, ready = asyncio.run(run())
+    assert store.attempts == 4
+    assert waiting.model_dump() == {"ready": False, "checks": {"startup": "running: briefings"}}
+    assert ready.model_dump() == {"ready": True, "checks": {"startup": "ok", "database": "ok"}}
+
+
+def test_requests_are_turned_away_until_the_startup_is_complete(monkeypatch):
+    async def fail():
+        raise RuntimeError("no snapshot")
+
+    startup = Startup(MemoryStore(), [("backup", fail)])
+    asyncio.run(startup.run())
+    # Without entering the client, the lifespan does not run and the startup above stays in place
+    monkeypatch.setattr(app.state, "startup", startup, raising=False)
+    client = TestClient(app)
+    response = client.get("/topic/list_all_topics/")
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+    assert client.get("/health").status_code == 200
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json() == {"ready": False, "checks": {"startup": "failed in backup: no snapshot"}}
@@ -0,0 +1,50 @@
+import asyncio
+from prometheus_client import REGISTRY
+from app.models import GraphStatistics
+from app.repository.general import describe_graph
+from app.utils.statistics import GraphStatisticsCache
+
+
+class CountingStore:
+    def __init__(self):
+        self.calls = 0
+        self.labels = {"NamedEntity": 2, "Person": 1}
+
+    async def describe_graph(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return GraphStatistics(nodes=2, statements=0, relationships=0, labels=dict(self.labels))
+
+
+def test_concurrent_requests_share_one_refresh_within_the_ttl():
+    store = CountingStore()
+    statistics = GraphStatisticsCache(store, ttl=60)
+
+    async def run():
+        results = await asyncio.gather(*(statistics.get() for _ in range(10)))
+        await statistics.get()
+        return results
+
+    results = asyncio.run(run())
+    assert store.calls == 1 and all(result.nodes == 2 for result in results)
+    assert REGISTRY.get_sample_value("listen_graph_nodes_by_label", {"label": "Person"}) == 1
+
+    # Labels without nodes left disappear from the gauges on the next refresh
+    store.labels.pop("Person")
+    asyncio.run(statistics.refresh())
+    assert store.calls == 2
+    assert REGISTRY.get_sample_value("listen_graph_nodes_by_label", {"label": "Person"}) is None
+    assert REGISTRY.get_sample_value("listen_graph_nodes") == 2
+
+
+class MetaStatsTransaction:
+    async def run(self, query):
+        return self
+
+    async def single(self):
+        return {"nodeCount": 4, "relCount": 1, "labels": {"NamedEntity": 3, "SchemaVersion": 1, "Place": 0}, "relTypesCount": {"MENTIONS": 1}}
+
+
+def test_describe_graph_leaves_out_the_schema_version_node():
+    statistics = asyncio.run(describe_graph(MetaStatsTransaction()))
+    assert statistics.nodes == 3 and statistics.labels == {"NamedEntity": 3}
@@ -0,0 +1,34 @@
+import numpy as np
+from app.utils.vector_index import VectorIndex
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_top_k_scoped_and_after_removal():
+    index = VectorIndex(capacity=2)
+    index.add("a", unit(1, 0, 0))
+    index.add("b", unit(1, 1, 0))
+    index.add("c", unit(0, 1, 0))
+    index.add("d", unit(0, 0, 1))
+    assert len(index) == 4
+
+    assert [key for key, _ in index.search(unit(1, 0.1, 0), 2)] == ["a", "b"]
+    assert index.search(unit(1, 0, 0), 1)[0][1] == 1.0
+    # Scoped to keys, closer vectors outside of them are ignored
+    assert [key for key, _ in index.search(unit(1, 0.5, 0.2), 5, keys=["c", "d", "missing"])] == ["c", "d"]
+
+    # The last row moves into the gap; its key must still resolve to its own vector
+    index.remove("a")
+    assert "a" not in index and index.get("d") == unit(0, 0, 1)
+    assert [key for key, _ in index.search(unit(0, 0, 1), 1)] == ["d"]
+
+
+def test_vectors_of_another_size_replace_the_index():
+    index = VectorIndex()
+    index.add("a", unit(1, 0))
+    index.add("b", unit(1, 0, 0))
+    assert index.dimensions == 3 and "a" not in index
+    assert index.search(unit(1, 0), 1) == []